@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Activity Watermark - 最終作業日時（休暇判定用）と休暇の手動設定の管理
+
+Usage:
+    python activity_watermark.py [status|vacation on|off|auto [YYYY-MM-DD]]
+"""
+
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Union
+
+from database import run_write
+
+# 最後の作業からこの日数が経つと休暇中とみなす
+VACATION_DAYS = 3
+
+LAST_ACTIVITY_KEY = 'last_activity_at'
+VACATION_OVERRIDE_KEY = 'vacation_override'
+VACATION_OVERRIDE_UNTIL_KEY = 'vacation_override_until'
+
+
+def to_utc(value: Union[datetime, str]) -> datetime:
+    """
+    日時を UTC の offset-aware な datetime に揃える
+
+    Args:
+        value: datetime または ISO 8601 文字列（タイムゾーンなしはローカル時刻とみなす）
+
+    Returns:
+        UTC の datetime
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return value.astimezone(timezone.utc)
+
+
+class ActivityWatermark:
+    """
+    最終作業日時を取り込み・タイマー操作のたびに進めて保持するクラス
+
+    値はメモリと app_metadata テーブルに持ち、休暇判定で履歴を集計しない。
+    休暇中かどうかは手動設定（期限付き可）があればそちらを優先する
+    """
+
+    def __init__(self, db_connection: sqlite3.Connection):
+        """
+        Args:
+            db_connection: SQLite データベース接続
+        """
+        self.db = db_connection
+        self.last_activity_at: Optional[datetime] = None
+        self.vacation_override: Optional[bool] = None
+        self.vacation_override_until: Optional[datetime] = None
+        self._loaded = False
+
+    def reload(self):
+        """
+        app_metadata から読み込み直す（別プロセスでの取り込み・手動設定を反映）
+
+        最終作業日時が未保存の場合は集計テーブルから1度だけ求めて保存する
+        （保存は他の書き込みと同じく書き込み専用スレッド経由で行う）
+        """
+        values = {row[0]: row[1] for row in self.db.execute(
+            "SELECT key, value FROM app_metadata"
+        )}
+        self._loaded = True
+
+        override = values.get(VACATION_OVERRIDE_KEY)
+        self.vacation_override = None if override is None else override == '1'
+        until = values.get(VACATION_OVERRIDE_UNTIL_KEY)
+        self.vacation_override_until = to_utc(until) if until else None
+
+        last_activity = values.get(LAST_ACTIVITY_KEY)
+        if last_activity is not None:
+            self.last_activity_at = to_utc(last_activity)
+            return
+
+        self.last_activity_at = None
+        row = self.db.execute("SELECT MAX(last_start) FROM work_daily_rollup").fetchone()
+        if row[0]:
+            run_write(self.db, self.touch, row[0])
+
+    def _ensure_loaded(self):
+        """初回アクセス時に読み込む（内部メソッド）"""
+        if not self._loaded:
+            self.reload()
+
+    def _set(self, key: str, value: Optional[str]):
+        """app_metadata の値を保存・削除（内部メソッド、コミットは呼び出し側）"""
+        if value is None:
+            self.db.execute("DELETE FROM app_metadata WHERE key = ?", (key,))
+            return
+        self.db.execute("""
+            INSERT INTO app_metadata (key, value, updated_at)
+            VALUES (?, ?, datetime('now'))
+            ON CONFLICT(key) DO UPDATE SET
+                value = excluded.value,
+                updated_at = excluded.updated_at
+        """, (key, value))
+
+    def touch(self, when: Union[datetime, str]) -> bool:
+        """
+        作業があった日時を記録（今より新しい場合だけ進める、コミットは呼び出し側）
+
+        Args:
+            when: 作業の開始・終了日時
+
+        Returns:
+            最終作業日時を進めた場合True
+        """
+        self._ensure_loaded()
+
+        when = to_utc(when)
+        if self.last_activity_at is not None and when <= self.last_activity_at:
+            return False
+
+        self.last_activity_at = when
+        self._set(LAST_ACTIVITY_KEY, when.isoformat())
+        return True
+
+    def set_vacation_override(self, on_vacation: Optional[bool],
+                              until: Optional[datetime] = None):
+        """
+        休暇中かどうかを手動で設定
+
+        Args:
+            on_vacation: True=休暇中, False=休暇中ではない, None=自動判定に戻す
+            until: 手動設定の期限（省略時は解除するまで有効）
+        """
+        self._ensure_loaded()
+        self.vacation_override = on_vacation
+        self.vacation_override_until = to_utc(until) if until and on_vacation is not None else None
+
+        def save():
+            self._set(VACATION_OVERRIDE_KEY,
+                      None if on_vacation is None else ('1' if on_vacation else '0'))
+            self._set(VACATION_OVERRIDE_UNTIL_KEY,
+                      self.vacation_override_until.isoformat()
+                      if self.vacation_override_until else None)
+
+        run_write(self.db, save)
+
+    def is_on_vacation(self, now: Optional[datetime] = None) -> bool:
+        """
+        休暇中かどうかを判定
+
+        手動設定が有効ならその値、それ以外は最後の作業から VACATION_DAYS 日以上経過したか
+
+        Args:
+            now: 判定する日時（省略時は現在時刻）
+
+        Returns:
+            休暇中と判定される場合True
+        """
+        self._ensure_loaded()
+        now = to_utc(now) if now else datetime.now(timezone.utc)
+
+        if self.vacation_override is not None:
+            until = self.vacation_override_until
+            if until is None or now < until:
+                return self.vacation_override
+
+        if self.last_activity_at is None:
+            return False
+        return now - self.last_activity_at >= timedelta(days=VACATION_DAYS)
+
+    def status(self) -> Dict:
+        """
+        状態を取得
+
+        Returns:
+            状態情報の辞書
+        """
+        self._ensure_loaded()
+        until = self.vacation_override_until
+        return {
+            'last_activity_at': self.last_activity_at.isoformat() if self.last_activity_at else None,
+            'vacation_override': self.vacation_override,
+            'vacation_override_until': until.isoformat() if until else None,
+            'on_vacation': self.is_on_vacation(),
+        }
+
+
+def main():
+    """エントリーポイント"""
+    from dotenv import load_dotenv
+    from main import init_database
+
+    load_dotenv()
+
+    db = init_database(os.getenv('DATABASE_PATH', 'timekeeper.db'))
+    watermark = ActivityWatermark(db)
+
+    args = sys.argv[1:] or ['status']
+    if args[0] == 'vacation' and len(args) in (2, 3) and args[1] in ('on', 'off', 'auto'):
+        on_vacation = {'on': True, 'off': False, 'auto': None}[args[1]]
+        until = datetime.fromisoformat(args[2]) if len(args) == 3 else None
+        watermark.set_vacation_override(on_vacation, until)
+    elif args[0] != 'status':
+        print("Usage: python activity_watermark.py [status|vacation on|off|auto [YYYY-MM-DD]]")
+        sys.exit(1)
+
+    for key, value in watermark.status().items():
+        print(f"{key:24} {value}")
+
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
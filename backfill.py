@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+History Backfill Tool
+Toggl のエクスポート（CSV / JSON）や Toggl API から、過去の作業履歴を
+work_history に一括で取り込みます
+
+Usage:
+    python backfill.py csv <ファイル>...
+    python backfill.py json <ファイル>...
+    python backfill.py api <開始日 YYYY-MM-DD> [終了日 YYYY-MM-DD]
+"""
+
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from main import TogglClient, init_database
+from pattern_learner import PatternLearner
+from retention import HistoryArchive
+
+# 1トランザクションで保存するエントリー数
+BATCH_SIZE = 1000
+
+# JSON ファイルを読み込む単位（バイト）
+READ_CHUNK_SIZE = 64 * 1024
+
+# Toggl API を1回に問い合わせる期間（日数）
+API_WINDOW_DAYS = 30
+
+
+def iter_json_entries(path: str) -> Iterator[dict]:
+    """
+    JSON 配列または JSON Lines のファイルから1エントリーずつ読み込む
+
+    ファイル全体を読み込まず、チャンク単位で1オブジェクトずつデコードする
+
+    Args:
+        path: エクスポートファイルのパス
+
+    Yields:
+        エントリーの辞書
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        buffer = ''
+        eof = False
+        while True:
+            # 配列の区切り文字と空白を読み飛ばす
+            stripped = buffer.lstrip(' \t\r\n[,]')
+            if not stripped and eof:
+                return
+            try:
+                if not stripped:
+                    raise ValueError("need more data")
+                obj, end = decoder.raw_decode(stripped)
+            except ValueError:
+                if eof:
+                    raise
+                chunk = f.read(READ_CHUNK_SIZE)
+                eof = not chunk
+                buffer = stripped + chunk
+                continue
+
+            buffer = stripped[end:]
+            # Reports API の形式: 1行に複数の time_entries がまとまっている
+            if isinstance(obj, dict) and isinstance(obj.get('time_entries'), list):
+                for entry in obj['time_entries']:
+                    yield {**obj, **entry, 'time_entries': None}
+            else:
+                yield obj
+
+
+def iter_csv_entries(path: str) -> Iterator[dict]:
+    """
+    Toggl の詳細レポート CSV から1エントリーずつ読み込む
+
+    Args:
+        path: エクスポートファイルのパス
+
+    Yields:
+        CSV の1行（列名をキーとした辞書）
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def parse_duration(value: str) -> int:
+    """'HH:MM:SS' 形式の作業時間を秒に変換"""
+    hours, minutes, seconds = (int(part) for part in value.split(':'))
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def synthetic_entry_id(*parts) -> int:
+    """
+    エントリーIDを持たないエクスポート用に、内容から決まるIDを作成
+
+    Toggl のIDと重ならないよう負の値にする
+    """
+    digest = hashlib.sha1('\x1f'.join(str(p) for p in parts).encode('utf-8')).digest()
+    return -(int.from_bytes(digest[:8], 'big') >> 1) - 1
+
+
+class HistoryBackfill:
+    """
+    エクスポートや API の時間エントリーを work_history にストリーミングで取り込むクラス
+
+    BATCH_SIZE 件ごとにコミットし、同じトランザクションで取り込み位置を
+    backfill_checkpoints に記録する。中断しても次回は続きから再開できる
+    """
+
+    def __init__(self, db: sqlite3.Connection, learner: PatternLearner,
+                 toggl_client: Optional[TogglClient] = None, batch_size: int = BATCH_SIZE,
+                 archive: Optional[HistoryArchive] = None):
+        """
+        Args:
+            db: SQLite データベース接続
+            learner: 保存処理（祝日判定・集計テーブルの更新）に使う PatternLearner
+            toggl_client: Toggl API クライアント（API からの取り込み・プロジェクト名の解決用）
+            batch_size: 1トランザクションで保存するエントリー数
+            archive: アーカイブ済みのエントリーを重複として扱うための HistoryArchive（省略可）
+        """
+        self.db = db
+        self.db.row_factory = sqlite3.Row
+        self.learner = learner
+        self.toggl = toggl_client
+        self.batch_size = batch_size
+        # アーカイブ済みのエントリーは集計テーブルに残っているため取り込み直さない
+        self.archive = archive
+
+        self._project_ids: Optional[Dict[str, str]] = None
+        self._project_names: Optional[Dict[str, str]] = None
+        self.stats = {'stored': 0, 'duplicates': 0, 'skipped': 0}
+
+    def _load_projects(self):
+        """プロジェクト名 ⇔ プロジェクトID の対応表を作成（内部メソッド）"""
+        names = {}
+
+        # 取り込み済みの履歴
+        for row in self.db.execute("""
+            SELECT project_id, MAX(project_name) as project_name
+            FROM work_daily_rollup
+            GROUP BY project_id
+        """):
+            names[row['project_id']] = row['project_name']
+
+        # カードに登録したプロジェクト
+        mapping_file = os.getenv('CARD_MAPPING_FILE', 'card_mapping.json')
+        if os.path.exists(mapping_file):
+            try:
+                with open(mapping_file, 'r', encoding='utf-8') as f:
+                    for info in json.load(f).values():
+                        if isinstance(info, dict) and info.get('project_id'):
+                            names[str(info['project_id'])] = info.get('project_name')
+            except Exception as e:
+                print(f"Warning: Failed to load {mapping_file}: {e}")
+
+        # Toggl のプロジェクト一覧（アーカイブ済みを含む）
+        if self.toggl:
+            for project in self.toggl.get_projects():
+                names[str(project['id'])] = project.get('name')
+
+        self._project_names = {pid: name for pid, name in names.items() if name}
+        self._project_ids = {name: pid for pid, name in self._project_names.items()}
+
+    def project_id_for(self, project_name: str) -> Optional[str]:
+        """プロジェクト名からプロジェクトIDを取得"""
+        if self._project_ids is None:
+            self._load_projects()
+        return self._project_ids.get(project_name)
+
+    def project_name_for(self, project_id: str) -> Optional[str]:
+        """プロジェクトIDからプロジェクト名を取得"""
+        if self._project_names is None:
+            self._load_projects()
+        return self._project_names.get(str(project_id))
+
+    def normalize_csv_row(self, row: dict) -> Optional[Tuple[dict, Optional[str]]]:
+        """
+        詳細レポート CSV の1行を Toggl API の時間エントリー形式に変換
+
+        Args:
+            row: CSV の1行
+
+        Returns:
+            (時間エントリー, プロジェクト名)、プロジェクトが特定できない場合は None
+        """
+        project_name = row.get('Project') or ''
+        project_id = row.get('Project ID') or self.project_id_for(project_name)
+        if not project_id or not row.get('Start date'):
+            return None
+
+        # CSV の日時はタイムゾーンなしのローカル時刻
+        start = datetime.fromisoformat(f"{row['Start date']} {row['Start time']}").astimezone()
+        stop = datetime.fromisoformat(f"{row['End date']} {row['End time']}").astimezone()
+        duration = parse_duration(row['Duration']) if row.get('Duration') \
+            else int((stop - start).total_seconds())
+
+        entry_id = row.get('Id') or row.get('ID') or row.get('Time entry ID')
+        entry = {
+            'id': int(entry_id) if entry_id else synthetic_entry_id(
+                project_id, start.isoformat(), stop.isoformat(), row.get('Description', '')
+            ),
+            'project_id': project_id,
+            'description': row.get('Description', ''),
+            'start': start.astimezone(timezone.utc).isoformat(),
+            'stop': stop.astimezone(timezone.utc).isoformat(),
+            'duration': duration,
+        }
+        return entry, project_name or None
+
+    def normalize_json_entry(self, obj: dict) -> Optional[Tuple[dict, Optional[str]]]:
+        """
+        JSON エクスポートの1エントリーを Toggl API の時間エントリー形式に変換
+
+        Toggl API v9 の時間エントリーと Reports API の行の両方に対応する
+
+        Args:
+            obj: JSON の1エントリー
+
+        Returns:
+            (時間エントリー, プロジェクト名)、プロジェクトが特定できない場合は None
+        """
+        project_name = obj.get('project_name') or obj.get('project')
+        project_id = obj.get('project_id') or obj.get('pid')
+        if not project_id and project_name:
+            project_id = self.project_id_for(project_name)
+        if not project_id or not obj.get('start'):
+            return None
+
+        if obj.get('duration') is not None:
+            duration = obj['duration']
+        elif obj.get('seconds') is not None:
+            duration = obj['seconds']
+        else:
+            duration = (obj.get('dur') or 0) // 1000  # Reports API v2 はミリ秒
+        if duration < 0:
+            return None  # 実行中のタイマー
+
+        stop = obj.get('stop') or obj.get('end')
+        entry = {
+            'id': obj.get('id') or synthetic_entry_id(
+                project_id, obj['start'], stop, obj.get('description', '')
+            ),
+            'project_id': project_id,
+            'description': obj.get('description', ''),
+            'start': obj['start'],
+            'stop': stop,
+            'duration': duration,
+        }
+        return entry, project_name or self.project_name_for(project_id)
+
+    def _get_checkpoint(self, source: str) -> Optional[str]:
+        """取り込み位置を取得（内部メソッド）"""
+        row = self.db.execute("""
+            SELECT position FROM backfill_checkpoints WHERE source = ?
+        """, (source,)).fetchone()
+        return row['position'] if row else None
+
+    def _save_checkpoint(self, source: str, position: str, entries: int):
+        """取り込み位置を記録（内部メソッド、コミットは呼び出し側）"""
+        self.db.execute("""
+            INSERT INTO backfill_checkpoints (source, position, entries, updated_at)
+            VALUES (?, ?, ?, datetime('now'))
+            ON CONFLICT(source) DO UPDATE SET
+                position = excluded.position,
+                entries = backfill_checkpoints.entries + excluded.entries,
+                updated_at = excluded.updated_at
+        """, (source, position, entries))
+
+    def _store_batch(self, batch: List[Optional[Tuple[dict, Optional[str]]]]):
+        """
+        1バッチ分のエントリーを保存して件数を数える（内部メソッド、コミットは呼び出し側）
+
+        アーカイブ済みのエントリーIDはバッチごとに archived_entries と照合する
+        """
+        archived = set()
+        if self.archive:
+            archived = self.archive.archived_entry_ids(
+                normalized[0].get('id') for normalized in batch if normalized is not None
+            )
+
+        for normalized in batch:
+            if normalized is None:
+                self.stats['skipped'] += 1
+                continue
+            entry, project_name = normalized
+            if entry.get('id') in archived:
+                self.stats['duplicates'] += 1
+            elif self.learner.store_entry(entry, project_name):
+                self.stats['stored'] += 1
+            else:
+                self.stats['duplicates'] += 1
+
+    def import_records(self, source: str, records: Iterable, normalize) -> int:
+        """
+        ファイルのレコードを順に取り込む（前回の続きから再開）
+
+        Args:
+            source: チェックポイントのキー（ファイルの絶対パスなど）
+            records: レコードのイテレーター
+            normalize: レコードを (時間エントリー, プロジェクト名) に変換する関数
+
+        Returns:
+            今回処理したレコード数
+        """
+        done = int(self._get_checkpoint(source) or 0)
+        if done:
+            print(f"  Resuming after record {done:,}")
+
+        processed = 0
+        batch = []
+        for index, record in enumerate(records):
+            if index < done:
+                continue
+            batch.append(normalize(record))
+            processed += 1
+
+            if len(batch) >= self.batch_size:
+                self._store_batch(batch)
+                self._save_checkpoint(source, str(index + 1), len(batch))
+                self.db.commit()
+                batch = []
+
+        if batch:
+            self._store_batch(batch)
+            self._save_checkpoint(source, str(done + processed), len(batch))
+        self.db.commit()
+        return processed
+
+    def import_file(self, path: str, file_format: str) -> int:
+        """
+        エクスポートファイルを取り込む
+
+        Args:
+            path: ファイルのパス
+            file_format: 'csv' または 'json'
+
+        Returns:
+            今回処理したレコード数
+        """
+        source = f"{file_format}:{os.path.abspath(path)}"
+        if file_format == 'csv':
+            return self.import_records(source, iter_csv_entries(path), self.normalize_csv_row)
+        return self.import_records(source, iter_json_entries(path), self.normalize_json_entry)
+
+    def import_api(self, start_date: datetime, end_date: datetime) -> int:
+        """
+        Toggl API から期間を区切って取り込む（前回の続きから再開）
+
+        Args:
+            start_date: 開始日時（UTC）
+            end_date: 終了日時（UTC）
+
+        Returns:
+            今回処理したエントリー数
+        """
+        source = f"api:{start_date.date().isoformat()}"
+        checkpoint = self._get_checkpoint(source)
+        window_start = datetime.fromisoformat(checkpoint) if checkpoint else start_date
+        if checkpoint:
+            print(f"  Resuming from {window_start.date()}")
+
+        processed = 0
+        while window_start < end_date:
+            window_end = min(window_start + timedelta(days=API_WINDOW_DAYS), end_date)
+            entries = self.toggl.get_time_entries(window_start, window_end, raise_errors=True)
+
+            batch = []
+            for entry in entries:
+                if entry.get('duration', 0) < 0:
+                    continue  # 実行中のタイマー
+                project_id = entry.get('project_id')
+                batch.append((entry, self.project_name_for(project_id)) if project_id else None)
+            self._store_batch(batch)
+            processed += len(entries)
+
+            # 1期間を1トランザクションで保存し、次の期間の開始日時を記録
+            self._save_checkpoint(source, window_end.isoformat(), len(entries))
+            self.db.commit()
+            print(f"  {window_start.date()} - {window_end.date()}: {len(entries)} entries")
+            window_start = window_end
+
+        return processed
+
+
+def main():
+    """エントリーポイント"""
+    load_dotenv()
+
+    usage = "Usage: python backfill.py csv|json <file>... | api <start YYYY-MM-DD> [end YYYY-MM-DD]"
+    if len(sys.argv) < 3 or sys.argv[1] not in ('csv', 'json', 'api'):
+        print(usage)
+        sys.exit(1)
+
+    command = sys.argv[1]
+
+    print("=" * 60)
+    print("Timekeeper Emo-chan History Backfill")
+    print("=" * 60)
+
+    db = init_database(os.getenv('DATABASE_PATH', 'timekeeper.db'))
+    toggl = None
+    if os.getenv('TOGGL_API_TOKEN'):
+        toggl = TogglClient(
+            api_token=os.getenv('TOGGL_API_TOKEN', ''),
+            workspace_id=os.getenv('TOGGL_WORKSPACE_ID', '')
+        )
+    elif command == 'api':
+        print("[ERROR] TOGGL_API_TOKEN is not set")
+        sys.exit(1)
+
+    learner = PatternLearner(db, toggl)
+    archive = HistoryArchive(db, archive_dir=os.getenv('ARCHIVE_DIR', 'archive'))
+    backfill = HistoryBackfill(db, learner, toggl, archive=archive)
+
+    try:
+        if command == 'api':
+            start = datetime.fromisoformat(sys.argv[2]).replace(tzinfo=timezone.utc)
+            end = datetime.fromisoformat(sys.argv[3]).replace(tzinfo=timezone.utc) \
+                if len(sys.argv) > 3 else datetime.now(timezone.utc)
+            print(f"\nImporting from Toggl API ({start.date()} - {end.date()})...")
+            backfill.import_api(start, end)
+        else:
+            for path in sys.argv[2:]:
+                print(f"\nImporting {path}...")
+                count = backfill.import_file(path, command)
+                print(f"  [OK] Processed {count:,} records")
+    except KeyboardInterrupt:
+        db.rollback()  # 最後のチェックポイントまでの取り込みは保存済み
+        print("\nInterrupted. Run the same command again to resume.")
+        sys.exit(1)
+
+    stats = backfill.stats
+    print(f"\n[OK] Stored {stats['stored']:,} entries "
+          f"({stats['duplicates']:,} duplicates, {stats['skipped']:,} without project)")
+
+    if stats['stored']:
+        print("\nRe-learning work patterns...")
+        learner.learn_project_patterns()
+
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Learning Pipeline Benchmark
+プロジェクトごとにクエリを発行する従来の学習処理（N+1）と、
+集合演算による学習処理の速度・保存結果を比較します
+
+Usage:
+    python benchmark_learning_pipeline.py [プロジェクト数] [1プロジェクトあたりのエントリー数]
+"""
+
+import json
+import sys
+import time
+
+from benchmark_pattern_learning import create_synthetic_db, timed
+from local_time import UTC_ISO_FORMAT, local_date_days_ago
+from pattern_engine import mean_hour_average
+from pattern_learner import PatternLearner
+
+
+def legacy_learn(learner: PatternLearner):
+    """従来の学習処理（日タイプごとの集計 + プロジェクトごとの MAX / INSERT）"""
+    db = learner.db
+    # 学習期間はアプリと同じくローカル日付で区切る
+    since = local_date_days_ago(learner.learning_period_days)
+    day_data = []
+    for is_weekend in (0, 1):
+        rows = db.execute("""
+            SELECT
+                project_id,
+                project_name,
+                hour_of_day,
+                COUNT(*) as frequency,
+                SUM(duration_minutes) as duration_sum,
+                COUNT(duration_minutes) as duration_n
+            FROM work_history
+            WHERE (is_weekend = 1 OR is_holiday = 1) = ?
+                AND local_date >= ?
+            GROUP BY project_id, hour_of_day
+        """, (is_weekend, since)).fetchall()
+
+        project_data = {}
+        for row in rows:
+            stats = project_data.setdefault(row['project_id'], {
+                'name': row['project_name'], 'hours': {}, 'duration_sum': {}, 'duration_n': {}
+            })
+            hour = row['hour_of_day']
+            stats['hours'][hour] = row['frequency']
+            stats['duration_sum'][hour] = row['duration_sum'] or 0
+            stats['duration_n'][hour] = row['duration_n']
+
+        results = {}
+        for pid, stats in project_data.items():
+            total_entries = sum(stats['hours'].values())
+            if total_entries < 3:
+                continue
+            threshold = total_entries / len(stats['hours']) * learner.pattern_threshold
+            results[pid] = {
+                'name': stats['name'],
+                'typical_hours': sorted(h for h, f in stats['hours'].items() if f >= threshold),
+                'avg_duration': mean_hour_average(
+                    (stats['duration_sum'][hour], n) for hour, n in stats['duration_n'].items()
+                )
+            }
+        day_data.append(results)
+
+    weekday_data, weekend_data = day_data
+    for pid in set(weekday_data) | set(weekend_data):
+        last_worked = db.execute(f"""
+            SELECT strftime('{UTC_ISO_FORMAT}', MAX(start_epoch), 'unixepoch') as last_time
+            FROM work_history
+            WHERE project_id = ?
+        """, (pid,)).fetchone()
+
+        weekday = weekday_data.get(pid, {})
+        weekend = weekend_data.get(pid, {})
+        db.execute("""
+            INSERT OR REPLACE INTO project_patterns
+            (project_id, project_name, weekday_typical_hours, weekend_typical_hours,
+             weekday_avg_duration_minutes, weekend_avg_duration_minutes,
+             last_worked_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        """, (
+            pid,
+            weekday.get('name') or weekend.get('name', 'Unknown'),
+            json.dumps(weekday.get('typical_hours', [])),
+            json.dumps(weekend.get('typical_hours', [])),
+            weekday.get('avg_duration', 0),
+            weekend.get('avg_duration', 0),
+            last_worked['last_time'] if last_worked else None
+        ))
+    db.commit()
+
+
+def set_based_learn(learner: PatternLearner):
+    """集合演算による学習処理（learn_project_patterns と同じ手順）"""
+    weekday_data, weekend_data = learner._learn_patterns_sql()
+    last_worked = learner._get_last_worked_at()
+    learner._save_project_patterns([
+        (pid, weekday_data.get(pid, {}), weekend_data.get(pid, {}), last_worked.get(pid), None)
+        for pid in set(weekday_data) | set(weekend_data)
+    ], time.time())
+    learner.db.commit()
+
+
+def snapshot(db) -> list:
+    """比較対象の project_patterns の内容を取得"""
+    return [tuple(row) for row in db.execute("""
+        SELECT project_id, project_name, weekday_typical_hours, weekend_typical_hours,
+               weekday_avg_duration_minutes, weekend_avg_duration_minutes, last_worked_at
+        FROM project_patterns
+        ORDER BY project_id
+    """)]
+
+
+def main():
+    n_projects = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    per_project = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+    print("=" * 60)
+    print("Learning Pipeline Benchmark")
+    print("=" * 60)
+
+    n_entries = n_projects * per_project
+    print(f"\n[1/3] Creating {n_entries:,} synthetic entries ({n_projects:,} projects)...")
+    started = time.perf_counter()
+    db = create_synthetic_db(n_entries, n_projects)
+    print(f"  [OK] Created in {time.perf_counter() - started:.1f}s")
+
+    learner = PatternLearner(db, None)
+
+    print("\n[2/3] Running legacy per-project pipeline...")
+    legacy_time, _ = timed(lambda: legacy_learn(learner))
+    legacy_rows = snapshot(db)
+    print(f"  [OK] {legacy_time * 1000:.1f} ms")
+
+    db.execute("DELETE FROM project_patterns")
+    db.commit()
+
+    print("\n[3/3] Running set-based pipeline...")
+    set_time, _ = timed(lambda: set_based_learn(learner))
+    set_rows = snapshot(db)
+    print(f"  [OK] {set_time * 1000:.1f} ms")
+
+    mismatches = sum(1 for a, b in zip(legacy_rows, set_rows) if a != b)
+    mismatches += abs(len(legacy_rows) - len(set_rows))
+
+    print("\n" + "=" * 60)
+    print(f"Legacy    : {legacy_time * 1000:10.1f} ms")
+    print(f"Set-based : {set_time * 1000:10.1f} ms  (x{legacy_time / set_time:.1f})")
+    print(f"Projects  : {len(set_rows):,}")
+    print("Results   : " + ("identical" if mismatches == 0 else f"{mismatches} mismatch(es)"))
+    print("=" * 60)
+
+    db.close()
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Pattern Learning Benchmark
+SQL/辞書によるパターン学習と NumPy エンジンの速度・結果を比較します
+
+Usage:
+    python benchmark_pattern_learning.py [エントリー数] [プロジェクト数]
+"""
+
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from daily_rollup import rebuild_rollup
+from local_time import epoch_to_local
+from migrations import apply_migrations
+from pattern_learner import PatternLearner
+from pattern_engine import NumpyPatternEngine, NUMPY_AVAILABLE
+
+
+# 合成履歴の期間（学習期間の14日より長くし、期間の境界をまたぐ日を含める）
+HISTORY_DAYS = 20
+
+
+def create_synthetic_db(n_entries: int, n_projects: int,
+                        days: int = HISTORY_DAYS) -> sqlite3.Connection:
+    """
+    合成 work_history を作成
+
+    Args:
+        n_entries: エントリー数
+        n_projects: プロジェクト数
+        days: 履歴の期間（日数）
+
+    Returns:
+        sqlite3.Connection（メモリ上のDB）
+    """
+    db = sqlite3.connect(':memory:')
+    apply_migrations(db)
+
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+
+    def rows():
+        for _ in range(n_entries):
+            project = rng.randrange(n_projects)
+            start = now - timedelta(minutes=rng.randrange(60, days * 24 * 60))
+            duration = rng.randrange(5, 180)
+            end = start + timedelta(minutes=duration)
+            local_start = epoch_to_local(start.timestamp())
+            weekend = local_start.weekday() >= 5
+            yield (
+                str(100000 + project),
+                f"Project {project}",
+                start.isoformat(),
+                end.isoformat(),
+                duration,
+                local_start.weekday(),
+                1 if weekend else 0,
+                1 if not weekend and local_start.toordinal() % 20 == 0 else 0,  # 祝日は日付単位
+                local_start.hour,
+                int(start.timestamp()),
+                int(end.timestamp()),
+                local_start.date().isoformat()
+            )
+
+    db.executemany("""
+        INSERT INTO work_history
+        (project_id, project_name, start_time, end_time,
+         duration_minutes, day_of_week, is_weekend, is_holiday, hour_of_day,
+         start_epoch, end_epoch, local_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows())
+    rebuild_rollup(db)
+    db.commit()
+    return db
+
+
+def timed(func, repeat: int = 3):
+    """最速の実行時間と結果を返す"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    n_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_projects = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    print("=" * 60)
+    print("Pattern Learning Benchmark")
+    print("=" * 60)
+
+    if not NUMPY_AVAILABLE:
+        print("\n[ERROR] numpy is not installed")
+        print("Install it with: pip install numpy")
+        sys.exit(1)
+
+    print(f"\n[1/3] Creating {n_entries:,} synthetic entries ({n_projects} projects)...")
+    started = time.perf_counter()
+    db = create_synthetic_db(n_entries, n_projects)
+    print(f"  [OK] Created in {time.perf_counter() - started:.1f}s")
+
+    learner = PatternLearner(db, None)
+    engine = NumpyPatternEngine(learner.pattern_threshold)
+
+    print("\n[2/3] Running SQL path...")
+    sql_time, sql_result = timed(learner._learn_patterns_sql)
+    print(f"  [OK] {sql_time * 1000:.1f} ms")
+
+    print("\n[3/3] Running NumPy engine...")
+    np_time, np_result = timed(lambda: engine.learn(db, learner.learning_period_days))
+    print(f"  [OK] {np_time * 1000:.1f} ms")
+
+    # 結果の比較（プロジェクト名は GROUP BY の代表行に依存するため除外）
+    mismatches = 0
+    for label, sql_data, np_data in zip(('weekday', 'weekend'), sql_result, np_result):
+        if set(sql_data) != set(np_data):
+            print(f"  [ERROR] {label}: project sets differ")
+            mismatches += 1
+            continue
+        for pid, expected in sql_data.items():
+            actual = np_data[pid]
+            if expected['typical_hours'] != actual['typical_hours'] or \
+               expected['avg_duration'] != actual['avg_duration']:
+                print(f"  [ERROR] {label}: project {pid} differs")
+                mismatches += 1
+
+    print("\n" + "=" * 60)
+    print(f"SQL      : {sql_time * 1000:10.1f} ms")
+    print(f"NumPy    : {np_time * 1000:10.1f} ms  (x{sql_time / np_time:.1f})")
+    print("Results  : " + ("identical" if mismatches == 0 else f"{mismatches} mismatch(es)"))
+    print("=" * 60)
+
+    db.close()
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Storage Profile Benchmark
+ストレージプロファイル（database.py の STORAGE_PROFILES）ごとに、
+書き込み専用スレッド経由の書き込みの遅延と、ストレージへの書き込み量を計測します
+
+書き込み量は /proc/self/io の write_bytes（ページキャッシュからストレージに送られるバイト数）で、
+Linux 以外では表示しません。SD カードの値を見るには、SD カード上のディレクトリで実行してください
+（tmpfs 上では常に 0 になります）
+
+Usage:
+    python benchmark_storage_profiles.py [--dir DIR] [--profiles NAME ...] [--writes N]
+                                         [--threads N] [--interval SECONDS] [--seed-entries N]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from database import (
+    Database, STORAGE_PROFILES, WRITER_BATCH_SIZE, WRITER_GROUP_WINDOW, transaction
+)
+from local_time import epoch_to_local
+from migrations import apply_migrations
+from pattern_learner import PatternLearner
+
+
+def read_io_counters() -> Optional[Dict[str, int]]:
+    """
+    このプロセスの I/O カウンター（/proc/self/io）
+
+    Returns:
+        {'wchar': ..., 'write_bytes': ..., ...}（読めない場合は None）
+    """
+    try:
+        with open('/proc/self/io', 'r') as f:
+            return {
+                key: int(value)
+                for key, value in (line.split(':', 1) for line in f if ':' in line)
+            }
+    except OSError:
+        return None
+
+
+def storage_written(before: Optional[Dict[str, int]], after: Optional[Dict[str, int]]) -> Optional[int]:
+    """2つの I/O カウンターの間にストレージへ書いたバイト数（削除・切り詰めで取り消された分を除く）"""
+    if before is None or after is None:
+        return None
+    return ((after['write_bytes'] - before['write_bytes'])
+            - (after['cancelled_write_bytes'] - before['cancelled_write_bytes']))
+
+
+def toggl_entry(entry_id: int, project: int, start: datetime, minutes: int) -> dict:
+    """Toggl API 形式の停止済み時間エントリー"""
+    return {
+        'id': entry_id,
+        'project_id': 100000 + project,
+        'description': f"Project {project}",
+        'start': start.isoformat().replace('+00:00', 'Z'),
+        'stop': (start + timedelta(minutes=minutes)).isoformat().replace('+00:00', 'Z'),
+        'duration': minutes * 60,
+    }
+
+
+def seed_history(db: Database, n_entries: int, n_projects: int = 20):
+    """計測前の work_history（過去180日分）と集計テーブルを作成"""
+    from daily_rollup import rebuild_rollup
+
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+
+    def rows():
+        for entry_id in range(1, n_entries + 1):
+            project = rng.randrange(n_projects)
+            start = now - timedelta(minutes=rng.randrange(60, 180 * 24 * 60))
+            minutes = rng.randrange(5, 180)
+            end = start + timedelta(minutes=minutes)
+            local_start = epoch_to_local(start.timestamp())
+            yield (
+                str(100000 + project), f"Project {project}",
+                start.isoformat(), end.isoformat(), minutes,
+                local_start.weekday(), 1 if local_start.weekday() >= 5 else 0, 0,
+                local_start.hour, entry_id, int(start.timestamp()), int(end.timestamp()),
+                local_start.date().isoformat()
+            )
+
+    with transaction(db):
+        db.executemany("""
+            INSERT INTO work_history
+            (project_id, project_name, start_time, end_time, duration_minutes,
+             day_of_week, is_weekend, is_holiday, hour_of_day,
+             toggl_entry_id, start_epoch, end_epoch, local_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows())
+        rebuild_rollup(db)
+
+
+def run_profile(profile: str, directory: str, args) -> Dict:
+    """
+    1つのプロファイルで新しいDBを作り、書き込みを計測
+
+    Args:
+        profile: STORAGE_PROFILES のプロファイル名
+        directory: DBファイルを作るディレクトリ
+        args: コマンドライン引数
+
+    Returns:
+        計測結果
+    """
+    path = os.path.join(directory, f"storage-bench-{profile}.db")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    db = Database(path, storage_profile=profile)
+    apply_migrations(db)
+    if args.seed_entries:
+        seed_history(db, args.seed_entries)
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    learner = PatternLearner(db, None)
+    db.start_writer(batch_size=args.batch_size, group_window=args.group_window)
+
+    latencies: List[float] = []
+    latencies_lock = threading.Lock()
+    now = datetime.now(timezone.utc)
+
+    def insert_notification(category: str, project_id: str):
+        db.execute("""
+            INSERT INTO notification_history (category, project_id, message, notified_at)
+            VALUES (?, ?, ?, datetime('now'))
+        """, (category, project_id, 'benchmark'))
+
+    def worker(index: int):
+        rng = random.Random(index)
+        local = []
+        for i in range(index, args.writes, args.threads):
+            started = time.perf_counter()
+            # タイマー停止（履歴・集計・パターンの更新）と通知の記録を 1:4 で混ぜる
+            if i % 5 == 0:
+                start = now - timedelta(minutes=rng.randrange(60, 7 * 24 * 60))
+                learner.record_time_entry(toggl_entry(
+                    args.seed_entries + i + 1, rng.randrange(20), start, rng.randrange(5, 180)
+                ))
+            else:
+                db.write(insert_notification, 'sabori', str(100000 + rng.randrange(20)))
+            local.append((time.perf_counter() - started) * 1000)
+            if args.interval:
+                time.sleep(args.interval)
+        with latencies_lock:
+            latencies.extend(local)
+
+    io_before = read_io_counters()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # close() で書き込み専用スレッドの残りのコミットと最後のチェックポイントまで行う
+    db.close()
+    elapsed = time.perf_counter() - started
+    written = storage_written(io_before, read_io_counters())
+
+    latencies.sort()
+    result = {
+        'profile': profile,
+        'writes': len(latencies),
+        'elapsed': elapsed,
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0],
+        'max': latencies[-1],
+        'written': written,
+        'db_size': os.path.getsize(path),
+    }
+
+    if not args.keep:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    return result
+
+
+def format_bytes(value: Optional[int]) -> str:
+    """バイト数を KiB / MiB で表示（計測できない場合は n/a）"""
+    if value is None:
+        return 'n/a'
+    if value >= 1024 * 1024:
+        return f"{value / 1024 / 1024:.1f} MiB"
+    return f"{value / 1024:.1f} KiB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Storage profile benchmark')
+    parser.add_argument('--dir', default='.', help='directory for the benchmark databases')
+    parser.add_argument('--profiles', nargs='+', default=list(STORAGE_PROFILES),
+                        choices=list(STORAGE_PROFILES), help='profiles to measure')
+    parser.add_argument('--writes', type=int, default=500, help='write commands per profile')
+    parser.add_argument('--threads', type=int, default=1, help='threads issuing writes')
+    parser.add_argument('--interval', type=float, default=0.0,
+                        help='seconds each thread sleeps between writes')
+    parser.add_argument('--seed-entries', type=int, default=20_000,
+                        help='work_history rows created before measuring')
+    parser.add_argument('--batch-size', type=int, default=WRITER_BATCH_SIZE,
+                        help='writer thread batch size')
+    parser.add_argument('--group-window', type=float, default=WRITER_GROUP_WINDOW,
+                        help='writer thread group commit window in seconds')
+    parser.add_argument('--keep', action='store_true', help='keep the benchmark databases')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Storage Profile Benchmark")
+    print("=" * 60)
+    print(f"Directory : {os.path.abspath(args.dir)}")
+    print(f"Workload  : {args.writes} writes, {args.threads} thread(s), "
+          f"interval {args.interval}s, {args.seed_entries:,} seeded entries")
+    if read_io_counters() is None:
+        print("[WARN] /proc/self/io is not available; storage write volume is not measured")
+
+    results = []
+    for index, profile in enumerate(args.profiles, 1):
+        settings = ', '.join(f"{key}={value}" for key, value in STORAGE_PROFILES[profile].items())
+        print(f"\n[{index}/{len(args.profiles)}] {profile}: {settings}")
+        result = run_profile(profile, args.dir, args)
+        results.append(result)
+        print(f"  [OK] {result['writes']} writes in {result['elapsed']:.2f}s")
+
+    print("\n" + "=" * 60)
+    print(f"{'profile':<16}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'writes/s':>10}"
+          f"{'written':>12}{'per write':>12}")
+    for result in results:
+        written = result['written']
+        per_write = written // result['writes'] if written is not None else None
+        print(f"{result['profile']:<16}{result['p50']:9.2f}{result['p95']:9.2f}{result['max']:9.2f}"
+              f"{result['writes'] / result['elapsed']:10.0f}"
+              f"{format_bytes(written):>12}{format_bytes(per_write):>12}")
+    print("=" * 60)
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Check Cadence - 学習パターンと API 呼び出し上限に応じたチェック間隔の決定
+"""
+
+import math
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict
+
+from notification_timeline import NotificationTimeline
+
+
+class CheckCadence:
+    """
+    次の定期チェックの時刻を決めるクラス
+
+    - 作業開始が想定される時刻の前後は短い間隔（dense）
+    - 作業が想定される時間帯・作業中は通常の間隔（base）
+    - それ以外の時間帯・休暇中は長い間隔（sparse）
+    - いずれの場合も1日の Toggl API 呼び出し回数（タップ・履歴の取得を含む）の上限を超えないよう、
+      当日の残り時間を sparse 間隔で見られるだけの回数は残しておく
+    """
+
+    def __init__(self, base_interval: int = 3600, dense_interval: int = 300,
+                 sparse_interval: int = 3 * 3600, daily_budget: int = 96,
+                 lead_minutes: int = 15, follow_minutes: int = 30):
+        """
+        Args:
+            base_interval: 通常のチェック間隔（秒）
+            dense_interval: 作業開始前後のチェック間隔（秒）
+            sparse_interval: 作業が想定されない時間帯のチェック間隔（秒）
+            daily_budget: 1日（ローカル時刻）の Toggl API 呼び出し回数の上限
+            lead_minutes: 作業開始の何分前から dense にするか
+            follow_minutes: 作業開始から何分後まで dense にするか
+        """
+        self.base_interval = base_interval
+        self.dense_interval = dense_interval
+        self.sparse_interval = sparse_interval
+        self.daily_budget = daily_budget
+        self.lead = timedelta(minutes=lead_minutes)
+        self.follow = timedelta(minutes=follow_minutes)
+
+        self._calls_date = None
+        self._calls_today = 0
+        self._calls_lock = threading.Lock()
+        # 作業開始の想定時刻から検知（通知）までの秒数（直近100件）
+        self._latencies = deque(maxlen=100)
+
+    def record_call(self, now: datetime):
+        """Toggl API を1回呼び出したことを記録（スケジューラー以外のスレッドからも呼ばれる）"""
+        with self._calls_lock:
+            if self._calls_date != now.date():
+                self._calls_date = now.date()
+                self._calls_today = 0
+            self._calls_today += 1
+
+    def calls_today(self, now: datetime) -> int:
+        """今日の Toggl API 呼び出し回数"""
+        return self._calls_today if self._calls_date == now.date() else 0
+
+    def record_latency(self, seconds: float):
+        """作業開始の想定時刻から検知までの秒数を記録"""
+        self._latencies.append(max(seconds, 0.0))
+
+    def next_check(self, now: datetime, timeline: NotificationTimeline,
+                   timer_running: bool, on_vacation: bool) -> datetime:
+        """
+        次のチェック時刻を計算
+
+        Args:
+            now: 現在時刻（ローカル、タイムラインの範囲内）
+            timeline: 現在のタイムライン
+            timer_running: 直前のチェックでタイマーが動いていたか
+            on_vacation: 休暇中か
+
+        Returns:
+            次のチェック時刻
+        """
+        slot = timeline.slot_at(now)
+        expected = slot['expected']
+
+        if on_vacation:
+            interval = self.sparse_interval
+        elif expected and now < slot['expected_since'] + self.follow:
+            interval = self.dense_interval
+        elif expected or timer_running:
+            interval = self.base_interval
+        else:
+            interval = self.sparse_interval
+        next_run = now + timedelta(seconds=interval)
+
+        if not on_vacation:
+            # 次の作業開始の少し前に起きる
+            upcoming = timeline.next_expected_start(now)
+            if upcoming is not None and upcoming - self.lead > now:
+                next_run = min(next_run, upcoming - self.lead)
+
+            # 通知区分が変わるスロットの境界にも起きる
+            change = timeline.next_change(now)
+            if change is not None:
+                next_run = min(next_run, change)
+
+        return self._apply_budget(now, next_run)
+
+    def _apply_budget(self, now: datetime, next_run: datetime) -> datetime:
+        """
+        呼び出し回数の上限に合わせて次のチェック時刻を遅らせる（内部メソッド）
+
+        next_run 以降も当日の残り時間を sparse 間隔で見られるだけの回数が残るなら
+        そのまま、足りなければ残りの回数を当日の残り時間に均等に割り振る
+        """
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        remaining = self.daily_budget - self.calls_today(now)
+        if remaining <= 0:
+            return max(next_run, midnight)  # 今日の上限に達したら日付が変わるまで待つ
+
+        reserve = math.ceil(max((midnight - next_run).total_seconds(), 0) / self.sparse_interval)
+        if remaining - 1 >= reserve:
+            return next_run
+        return max(next_run, now + (midnight - now) / remaining)
+
+    def stats(self, now: datetime) -> Dict:
+        """
+        API 呼び出し回数と検知までの時間を並べて取得
+
+        Returns:
+            状態情報の辞書
+        """
+        latencies = list(self._latencies)
+        return {
+            'toggl_calls_today': self.calls_today(now),
+            'toggl_daily_budget': self.daily_budget,
+            'missed_start_latency_avg_seconds':
+                round(sum(latencies) / len(latencies)) if latencies else None,
+            'missed_start_latency_max_seconds': round(max(latencies)) if latencies else None,
+            'missed_start_samples': len(latencies),
+        }
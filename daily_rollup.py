@@ -0,0 +1,112 @@
+"""
+Daily Rollup - 作業履歴の「プロジェクト×ローカル日付×時間」集計テーブルの管理
+"""
+
+import sqlite3
+from datetime import datetime
+from typing import Optional
+
+from local_time import UTC_ISO_FORMAT, epoch_to_utc_iso
+
+
+def add_to_rollup(db: sqlite3.Connection, project_id: str, project_name: str,
+                  start: datetime, day_type: int, minutes: int, start_epoch: int):
+    """
+    1エントリーを work_daily_rollup に加算
+
+    Args:
+        db: SQLite データベース接続
+        project_id: プロジェクトID
+        project_name: プロジェクト名
+        start: エントリーの開始日時（ローカル時刻、work_history.local_date / hour_of_day と同じ）
+        day_type: 0=平日, 1=休日/祝日
+        minutes: 作業時間（分）
+        start_epoch: エントリーの開始日時（UNIX秒）
+    """
+    db.execute("""
+        INSERT INTO work_daily_rollup
+        (project_id, date, hour, day_type, project_name, minutes, entries, last_start)
+        VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+        ON CONFLICT(project_id, date, hour) DO UPDATE SET
+            project_name = excluded.project_name,
+            minutes = minutes + excluded.minutes,
+            entries = entries + 1,
+            last_start = MAX(last_start, excluded.last_start)
+    """, (
+        project_id,
+        start.date().isoformat(),
+        start.hour,
+        day_type,
+        project_name,
+        minutes,
+        epoch_to_utc_iso(start_epoch)
+    ))
+
+
+def rebuild_rollup(db: sqlite3.Connection, since_date: Optional[str] = None) -> int:
+    """
+    work_history から work_daily_rollup を作り直す
+
+    Args:
+        db: SQLite データベース接続
+        since_date: このローカル日付（YYYY-MM-DD）以降だけを作り直す（省略時は全期間）
+
+    Returns:
+        作成した集計行の数
+    """
+    where = "WHERE local_date >= ?" if since_date else ""
+    params = (since_date,) if since_date else ()
+
+    if since_date:
+        db.execute("DELETE FROM work_daily_rollup WHERE date >= ?", params)
+    else:
+        db.execute("DELETE FROM work_daily_rollup")
+
+    cursor = db.execute(f"""
+        INSERT INTO work_daily_rollup
+        (project_id, date, hour, day_type, project_name, minutes, entries, last_start)
+        SELECT
+            project_id,
+            local_date,
+            hour_of_day,
+            MAX(is_weekend = 1 OR is_holiday = 1),
+            MAX(project_name),
+            COALESCE(SUM(duration_minutes), 0),
+            COUNT(*),
+            strftime('{UTC_ISO_FORMAT}', MAX(start_epoch), 'unixepoch')
+        FROM work_history
+        {where}
+        GROUP BY local_date, project_id, hour_of_day
+    """, params)
+    return cursor.rowcount
+
+
+def remove_from_rollup(db: sqlite3.Connection, project_id: str, local_date: str,
+                       hour: int, minutes: int):
+    """
+    削除した1エントリーを work_daily_rollup から差し引く
+
+    work_history の行を削除した後に呼び出す（last_start は残りの行から求め直す）
+
+    Args:
+        db: SQLite データベース接続
+        project_id: プロジェクトID
+        local_date: 削除した行の local_date（YYYY-MM-DD）
+        hour: 削除した行の hour_of_day
+        minutes: 削除した行の作業時間（分）
+    """
+    db.execute(f"""
+        UPDATE work_daily_rollup SET
+            minutes = minutes - ?,
+            entries = entries - 1,
+            last_start = (
+                SELECT strftime('{UTC_ISO_FORMAT}', MAX(start_epoch), 'unixepoch')
+                FROM work_history
+                WHERE project_id = ? AND local_date = ? AND hour_of_day = ?
+            )
+        WHERE project_id = ? AND date = ? AND hour = ?
+    """, (minutes or 0, project_id, local_date, hour, project_id, local_date, hour))
+    db.execute("""
+        DELETE FROM work_daily_rollup
+        WHERE project_id = ? AND date = ? AND hour = ? AND entries <= 0
+    """, (project_id, local_date, hour))
@@ -0,0 +1,553 @@
+"""
+Database - スレッドごとの SQLite 接続、書き込み専用スレッド（グループコミット）とトランザクションの管理
+"""
+
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+# 他の接続が書き込み中のときに待つ秒数
+DEFAULT_BUSY_TIMEOUT = 10.0
+
+# 1回のコミットにまとめる書き込みコマンドの最大数と、後続のコマンドを待つ秒数
+WRITER_BATCH_SIZE = 100
+WRITER_GROUP_WINDOW = 0.01
+
+# 書き込みコマンド1つ分のセーブポイント名
+_COMMAND_SAVEPOINT = 'write_command'
+
+# 終了を知らせるための番兵
+_STOP = object()
+
+# ストレージプロファイル: 接続ごとに設定する PRAGMA の組み合わせ（設定する順）
+# journal_mode はスレッドごとの読み込み接続が書き込みを待たないよう、すべて WAL にする
+STORAGE_PROFILES: Dict[str, Dict[str, object]] = {
+    # コミットごとに fsync する。停電でも直前のコミットまで残る
+    'sdcard-durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -4000,        # 約4MB（負の値は KiB 単位）
+        'mmap_size': 0,
+        'temp_store': 'MEMORY',     # 一時ファイルを SD カードに作らない
+        'wal_autocheckpoint': 1000,
+    },
+    # fsync はチェックポイント時だけ。停電時は最後の数コミットを失うことがあるがDBは壊れない。
+    # チェックポイントの間隔を広げ、同じページを何度も書き戻さないようにする
+    'sdcard-fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,       # 約16MB
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 10000,
+    },
+    # tmpfs などのメモリ上のファイル向け。fsync しない
+    'ramdisk': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -16000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 1000,
+    },
+}
+
+# 従来の設定（WAL + synchronous=NORMAL）と同じ耐久性のプロファイル
+DEFAULT_STORAGE_PROFILE = 'sdcard-fast'
+
+
+def resolve_storage_profile(name: Optional[str]) -> str:
+    """
+    ストレージプロファイル名を確認（未指定・不明な名前は既定のプロファイル）
+
+    Args:
+        name: プロファイル名（DATABASE_STORAGE_PROFILE など）
+
+    Returns:
+        STORAGE_PROFILES にあるプロファイル名
+    """
+    if not name:
+        return DEFAULT_STORAGE_PROFILE
+    if name not in STORAGE_PROFILES:
+        print(f"Warning: unknown storage profile '{name}'. "
+              f"Using '{DEFAULT_STORAGE_PROFILE}' ({', '.join(STORAGE_PROFILES)}).")
+        return DEFAULT_STORAGE_PROFILE
+    return name
+
+
+def apply_storage_profile(conn: sqlite3.Connection, profile: str = DEFAULT_STORAGE_PROFILE):
+    """
+    接続にストレージプロファイルの PRAGMA を設定
+
+    journal_mode はDBファイルに保存されるが、それ以外は接続ごとの設定のため
+    接続を開くたびに呼ぶ
+
+    Args:
+        conn: SQLite データベース接続（ファイルDB）
+        profile: STORAGE_PROFILES のプロファイル名
+    """
+    for pragma, value in STORAGE_PROFILES[profile].items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+
+
+@contextmanager
+def transaction(db, immediate: bool = True) -> Iterator:
+    """
+    ブロック内の処理を1つのトランザクションで実行し、例外時はロールバック
+
+    既にトランザクション中の場合は外側のトランザクションに含める。
+    sqlite3.Connection と Database のどちらでも使える
+
+    Args:
+        db: sqlite3.Connection または Database
+        immediate: True の場合は開始時に書き込みロックを取る（BEGIN IMMEDIATE）
+
+    Yields:
+        db
+    """
+    if db.in_transaction:
+        yield db
+        return
+
+    db.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    try:
+        yield db
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
+
+
+def run_write(db, func: Callable, *args):
+    """
+    書き込み処理を実行（Database なら書き込み専用スレッド経由、それ以外はトランザクション内で実行）
+
+    Args:
+        db: sqlite3.Connection または Database
+        func: 書き込み処理（db を使って INSERT などを行う関数）
+        *args: func に渡す引数
+
+    Returns:
+        func の戻り値
+    """
+    if isinstance(db, Database):
+        return db.write(func, *args)
+    with transaction(db):
+        return func(*args)
+
+
+def run_standalone(db, func: Callable, *args):
+    """
+    トランザクションの外で実行する処理（VACUUM など）を、他の書き込みと混ぜずに実行
+
+    Database なら書き込み専用スレッドでまとめ中のコマンドをコミットしてから単独で実行し、
+    それ以外は開いているトランザクションをコミットしてから実行する
+
+    Args:
+        db: sqlite3.Connection または Database
+        func: 実行する処理（コミットが必要な場合は func 内で行う）
+        *args: func に渡す引数
+
+    Returns:
+        func の戻り値
+    """
+    if isinstance(db, Database):
+        return db.write(func, *args, standalone=True)
+    if db.in_transaction:
+        db.commit()
+    return func(*args)
+
+
+class DatabaseWriter:
+    """
+    書き込み専用の接続を持つスレッド（シングルライター）
+
+    キューから受け取った書き込みコマンドを1つのトランザクションにまとめて実行し
+    （グループコミット）、コミット後に各コマンドの Future に結果を設定する。
+    コマンドごとにセーブポイントを置くため、失敗したコマンドだけが取り消される。
+    停止を始めた後のコマンドは受け付けず、受け付け済みのコマンドはすべて実行してから終了する。
+    単独のコマンド（standalone）は、それまでにまとめたコマンドをコミットしてから
+    トランザクションの外で実行する
+    """
+
+    def __init__(self, database: 'Database', batch_size: int = WRITER_BATCH_SIZE,
+                 group_window: float = WRITER_GROUP_WINDOW):
+        """
+        Args:
+            database: 書き込み先の Database
+            batch_size: 1回のコミットにまとめる最大コマンド数
+            group_window: 後続のコマンドを待つ秒数
+        """
+        self.database = database
+        self.batch_size = batch_size
+        self.group_window = group_window
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        # 停止の受付とコマンドの登録を順序付ける（停止後に登録されたコマンドを残さない）
+        self._submit_lock = threading.Lock()
+        self._stopping = False
+        # グループコミットのトランザクション中か（commit()/rollback() の扱いを切り替える）
+        self.in_batch = False
+
+    @property
+    def running(self) -> bool:
+        """実行中か"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def is_current_thread(self) -> bool:
+        """呼び出し元が書き込み専用スレッドか"""
+        return self._thread is threading.current_thread()
+
+    def start(self):
+        """書き込み専用スレッドを開始"""
+        if self.running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, func: Callable, args: tuple = (), standalone: bool = False) -> Future:
+        """
+        書き込みコマンドを登録
+
+        Args:
+            func: 書き込み処理
+            args: func に渡す引数
+            standalone: True ならトランザクションの外で単独で実行する（VACUUM など）
+
+        Returns:
+            コミット後に func の戻り値（または例外）が設定される Future
+
+        Raises:
+            RuntimeError: 停止中・停止後に呼び出した場合
+        """
+        future: Future = Future()
+        with self._submit_lock:
+            if self._stopping or not self.running:
+                raise RuntimeError("Database writer is stopped")
+            self._queue.put((future, func, args, standalone))
+        return future
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        登録済みのコマンドを書き込んでから停止
+
+        Args:
+            timeout: 書き込みの完了を待つ秒数（None なら終わるまで待つ）
+
+        Returns:
+            スレッドが終了した場合True
+        """
+        with self._submit_lock:
+            if self._stopping or not self.running:
+                return not self.running
+            self._stopping = True
+            # 以降の submit() は拒否されるため、_STOP より後ろにコマンドは入らない
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+        return not self.running
+
+    def _run(self):
+        """書き込みループ（書き込み専用スレッド）"""
+        stopping = False
+        while not stopping:
+            command = self._queue.get()
+            if command is _STOP:
+                break
+
+            # 続けて届いたコマンドを1回のコミットにまとめる（単独のコマンドが来たらそこまで）
+            batch = [command]
+            while len(batch) < self.batch_size and not command[3]:
+                try:
+                    command = self._queue.get(timeout=self.group_window)
+                except queue.Empty:
+                    break
+                if command is _STOP:
+                    stopping = True
+                    break
+                batch.append(command)
+
+            self._execute_commands(batch)
+
+        # 念のため、キューに残ったコマンドも実行して Future を完了させる
+        leftover = []
+        while True:
+            try:
+                command = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if command is not _STOP:
+                leftover.append(command)
+        self._execute_commands(leftover)
+
+    def _execute_commands(self, commands: List[tuple]):
+        """単独のコマンドの前後で区切り、残りをまとめて実行（内部メソッド）"""
+        batch = []
+        for command in commands:
+            if command[3]:
+                self._execute_batch(batch)
+                batch = []
+                self._execute_standalone(command)
+            else:
+                batch.append(command)
+        self._execute_batch(batch)
+
+    def _execute_standalone(self, command: tuple):
+        """単独のコマンドをトランザクションの外で実行（内部メソッド）"""
+        future, func, args, _ = command
+        if not future.set_running_or_notify_cancel():
+            return
+        conn = self.database.connection
+        try:
+            result = func(*args)
+            if conn.in_transaction:
+                conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            future.set_exception(e)
+            return
+        future.set_result(result)
+
+    def _execute_batch(self, batch: List[tuple]):
+        """コマンドをまとめて実行してコミット（内部メソッド）"""
+        if not batch:
+            return
+        conn = self.database.connection
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            self.in_batch = True
+            for future, func, args, _ in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute(f'SAVEPOINT {_COMMAND_SAVEPOINT}')
+                try:
+                    result = func(*args)
+                except Exception as e:
+                    conn.execute(f'ROLLBACK TO SAVEPOINT {_COMMAND_SAVEPOINT}')
+                    conn.execute(f'RELEASE SAVEPOINT {_COMMAND_SAVEPOINT}')
+                    results.append((future, None, e))
+                    continue
+                conn.execute(f'RELEASE SAVEPOINT {_COMMAND_SAVEPOINT}')
+                results.append((future, result, None))
+            self.in_batch = False
+            conn.commit()
+        except Exception as e:
+            # 開始・コミットに失敗した場合はまとめたコマンドをすべて失敗にする
+            self.in_batch = False
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"Error committing database writes: {e}")
+            for future, _, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class Database:
+    """
+    スレッドごとに SQLite 接続を払い出すクラス
+
+    sqlite3.Connection と同じメソッド（execute, commit など）を持ち、
+    呼び出したスレッドの接続に委譲する。接続は WAL モードで開くため、
+    別スレッドの書き込み（パターンの再学習など）中でも読み込みは待たされない。
+    ':memory:' の場合は別接続では同じDBを共有できないため、1つの接続を共有する。
+    この接続はロックで保護しないため、':memory:' はテストなど1スレッドからの利用に限り、
+    書き込み専用スレッドも使わない（start_writer() は何もしない）
+    """
+
+    def __init__(self, path: str, busy_timeout: float = DEFAULT_BUSY_TIMEOUT,
+                 storage_profile: Optional[str] = None):
+        """
+        Args:
+            path: SQLite データベースファイルのパス
+            busy_timeout: 他の接続が書き込み中のときに待つ秒数
+            storage_profile: STORAGE_PROFILES のプロファイル名（省略時は DEFAULT_STORAGE_PROFILE）
+        """
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.storage_profile = resolve_storage_profile(storage_profile)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self._row_factory = sqlite3.Row
+        self._shared: Optional[sqlite3.Connection] = None
+        if path == ':memory:':
+            self._shared = self._open()
+        self._writer: Optional[DatabaseWriter] = None
+
+    def _open(self) -> sqlite3.Connection:
+        """接続を開いて設定する（内部メソッド）"""
+        # 終了時に別スレッドから close() するため check_same_thread は無効にする
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.row_factory = self._row_factory
+        if self.path != ':memory:':
+            apply_storage_profile(conn, self.storage_profile)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """呼び出したスレッドの接続（初回は新しく開く）"""
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
+
+    @property
+    def row_factory(self):
+        """行の形式（既定は sqlite3.Row）"""
+        return self._row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        with self._lock:
+            self._row_factory = factory
+            for conn in self._connections:
+                conn.row_factory = factory
+
+    @property
+    def in_transaction(self) -> bool:
+        """呼び出したスレッドの接続がトランザクション中か"""
+        return self.connection.in_transaction
+
+    @property
+    def total_changes(self) -> int:
+        """呼び出したスレッドの接続で変更した行数の合計"""
+        return self.connection.total_changes
+
+    def execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        return self.connection.execute(sql, parameters)
+
+    def executemany(self, sql: str, parameters) -> sqlite3.Cursor:
+        return self.connection.executemany(sql, parameters)
+
+    def executescript(self, script: str) -> sqlite3.Cursor:
+        return self.connection.executescript(script)
+
+    def cursor(self) -> sqlite3.Cursor:
+        return self.connection.cursor()
+
+    def commit(self):
+        # 書き込み専用スレッドのコマンド内ではグループコミットに任せる
+        if self._in_writer_batch():
+            return
+        self.connection.commit()
+
+    def rollback(self):
+        # 書き込み専用スレッドのコマンド内ではそのコマンドの変更だけを取り消す
+        if self._in_writer_batch():
+            self.connection.execute(f'ROLLBACK TO SAVEPOINT {_COMMAND_SAVEPOINT}')
+            return
+        self.connection.rollback()
+
+    def _in_writer_batch(self) -> bool:
+        """書き込み専用スレッドのグループコミット中のコマンドから呼ばれたか（内部メソッド）"""
+        writer = self._writer
+        return writer is not None and writer.is_current_thread() and writer.in_batch
+
+    def start_writer(self, batch_size: int = WRITER_BATCH_SIZE,
+                     group_window: float = WRITER_GROUP_WINDOW):
+        """
+        書き込み専用スレッドを開始（以降 write() はこのスレッドでまとめてコミットする）
+
+        Args:
+            batch_size: 1回のコミットにまとめる最大コマンド数
+            group_window: 後続のコマンドを待つ秒数
+        """
+        if self._shared is not None:
+            return  # ':memory:' の共有接続を別スレッドから使わない
+        if self._writer is None:
+            self._writer = DatabaseWriter(self, batch_size, group_window)
+        self._writer.start()
+
+    def stop_writer(self):
+        """登録済みの書き込みをすべて終え、書き込み専用スレッドが終了するまで待って停止"""
+        if self._writer is not None:
+            self._writer.stop()
+            self._writer = None
+
+    @property
+    def writer_running(self) -> bool:
+        """書き込み専用スレッドが動いているか"""
+        return self._writer is not None and self._writer.running
+
+    def write(self, func: Callable, *args, wait: bool = True, standalone: bool = False):
+        """
+        書き込み処理を実行
+
+        書き込み専用スレッドが動いていればそこへ送り、他のコマンドとまとめてコミットする。
+        func 内の self.execute() などは書き込み専用の接続で実行され、
+        commit() はグループコミットまで遅らせる。
+        動いていない・停止中の場合（CLI、終了処理中など）や書き込み専用スレッド内から
+        呼んだ場合は、呼び出し元のスレッドでトランザクション内で実行する
+
+        Args:
+            func: 書き込み処理
+            *args: func に渡す引数
+            wait: True ならコミットまで待って戻り値を返す、False なら Future を返す
+            standalone: True ならトランザクションを開始せず、他の書き込みと混ぜずに実行する
+                （VACUUM などトランザクション内で実行できない処理。コミットは func 内で行う）
+
+        Returns:
+            func の戻り値（wait=False の場合は Future）
+        """
+        writer = self._writer
+        if writer is not None and writer.running and not writer.is_current_thread():
+            try:
+                future = writer.submit(func, args, standalone)
+            except RuntimeError:
+                future = None  # 停止中: 呼び出し元のスレッドで実行する
+            if future is not None:
+                return future.result() if wait else future
+
+        future = Future()
+        try:
+            if standalone:
+                if self.in_transaction:
+                    self.connection.commit()
+                future.set_result(func(*args))
+            else:
+                with transaction(self):
+                    future.set_result(func(*args))
+        except Exception as e:
+            if not wait:
+                future.set_exception(e)
+                return future
+            raise
+        return future.result() if wait else future
+
+    def transaction(self, immediate: bool = True):
+        """
+        呼び出したスレッドの接続でトランザクションを実行（transaction() を参照）
+
+        Args:
+            immediate: True の場合は開始時に書き込みロックを取る
+        """
+        return transaction(self, immediate)
+
+    def close(self):
+        """書き込み専用スレッドが終了してから、すべてのスレッドの接続を閉じる"""
+        self.stop_writer()
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Error closing database connection: {e}")
+        self._local = threading.local()
+        self._shared = None
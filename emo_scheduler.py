@@ -2,15 +2,19 @@
 Emo Scheduler - 定期的な作業状況チェックと通知モジュール
 """
 
-import json
+import os
 import sqlite3
-import threading
 import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 
 from pattern_learner import PatternLearner
 from message_generator import MessageGenerator
+from job_scheduler import Job, JobScheduler
+from check_cadence import CheckCadence
+from notification_timeline import NotificationTimeline
+from retention import HistoryArchive
+from toggl_webhook import TimerState
 
 
 class EmoScheduler:
@@ -18,7 +22,9 @@ class EmoScheduler:
 
     def __init__(self, db_connection: sqlite3.Connection,
                  emo_client, toggl_client, pattern_learner: PatternLearner,
-                 message_generator: MessageGenerator):
+                 message_generator: MessageGenerator,
+                 history_archive: Optional[HistoryArchive] = None,
+                 timer_state: Optional[TimerState] = None):
         """
         Args:
             db_connection: SQLite データベース接続
@@ -26,27 +32,57 @@ class EmoScheduler:
             toggl_client: Toggl Track API クライアント
             pattern_learner: PatternLearner インスタンス
             message_generator: MessageGenerator インスタンス
+            history_archive: 古い履歴をアーカイブする HistoryArchive（省略可）
+            timer_state: webhook で更新するタイマー状態（省略時は毎回ポーリング）
         """
         self.db = db_connection
         self.db.row_factory = sqlite3.Row
         self.emo = emo_client
         self.toggl = toggl_client
         self.learner = pattern_learner
+        self.activity = pattern_learner.activity
         self.msg_gen = message_generator
+        self.archive = history_archive
+        self.timer_state = timer_state
 
         # 設定
-        self.check_interval = 3600  # 1時間 = 3600秒
+        # チェック間隔（15分スロットに合わせる場合は 900）
+        self.check_interval = int(os.getenv('CHECK_INTERVAL_SECONDS', '3600'))
+        # 作業開始の前後・作業のない時間帯のチェック間隔と、1日の Toggl API 呼び出し上限
+        self.cadence = CheckCadence(
+            base_interval=self.check_interval,
+            dense_interval=int(os.getenv('CHECK_DENSE_INTERVAL_SECONDS', '300')),
+            sparse_interval=int(os.getenv('CHECK_SPARSE_INTERVAL_SECONDS', '10800')),
+            daily_budget=int(os.getenv('TOGGL_API_DAILY_BUDGET', '96'))
+        )
+        # スケジューラーのポーリングだけでなく、タップ・履歴の取得などすべての
+        # Toggl API 呼び出しを1日の上限に数える
+        if self.toggl is not None:
+            self.toggl.on_request = lambda: self.cadence.record_call(datetime.now())
         self.morning_threshold_minutes = 30  # 朝型プロジェクトの判定閾値
         self.other_threshold_hours = 2  # その他プロジェクトの判定閾値
         self.deep_night_hour = 22  # 深夜判定の開始時刻
-        self.pattern_update_interval = 24 * 3600  # 24時間ごとにパターン更新
+        # 履歴の取り直しと全件の再学習の間隔。webhook を使わない場合、Toggl アプリ・Web で
+        # 入力したエントリーはここで取り込まれるため、既定は24時間ごと
+        self.pattern_update_interval = int(
+            float(os.getenv('PATTERN_UPDATE_INTERVAL_HOURS', '24')) * 3600
+        )
 
-        # スレッド管理
+        # 古い履歴のアーカイブを行う時刻（利用の少ない深夜）
+        self.retention_hour = 3
+
+        # ジョブ管理（チェック・再学習・アーカイブを1スレッドで実行）
         self.running = False
-        self.check_thread = None
-        self.update_thread = None
+        self.jobs = JobScheduler('emo-scheduler')
         self.last_pattern_update = datetime.now()
 
+        # 今後24時間の想定プロジェクト・通知区分（学習結果が変わるたびに作り直す）
+        self.timeline: Optional[NotificationTimeline] = None
+
+        # 直前のチェックでタイマーが動いていたか・検知済みの作業開始の想定時刻
+        self._timer_running = False
+        self._detected_start: Optional[datetime] = None
+
     def start(self):
         """バックグラウンドスレッドで定期チェック開始"""
         if self.running:
@@ -54,108 +90,150 @@ class EmoScheduler:
             return
 
         self.running = True
+        now = time.time()
+
+        # 定期チェック（起動直後に1回、以降はパターンと API 呼び出し上限に応じた間隔）
+        self.jobs.add_job(Job('check', self._run_check, self._next_check_time), now)
 
-        # 定期チェックスレッド
-        self.check_thread = threading.Thread(target=self._periodic_check, daemon=True)
-        self.check_thread.start()
+        # パターンの全件再学習
+        self.jobs.add_job(
+            Job('pattern_update', self._update_patterns,
+                lambda last_run: last_run + self.pattern_update_interval),
+            now + self.pattern_update_interval
+        )
 
-        # パターン更新スレッド
-        self.update_thread = threading.Thread(target=self._periodic_pattern_update, daemon=True)
-        self.update_thread.start()
+        # 古い履歴のアーカイブ（毎日 retention_hour 時）
+        if self.archive:
+            self.jobs.add_job(Job('retention', self._run_retention, self._next_retention_time),
+                              self._next_retention_time(now))
 
+        self.jobs.start()
         print(f"Scheduler started (check interval: {self.check_interval}s)")
 
     def stop(self):
-        """スレッドを停止"""
+        """スレッドを停止（待機中でもすぐに終了する）"""
         self.running = False
+        self.jobs.stop()
         print("Scheduler stopped")
 
-    def _periodic_check(self):
-        """1時間ごとにチェック（バックグラウンドスレッド）"""
-        while self.running:
-            try:
-                self.check_and_notify()
-            except Exception as e:
-                print(f"Error in periodic check: {e}")
-
-            time.sleep(self.check_interval)
-
-    def _periodic_pattern_update(self):
-        """24時間ごとにパターンを再学習（バックグラウンドスレッド）"""
-        while self.running:
-            time.sleep(self.pattern_update_interval)
-
-            try:
-                print("Updating work patterns...")
-                self.learner.fetch_and_store_history()
-                self.learner.learn_project_patterns()
-                self.last_pattern_update = datetime.now()
-                print("Pattern update completed")
-            except Exception as e:
-                print(f"Error in pattern update: {e}")
+    def _run_check(self):
+        """定期チェック（ジョブ）"""
+        try:
+            self.check_and_notify()
+        except Exception as e:
+            print(f"Error in periodic check: {e}")
+
+    def _next_check_time(self, last_run: float) -> float:
+        """
+        次のチェック時刻を計算
+
+        作業開始の想定時刻の前後は短く、作業のない時間帯・休暇中は長くし、
+        1日の Toggl API 呼び出し上限を超えないように調整する（CheckCadence 参照）
+
+        Args:
+            last_run: 前回のチェック時刻（UNIX秒）
+
+        Returns:
+            次のチェック時刻（UNIX秒）
+        """
+        now = datetime.fromtimestamp(last_run)
+        timeline = self._get_timeline(now)
+        return self.cadence.next_check(now, timeline, self._timer_running,
+                                       self.activity.is_on_vacation()).timestamp()
+
+    def _update_patterns(self):
+        """パターンを全件再学習（ジョブ）"""
+        try:
+            print("Updating work patterns...")
+            self.learner.fetch_and_store_history()
+            self.learner.learn_project_patterns()
+            self.last_pattern_update = datetime.now()
+            print("Pattern update completed")
+        except Exception as e:
+            print(f"Error in pattern update: {e}")
+
+    def _run_retention(self):
+        """再学習に使わない古い履歴をアーカイブし、DBファイルを縮める（ジョブ）"""
+        try:
+            self.archive.run_maintenance()
+        except Exception as e:
+            print(f"Error in history archive: {e}")
+
+    def _next_retention_time(self, last_run: float) -> float:
+        """last_run より後の retention_hour 時（UNIX秒）"""
+        now = datetime.fromtimestamp(last_run)
+        run_at = now.replace(hour=self.retention_hour, minute=0, second=0, microsecond=0)
+        if run_at <= now:
+            run_at += timedelta(days=1)
+        return run_at.timestamp()
+
+    def _get_timeline(self, now: datetime) -> NotificationTimeline:
+        """
+        前計算したタイムラインを取得（学習結果が変わったか期限切れなら作り直す）
+
+        Args:
+            now: 現在時刻
+
+        Returns:
+            now を含む NotificationTimeline
+        """
+        timeline = self.timeline
+        if timeline is None or not timeline.is_current(now, self.learner.data_version):
+            timeline = self.timeline = NotificationTimeline.build(
+                self.learner, self.db, now,
+                morning_threshold_minutes=self.morning_threshold_minutes,
+                other_threshold_hours=self.other_threshold_hours,
+                deep_night_hour=self.deep_night_hour
+            )
+        return timeline
 
     def check_and_notify(self):
         """現在の状況をチェックして通知"""
         now = datetime.now()
+        timeline = self._get_timeline(now)
 
-        # 休暇中の可能性をチェック
-        if self._is_on_vacation():
+        # 休暇中の可能性をチェック（別プロセスでの取り込み・手動設定を反映してから判定）
+        self.activity.reload()
+        if self.activity.is_on_vacation():
             print("Appears to be on vacation, skipping notifications")
             return
 
-        # 現在のタイマー状態を取得
+        # 現在のタイマー状態を取得（webhook で最新の状態が分かっていればポーリングしない）
+        def fetch_current_timer():
+            # 取得に失敗したら例外にして、停止中として扱わない（TimerState にも保存しない）
+            return self.toggl.get_current_timer(raise_errors=True)
+
         try:
-            current_timer = self.toggl.get_current_timer()
+            if self.timer_state:
+                current_timer = self.timer_state.get_current_timer(fetch_current_timer)
+            else:
+                current_timer = fetch_current_timer()
         except Exception as e:
             print(f"Error getting current timer: {e}")
             return
+        self._timer_running = current_timer is not None
 
-        # 平日/休日/祝日判定
-        day_type = self.learner.categorize_day(now)
+        # 現在のスロット（日タイプ・想定プロジェクト・通知区分は前計算済み）
+        slot = timeline.slot_at(now)
 
         # ケース1: 何も作業していない → サボり検知
         if current_timer is None:
-            self._check_for_sabori(now, day_type)
+            self._check_for_sabori(now, slot)
 
         # ケース2: 作業中 → いつもと違う時間かチェック
         else:
-            self._check_unusual_time(current_timer, now, day_type)
-
-    def _is_on_vacation(self) -> bool:
-        """
-        休暇中かどうかを判定（3日以上作業がない場合）
-
-        Returns:
-            休暇中と判定される場合True
-        """
-        result = self.db.execute("""
-            SELECT MAX(start_time) as last_time FROM work_history
-        """).fetchone()
-
-        if not result or not result['last_time']:
-            return False
-
-        from datetime import timezone
-        last_work_time = datetime.fromisoformat(result['last_time'])
-        # タイムゾーン対応: last_work_timeがoffset-awareの場合、nowもoffset-awareにする
-        if last_work_time.tzinfo is not None:
-            now_for_comparison = datetime.now(timezone.utc)
-        else:
-            now_for_comparison = datetime.now()
-        days_since = (now_for_comparison - last_work_time).days
+            self._check_unusual_time(current_timer, now, timeline)
 
-        return days_since >= 3
-
-    def _check_for_sabori(self, now: datetime, day_type: str):
+    def _check_for_sabori(self, now: datetime, slot: Dict):
         """
         サボり検知
 
         Args:
             now: 現在時刻
-            day_type: 日タイプ ('weekday', 'weekend', 'holiday')
+            slot: 現在のタイムラインのスロット
         """
-        # 現在時刻に通常作業しているはずのプロジェクトを検索
-        expected_project = self.learner.get_expected_project_at_time(now)
+        # 現在時刻に通常作業しているはずのプロジェクト
+        expected_project = slot['expected']
 
         if not expected_project:
             return  # 該当なし
@@ -163,6 +241,11 @@ class EmoScheduler:
         project_id = expected_project['project_id']
         project_name = expected_project['project_name']
 
+        # 作業開始の想定時刻から検知までの時間（同じ開始時刻は1回だけ記録）
+        if self._detected_start != slot['expected_since']:
+            self._detected_start = slot['expected_since']
+            self.cadence.record_latency((now - slot['expected_since']).total_seconds())
+
         # 過去1時間以内に同じ通知をしていないかチェック
         if self.msg_gen.has_recent_notification('sabori_reminder', minutes=60):
             return
@@ -180,54 +263,28 @@ class EmoScheduler:
         except Exception as e:
             print(f"Error sending message to BOCCO emo: {e}")
 
-    def _check_unusual_time(self, current_timer: Dict, now: datetime, day_type: str):
+    def _check_unusual_time(self, current_timer: Dict, now: datetime,
+                            timeline: NotificationTimeline):
         """
         いつもと違う時間の検知
 
         Args:
             current_timer: Togglの現在のタイマー情報
             now: 現在時刻
-            day_type: 日タイプ
+            timeline: 現在のタイムライン
         """
         project_id = current_timer.get('project_id')
         if not project_id:
             return
 
-        # プロジェクトの通常パターンを取得
-        pattern = self.db.execute("""
-            SELECT * FROM project_patterns
-            WHERE project_id = ?
-        """, (str(project_id),)).fetchone()
-
-        if not pattern:
-            return  # パターン未学習
-
-        # 平日/休日で適切なパターンを選択
-        hour_field = 'weekend_typical_hours' if day_type in ['weekend', 'holiday'] \
-            else 'weekday_typical_hours'
-
-        typical_hours_json = pattern[hour_field]
-        if not typical_hours_json:
+        # スロットの typical hours を使い、実際の時刻で判定する
+        unusual = timeline.unusual_at(now, str(project_id))
+        if unusual is None:
             return
-
-        typical_hours = json.loads(typical_hours_json)
-        if not typical_hours:
-            return
-
-        # 現在の時刻が通常パターンに含まれていれば何もしない
-        if now.hour in typical_hours:
-            return
-
-        # 時間差を計算
-        min_typical = min(typical_hours)
-        max_typical = max(typical_hours)
-        project_name = pattern['project_name']
-
-        category = None
-        timer_start = current_timer.get('start')
+        category, project_name = unusual
 
         # このセッション内で既に通知済みかチェック
-        if timer_start:
+        if current_timer.get('start'):
             if self.msg_gen.has_recent_notification('early_start', minutes=9999,
                                                      project_id=str(project_id)):
                 return
@@ -238,26 +295,6 @@ class EmoScheduler:
                                                      project_id=str(project_id)):
                 return
 
-        # 朝型プロジェクト（通常9時以前に開始）の場合：30分単位で判定
-        if min_typical <= 9:
-            time_diff_minutes = (min_typical * 60) - (now.hour * 60 + now.minute)
-            if time_diff_minutes >= self.morning_threshold_minutes:
-                category = 'early_start'
-
-        # その他のプロジェクト：2時間単位で判定
-        if category is None:
-            if now.hour < min_typical - self.other_threshold_hours:
-                category = 'early_start'
-            elif now.hour > max_typical + self.other_threshold_hours:
-                # 深夜作業
-                if now.hour >= self.deep_night_hour:
-                    category = 'deep_night_praise'
-                else:
-                    category = 'late_work'
-
-        if category is None:
-            return  # 通常範囲内
-
         # メッセージを生成して送信
         message = self.msg_gen.get_random_message(category, {
             'project_name': project_name
@@ -274,13 +311,7 @@ class EmoScheduler:
     def force_pattern_update(self):
         """パターンを強制的に再学習"""
         print("Force updating patterns...")
-        try:
-            self.learner.fetch_and_store_history()
-            self.learner.learn_project_patterns()
-            self.last_pattern_update = datetime.now()
-            print("Pattern update completed")
-        except Exception as e:
-            print(f"Error in pattern update: {e}")
+        self._update_patterns()
 
     def get_status(self) -> Dict:
         """
@@ -289,9 +320,18 @@ class EmoScheduler:
         Returns:
             状態情報の辞書
         """
+        now = datetime.now()
+        check_job = next((job for job in self.jobs.jobs() if job.name == 'check'), None)
+        next_check = None
+        if check_job and check_job.run_at is not None:
+            next_check = datetime.fromtimestamp(check_job.run_at).isoformat()
+
         return {
             'running': self.running,
             'check_interval_seconds': self.check_interval,
+            'next_check': next_check,
+            # API 呼び出し回数と、作業開始の想定時刻から検知までの時間を並べて表示
+            **self.cadence.stats(now),
             'last_pattern_update': self.last_pattern_update.isoformat(),
-            'on_vacation': self._is_on_vacation()
+            **self.activity.status()
         }
@@ -0,0 +1,180 @@
+"""
+Holiday Calendar - 年ごとの休日ビットマップによる日付分類モジュール
+"""
+
+import json
+import os
+from datetime import date as date_type, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+try:
+    import jpholiday
+except ImportError:
+    print("Warning: jpholiday not installed. Holiday detection will be limited.")
+    jpholiday = None
+
+
+# 日ごとのビットフラグ
+WEEKEND = 0x01
+HOLIDAY = 0x02
+
+
+class HolidayCalendar:
+    """
+    日本の祝日・お盆・正月・会社独自の休業日を年単位で前計算するクラス
+
+    年ごとに「1月1日からの通算日 → フラグ」の bytearray を1度だけ作成し、
+    以降の判定は配列の参照だけで行う
+    """
+
+    def __init__(self, closure_file: Optional[str] = None):
+        """
+        Args:
+            closure_file: 会社独自の休業日を定義したJSONファイルのパス（省略可）
+                形式: {"dates": ["2025-12-26"], "ranges": [["2025-08-12", "2025-08-18"]]}
+        """
+        self._years: Dict[int, Tuple[int, bytearray]] = {}
+        self._closures = set()
+
+        if closure_file:
+            self.load_closures(closure_file)
+
+    def load_closures(self, closure_file: str) -> int:
+        """
+        会社独自の休業日を読み込む
+
+        Args:
+            closure_file: 休業日を定義したJSONファイルのパス
+
+        Returns:
+            読み込んだ休業日の日数
+        """
+        if not os.path.exists(closure_file):
+            return 0
+
+        try:
+            with open(closure_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[ERROR] Error loading company holidays: {e}")
+            return 0
+
+        if not isinstance(data, dict):
+            print(f"[ERROR] Error loading company holidays: {closure_file} is not a JSON object")
+            return 0
+
+        # 不正な日付は警告してスキップし、残りの休業日は読み込む
+        closures = set()
+        for value in data.get('dates', []):
+            try:
+                closures.add(date_type.fromisoformat(value))
+            except (TypeError, ValueError):
+                print(f"Warning: skipping invalid company holiday date: {value!r}")
+
+        for value in data.get('ranges', []):
+            try:
+                start_str, end_str = value
+                day = date_type.fromisoformat(start_str)
+                end = date_type.fromisoformat(end_str)
+            except (TypeError, ValueError):
+                print(f"Warning: skipping invalid company holiday range: {value!r}")
+                continue
+            while day <= end:
+                closures.add(day)
+                day += timedelta(days=1)
+
+        self._closures |= closures
+        self._years.clear()  # ビットマップを作り直す
+        print(f"[OK] Loaded {len(closures)} company holiday(s) from {closure_file}")
+        return len(closures)
+
+    def _build_year(self, year: int) -> bytearray:
+        """
+        1年分のビットマップを作成（内部メソッド）
+
+        Args:
+            year: 対象年
+
+        Returns:
+            通算日（0始まり）ごとのフラグ配列
+        """
+        flags = bytearray(366)
+        jan1 = date_type(year, 1, 1)
+
+        def mark(day: date_type, flag: int):
+            if day.year == year:
+                flags[(day - jan1).days] |= flag
+
+        # 土日
+        day = jan1
+        while day.year == year:
+            if day.weekday() >= 5:
+                flags[(day - jan1).days] |= WEEKEND
+            day += timedelta(days=1)
+
+        # jpholiday ライブラリの祝日
+        if jpholiday:
+            for holiday, _name in jpholiday.year_holidays(year):
+                mark(holiday, HOLIDAY)
+
+        # お盆: 8月13-16日
+        for d in range(13, 17):
+            mark(date_type(year, 8, d), HOLIDAY)
+
+        # 正月: 12月29日-1月3日
+        for d in range(29, 32):
+            mark(date_type(year, 12, d), HOLIDAY)
+        for d in range(1, 4):
+            mark(date_type(year, 1, d), HOLIDAY)
+
+        # 会社独自の休業日
+        for closure in self._closures:
+            mark(closure, HOLIDAY)
+
+        return flags
+
+    def _flags(self, date: datetime) -> int:
+        """
+        日付のフラグを取得（内部メソッド）
+
+        Args:
+            date: 判定する日付
+
+        Returns:
+            WEEKEND / HOLIDAY のビットフラグ
+        """
+        year = self._years.get(date.year)
+        if year is None:
+            jan1 = date_type(date.year, 1, 1).toordinal()
+            year = self._years[date.year] = (jan1, self._build_year(date.year))
+        jan1, flags = year
+        return flags[date.toordinal() - jan1]
+
+    def is_holiday(self, date: datetime) -> bool:
+        """
+        日本の祝日、お盆、正月、会社独自の休業日を判定
+
+        Args:
+            date: 判定する日付
+
+        Returns:
+            祝日・休日の場合True
+        """
+        return bool(self._flags(date) & HOLIDAY)
+
+    def categorize_day(self, date: datetime) -> str:
+        """
+        日付を平日/休日に分類
+
+        Args:
+            date: 分類する日付
+
+        Returns:
+            'weekday', 'weekend', 'holiday' のいずれか
+        """
+        flags = self._flags(date)
+        if flags & WEEKEND:  # 土日
+            return 'weekend'
+        if flags & HOLIDAY:
+            return 'holiday'
+        return 'weekday'
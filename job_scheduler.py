@@ -0,0 +1,128 @@
+"""
+Job Scheduler - 実行時刻順のヒープで複数のジョブを1スレッドで実行するモジュール
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+
+class Job:
+    """
+    スケジュールされたジョブ
+
+    func() を実行した後、next_run(実行後の時刻) が返す UNIX 時刻に再実行する。
+    next_run が None を返した場合は1回だけで終わる
+    """
+
+    def __init__(self, name: str, func: Callable[[], None],
+                 next_run: Optional[Callable[[float], Optional[float]]] = None):
+        """
+        Args:
+            name: ジョブ名（ログ・状態表示用）
+            func: 実行する処理
+            next_run: 次回の実行時刻（UNIX秒）を返す関数
+        """
+        self.name = name
+        self.func = func
+        self.next_run = next_run
+        self.run_at: Optional[float] = None
+        self.last_run: Optional[float] = None
+
+
+class JobScheduler:
+    """
+    ジョブを実行時刻のヒープで管理し、次のジョブの時刻まで threading.Event で待つクラス
+
+    stop() やジョブの追加でイベントを立てるため、待機中でもすぐに起きる
+    """
+
+    def __init__(self, name: str = 'scheduler'):
+        """
+        Args:
+            name: スレッド名
+        """
+        self.name = name
+        self._heap: List[Tuple[float, int, Job]] = []
+        self._counter = itertools.count()  # 同時刻のジョブは登録順
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_job(self, job: Job, run_at: float):
+        """
+        ジョブを登録
+
+        Args:
+            job: 登録するジョブ
+            run_at: 最初の実行時刻（UNIX秒）
+        """
+        with self._lock:
+            job.run_at = run_at
+            heapq.heappush(self._heap, (run_at, next(self._counter), job))
+        self._wakeup.set()
+
+    def jobs(self) -> List[Job]:
+        """登録済みジョブを実行時刻順に取得"""
+        with self._lock:
+            return [job for _, _, job in sorted(self._heap)]
+
+    def start(self):
+        """バックグラウンドスレッドで実行開始"""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """
+        実行を停止（待機中のスレッドもすぐに起こす）
+
+        Args:
+            timeout: 実行中のジョブの終了を待つ秒数
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        """実行中か"""
+        return self._thread is not None and self._thread.is_alive() and not self._stopped.is_set()
+
+    def _run(self):
+        """ジョブ実行ループ（バックグラウンドスレッド）"""
+        while not self._stopped.is_set():
+            with self._lock:
+                self._wakeup.clear()
+                wait = self._heap[0][0] - time.time() if self._heap else None
+
+            if wait is None or wait > 0:
+                # 次のジョブの時刻まで待つ（ジョブの追加・停止で早く起きる）
+                self._wakeup.wait(wait)
+                continue
+
+            with self._lock:
+                _, _, job = heapq.heappop(self._heap)
+
+            try:
+                job.func()
+            except Exception as e:
+                print(f"Error in job '{job.name}': {e}")
+            job.last_run = time.time()
+
+            if self._stopped.is_set():
+                break
+
+            try:
+                run_at = job.next_run(job.last_run) if job.next_run else None
+            except Exception as e:
+                print(f"Error scheduling job '{job.name}': {e}")
+                run_at = None
+            if run_at is not None:
+                with self._lock:
+                    job.run_at = run_at
+                    heapq.heappush(self._heap, (run_at, next(self._counter), job))
@@ -0,0 +1,102 @@
+"""
+Local Time - ローカルタイムゾーンの解決と、作業履歴の時刻カラム（UNIX秒・ローカル日付）の計算
+"""
+
+import os
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import Optional, Union
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python 3.8
+    ZoneInfo = None
+
+# 集計テーブルの last_start など、UNIX秒から作る UTC の ISO 8601 形式（SQL の strftime と同じ）
+UTC_ISO_FORMAT = '%Y-%m-%dT%H:%M:%S+00:00'
+
+
+def _system_zone_key() -> Optional[str]:
+    """/etc/localtime のリンク先から zoneinfo のキー（例: Asia/Tokyo）を求める（内部関数）"""
+    path = os.path.realpath('/etc/localtime')
+    marker = 'zoneinfo' + os.sep
+    if marker in path:
+        return path.split(marker, 1)[1]
+    return None
+
+
+@lru_cache(maxsize=1)
+def local_zone() -> tzinfo:
+    """
+    ローカルタイムゾーン（初回だけ解決してキャッシュ）
+
+    datetime.now() と同じタイムゾーンになるよう、環境変数 TZ、/etc/localtime の順に
+    zoneinfo のキー（例: Asia/Tokyo）を探し、見つからない場合は
+    現在のUTCオフセットの固定タイムゾーンを使う
+
+    Returns:
+        tzinfo
+    """
+    if ZoneInfo is not None:
+        for key in (os.getenv('TZ'), _system_zone_key()):
+            if not key:
+                continue
+            try:
+                return ZoneInfo(key.lstrip(':'))
+            except (ZoneInfoNotFoundError, ValueError):
+                continue
+    return datetime.now().astimezone().tzinfo
+
+
+def to_epoch(value: Union[datetime, str]) -> int:
+    """
+    日時を UNIX秒に変換
+
+    Args:
+        value: datetime または ISO 8601 文字列（タイムゾーンなしはローカル時刻とみなす）
+
+    Returns:
+        UNIX秒
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=local_zone())
+    return int(value.timestamp())
+
+
+def epoch_to_local(epoch: float) -> datetime:
+    """
+    UNIX秒をローカル時刻（naive）に変換
+
+    Args:
+        epoch: UNIX秒
+
+    Returns:
+        タイムゾーン情報を持たないローカル時刻
+    """
+    return datetime.fromtimestamp(epoch, local_zone()).replace(tzinfo=None)
+
+
+def epoch_to_utc_iso(epoch: float) -> str:
+    """UNIX秒を UTC の ISO 8601 文字列に変換（UTC_ISO_FORMAT）"""
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime(UTC_ISO_FORMAT)
+
+
+def local_now() -> datetime:
+    """現在のローカル時刻（naive）"""
+    return datetime.now(local_zone()).replace(tzinfo=None)
+
+
+def local_date_days_ago(days: int, now: Optional[datetime] = None) -> str:
+    """
+    days 日前のローカル日付
+
+    Args:
+        days: 日数
+        now: 基準のローカル時刻（省略時は現在時刻）
+
+    Returns:
+        YYYY-MM-DD
+    """
+    return ((now or local_now()) - timedelta(days=days)).date().isoformat()
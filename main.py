@@ -4,16 +4,22 @@ NFCカードタップでToggl Trackのタイマーを制御し、BOCCO emoが反
 """
 
 import os
-import sqlite3
 import signal
 import sys
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Callable, Optional
 from dotenv import load_dotenv
 
+from database import Database, run_write
+from holiday_calendar import HolidayCalendar
 from pattern_learner import PatternLearner
 from message_generator import MessageGenerator
+from migrations import apply_migrations
+from notification_log import NotificationLogWriter
+from retention import HistoryArchive
 from emo_scheduler import EmoScheduler
+from toggl_webhook import TimerState, TogglWebhookServer, WebhookProcessor
 
 # ロガー設定
 def setup_logger():
@@ -45,6 +51,25 @@ def setup_logger():
 logger = setup_logger()
 
 
+def init_database(db_path: str) -> Database:
+    """
+    データベースに接続し、未適用のスキーマ変更（migrations.py）を適用
+
+    Args:
+        db_path: SQLite データベースファイルのパス
+
+    Returns:
+        スレッドごとの接続を払い出す Database（WAL モード、DATABASE_STORAGE_PROFILE の PRAGMA を設定）
+    """
+    db = Database(
+        db_path,
+        busy_timeout=float(os.getenv('DATABASE_BUSY_TIMEOUT_SECONDS', '10')),
+        storage_profile=os.getenv('DATABASE_STORAGE_PROFILE')
+    )
+    apply_migrations(db)
+    return db
+
+
 # BOCCO emo クライアント
 try:
     from emo_platform import Client, Tokens, BizBasicClient, BizAdvancedClient
@@ -222,13 +247,36 @@ class TogglClient:
         b64_auth = b64encode(auth_str.encode()).decode("ascii")
         self.headers['Authorization'] = f'Basic {b64_auth}'
 
-    def get_time_entries(self, start_date: datetime, end_date: datetime):
+        # API を呼び出すたびに呼ぶ関数（1日の呼び出し回数の記録用、省略可）
+        self.on_request: Optional[Callable[[], None]] = None
+
+    def _request(self, method: str, url: str, **kwargs):
+        """
+        Toggl API にリクエストを送る（呼び出し回数は on_request で記録する、内部メソッド）
+
+        Args:
+            method: HTTP メソッド
+            url: リクエスト先の URL
+            **kwargs: requests.request に渡す引数
+
+        Returns:
+            requests.Response
+        """
+        import requests
+
+        if self.on_request:
+            self.on_request()
+        return requests.request(method, url, headers=self.headers, timeout=10, **kwargs)
+
+    def get_time_entries(self, start_date: datetime, end_date: datetime,
+                         raise_errors: bool = False):
         """
         時間エントリーを取得
 
         Args:
             start_date: 開始日時（UTCタイムゾーン推奨）
             end_date: 終了日時（UTCタイムゾーン推奨）
+            raise_errors: True の場合、通信エラーを空リストにせず例外として送出
 
         Returns:
             時間エントリーのリスト
@@ -241,36 +289,55 @@ class TogglClient:
         end_str = end_date.isoformat().replace('+00:00', 'Z')
 
         try:
-            response = requests.get(
-                f"{self.base_url}/me/time_entries",
-                headers=self.headers,
+            response = self._request(
+                'get', f"{self.base_url}/me/time_entries",
                 params={
                     'start_date': start_str,
                     'end_date': end_str
-                },
-                timeout=10
+                }
             )
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"[Toggl] Error fetching time entries: {e}")
+            if raise_errors:
+                raise
+            return []
+
+    def get_projects(self):
+        """
+        ワークスペースのプロジェクト一覧を取得（アーカイブ済みを含む）
+
+        Returns:
+            プロジェクトのリスト
+        """
+        import requests
+
+        try:
+            response = self._request(
+                'get', f"{self.base_url}/workspaces/{self.workspace_id}/projects",
+                params={'active': 'both'}
+            )
+            response.raise_for_status()
+            return response.json() or []
+        except requests.exceptions.RequestException as e:
+            print(f"[Toggl] Error fetching projects: {e}")
             return []
 
-    def get_current_timer(self):
+    def get_current_timer(self, raise_errors: bool = False):
         """
         現在稼働中のタイマーを取得
 
+        Args:
+            raise_errors: True の場合、通信エラーを None（停止中）にせず例外として送出
+
         Returns:
             現在のタイマー情報（dict）、またはNone
         """
         import requests
 
         try:
-            response = requests.get(
-                f"{self.base_url}/me/time_entries/current",
-                headers=self.headers,
-                timeout=10
-            )
+            response = self._request('get', f"{self.base_url}/me/time_entries/current")
             response.raise_for_status()
             data = response.json()
 
@@ -281,6 +348,8 @@ class TogglClient:
             return data
         except requests.exceptions.RequestException as e:
             print(f"[Toggl] Error getting current timer: {e}")
+            if raise_errors:
+                raise
             return None
 
     def start_timer(self, project_id: str, description: str = ""):
@@ -310,11 +379,9 @@ class TogglClient:
         }
 
         try:
-            response = requests.post(
-                f"{self.base_url}/workspaces/{self.workspace_id}/time_entries",
-                headers=self.headers,
-                json=payload,
-                timeout=10
+            response = self._request(
+                'post', f"{self.base_url}/workspaces/{self.workspace_id}/time_entries",
+                json=payload
             )
             response.raise_for_status()
             data = response.json()
@@ -349,10 +416,9 @@ class TogglClient:
         max_retries = 3 if retry_on_500 else 1
         for attempt in range(max_retries):
             try:
-                response = requests.patch(
-                    f"{self.base_url}/workspaces/{self.workspace_id}/time_entries/{timer_id}/stop",
-                    headers=self.headers,
-                    timeout=10
+                response = self._request(
+                    'patch',
+                    f"{self.base_url}/workspaces/{self.workspace_id}/time_entries/{timer_id}/stop"
                 )
 
                 # 500エラーの場合はリトライ
@@ -515,6 +581,11 @@ class TimekeeperEmoApp:
 
         # データベース初期化
         self.db = self._init_database()
+        # 書き込みは専用スレッドにまとめ、グループコミットする（読み込みは各スレッドの接続で行う）
+        self.db.start_writer(
+            batch_size=int(os.getenv('DATABASE_WRITE_BATCH_SIZE', '100')),
+            group_window=float(os.getenv('DATABASE_WRITE_GROUP_WINDOW_SECONDS', '0.01'))
+        )
 
         # クライアント初期化
         account_type = os.getenv('BOCCO_ACCOUNT_TYPE', 'personal')
@@ -535,11 +606,51 @@ class TimekeeperEmoApp:
         self.nfc = NFCReader()
 
         # コア機能初期化
-        self.learner = PatternLearner(self.db, self.toggl)
-        self.msg_gen = MessageGenerator(self.db)
+        self.calendar = HolidayCalendar(
+            closure_file=os.getenv('COMPANY_HOLIDAYS_FILE', 'company_holidays.json')
+        )
+        self.learner = PatternLearner(
+            self.db, self.toggl,
+            engine=os.getenv('PATTERN_ENGINE', 'sql'),
+            holiday_calendar=self.calendar,
+            half_life_days=float(os.getenv('PATTERN_HALF_LIFE_DAYS', '14'))
+        )
+        # 通知履歴は書き込み専用スレッドへ送り、完了を待たない（タップ時に fsync を待たない）
+        self.notification_log = NotificationLogWriter(self.db)
+        self.msg_gen = MessageGenerator(
+            self.db,
+            template_packs=[path.strip() for path in
+                            os.getenv('MESSAGE_TEMPLATE_PACKS', '').split(',') if path.strip()],
+            notification_log=self.notification_log
+        )
+        self.archive = HistoryArchive(
+            self.db,
+            archive_dir=os.getenv('ARCHIVE_DIR', 'archive'),
+            work_history_days=int(os.getenv('WORK_HISTORY_RETENTION_DAYS', '180')),
+            notification_days=int(os.getenv('NOTIFICATION_RETENTION_DAYS', '30'))
+        )
+
+        # Toggl webhook（シークレットを設定した場合だけ有効、ポーリングは状態が古い場合のみ）
+        self.timer_state = None
+        self.webhook_server = None
+        webhook_secret = os.getenv('TOGGL_WEBHOOK_SECRET')
+        if webhook_secret:
+            self.timer_state = TimerState(
+                max_age=float(os.getenv('TIMER_STATE_MAX_AGE_SECONDS', '21600'))
+            )
+            self.webhook_server = TogglWebhookServer(
+                WebhookProcessor(webhook_secret, self.timer_state, self.learner,
+                                 project_name_resolver=self._get_project_name),
+                host=os.getenv('TOGGL_WEBHOOK_HOST', '0.0.0.0'),
+                port=int(os.getenv('TOGGL_WEBHOOK_PORT', '8765')),
+                path=os.getenv('TOGGL_WEBHOOK_PATH', '/toggl/webhook')
+            )
+
         self.scheduler = EmoScheduler(
             self.db, self.emo, self.toggl,
-            self.learner, self.msg_gen
+            self.learner, self.msg_gen,
+            history_archive=self.archive,
+            timer_state=self.timer_state
         )
 
         # カードとプロジェクトのマッピング（要設定）
@@ -549,16 +660,12 @@ class TimekeeperEmoApp:
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
 
-    def _init_database(self) -> sqlite3.Connection:
+    def _init_database(self) -> Database:
         """データベースを初期化"""
         db_path = os.getenv('DATABASE_PATH', 'timekeeper.db')
-        db = sqlite3.connect(db_path, check_same_thread=False)
-
-        # スキーマ読み込み
-        with open('schema.sql', 'r', encoding='utf-8') as f:
-            db.executescript(f.read())
+        db = init_database(db_path)
 
-        print(f"Database initialized: {db_path}")
+        print(f"Database initialized: {db_path} (storage profile: {db.storage_profile})")
         return db
 
     def _load_card_mapping(self) -> dict:
@@ -628,6 +735,9 @@ class TimekeeperEmoApp:
         self.scheduler.start()
         print("[OK] Scheduler started")
 
+        if self.webhook_server:
+            self.webhook_server.start()
+
         # NFCリーダー監視（メインループ）
         print("\n[3/3] Starting NFC reader...")
         print("[OK] Ready! Waiting for NFC card tap...\n")
@@ -665,7 +775,7 @@ class TimekeeperEmoApp:
 
         # 現在のタイマー状態を確認
         try:
-            current_timer = self.toggl.get_current_timer()
+            current_timer = self._get_current_timer()
         except Exception as e:
             print(f"Error getting timer: {e}")
             return
@@ -684,10 +794,30 @@ class TimekeeperEmoApp:
     STAMP_GANBARE = "f175953f-d29d-406a-bb19-43f3eb237c5e"  # がんばれ
     STAMP_OK = "efa697ac-ed6c-4f18-960c-3abf16a67642"  # OK
 
+    def _get_current_timer(self):
+        """
+        現在のタイマーを取得
+
+        webhook を有効にしている場合はローカルの状態を使い、古い場合だけポーリングする
+        （通信エラーは停止中としてキャッシュしないよう例外として送出する）
+
+        Returns:
+            現在のタイマー情報（dict）、またはNone
+        """
+        if self.timer_state:
+            return self.timer_state.get_current_timer(
+                lambda: self.toggl.get_current_timer(raise_errors=True)
+            )
+        return self.toggl.get_current_timer()
+
     def _start_timer(self, project_id: str):
         """タイマーを開始"""
         try:
-            self.toggl.start_timer(project_id)
+            entry = self.toggl.start_timer(project_id)
+            if self.timer_state:
+                self.timer_state.set(entry)
+            run_write(self.db, self.learner.activity.touch,
+                      (entry or {}).get('start') or datetime.now(timezone.utc))
 
             # プロジェクト名を取得（優先順位: card_mapping.json > DB > デフォルト）
             project_name = self._get_project_name(project_id)
@@ -736,13 +866,9 @@ class TimekeeperEmoApp:
 
         # 2. データベースから取得を試みる
         try:
-            project = self.db.execute("""
-                SELECT project_name FROM project_patterns
-                WHERE project_id = ?
-            """, (project_id,)).fetchone()
-
-            if project and project['project_name']:
-                return project['project_name']
+            project_name = self.learner.get_project_name(project_id)
+            if project_name:
+                return project_name
         except Exception as e:
             logger.warning(f"Failed to get project name from database: {e}")
 
@@ -752,7 +878,7 @@ class TimekeeperEmoApp:
     def _stop_timer(self, current_timer: dict):
         """タイマーを停止"""
         try:
-            result = self.toggl.stop_timer()
+            result = self.toggl.stop_timer(current_timer.get('id'))
 
             # リトライしても停止できなかった場合
             if result is None:
@@ -760,6 +886,9 @@ class TimekeeperEmoApp:
                 self.emo.send_message("タイマーの停止に失敗したかも...もう一度タッチしてみて？")
                 return
 
+            if self.timer_state:
+                self.timer_state.clear(result.get('id'))
+
             # 作業時間を計算
             from datetime import timezone
             start_time = datetime.fromisoformat(
@@ -783,6 +912,14 @@ class TimekeeperEmoApp:
 
             print(f"[OK] Timer stopped: {project_name} ({duration_minutes} min)")
 
+            # 停止したエントリーでパターンを即時更新（Togglへの追加アクセスなし）
+            try:
+                self.learner.record_time_entry(
+                    result, self._get_project_name(str(project_id))
+                )
+            except Exception as e:
+                logger.warning(f"Failed to update patterns incrementally: {e}")
+
         except Exception as e:
             print(f"Error stopping timer: {e}")
 
@@ -800,6 +937,13 @@ class TimekeeperEmoApp:
         print("Stopping scheduler...")
         self.scheduler.stop()
 
+        if self.webhook_server:
+            print("Stopping webhook server...")
+            self.webhook_server.stop()
+
+        print("Flushing notification history...")
+        self.notification_log.stop()
+
         print("Closing NFC reader...")
         # NFCリーダーのクローズを別スレッドで実行（タイムアウト付き）
         close_thread = threading.Thread(target=self.nfc.close, daemon=True)
@@ -813,7 +957,7 @@ class TimekeeperEmoApp:
             logger.info("NFC reader closed successfully")
 
         print("Closing database...")
-        self.db.close()
+        self.db.close()  # 書き込み専用スレッドの残りをコミットしてから閉じる
 
         print("Goodbye!")
 
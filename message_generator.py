@@ -2,88 +2,201 @@
 Message Generator - コンテキストに応じたメッセージ生成モジュール
 """
 
+import hashlib
+import json
+import os
+import random
 import sqlite3
-from typing import Dict, Optional
+import threading
+import time
+from datetime import datetime, timezone
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+from database import run_write
+from notification_log import NotificationLogWriter
+
+# 同梱のメッセージテンプレート（モジュールと同じディレクトリ）
+DEFAULT_TEMPLATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'message_templates.json')
+
+# 解析済みテンプレート: (元のテンプレート, [(文字列, 変数名, 書式指定, 変換), ...])
+ParsedTemplate = Tuple[str, List[Tuple[str, Optional[str], Optional[str], Optional[str]]]]
+
+
+def parse_template(template: str) -> ParsedTemplate:
+    """
+    メッセージテンプレートを埋め込み用に解析
+
+    Args:
+        template: {project_name} などのプレースホルダーを含むテンプレート
+
+    Returns:
+        解析済みテンプレート
+    """
+    return template, list(Formatter().parse(template))
+
+
+def render_template(parsed: ParsedTemplate, context: Dict) -> str:
+    """
+    解析済みテンプレートに変数を埋め込む
+
+    Args:
+        parsed: parse_template() の結果
+        context: 埋め込む変数の辞書
+
+    Returns:
+        メッセージ文字列
+
+    Raises:
+        KeyError: context にない変数がある場合
+    """
+    parts = []
+    for literal, field_name, format_spec, conversion in parsed[1]:
+        parts.append(literal)
+        if field_name is None:
+            continue
+        value = context[field_name]
+        if conversion == 'r':
+            value = repr(value)
+        elif conversion == 's':
+            value = str(value)
+        elif conversion == 'a':
+            value = ascii(value)
+        parts.append(format(value, format_spec or ''))
+    return ''.join(parts)
 
 
 class MessageGenerator:
     """BOCCO emoに送信するメッセージを生成するクラス"""
 
-    def __init__(self, db_connection: sqlite3.Connection):
+    def __init__(self, db_connection: sqlite3.Connection,
+                 template_packs: Optional[List[str]] = None,
+                 notification_log: Optional[NotificationLogWriter] = None):
         """
         Args:
             db_connection: SQLite データベース接続
+            template_packs: 追加で登録するテンプレートパック（JSON）のパス（カスタム・多言語など）
+            notification_log: 通知履歴をまとめて書き込む NotificationLogWriter
+                              （省略時は記録のたびに INSERT してコミット）
         """
         self.db = db_connection
         self.db.row_factory = sqlite3.Row
+        self.template_packs = template_packs or []
+        self.notification_log = notification_log
+
+        # カテゴリごとの解析済みテンプレート（初回使用時に読み込み、追加時に破棄）
+        self._templates: Optional[Dict[str, List[ParsedTemplate]]] = None
+        # カテゴリごとの未使用テンプレートの番号（シャッフルバッグ）と最後に使った番号
+        self._bags: Dict[str, List[int]] = {}
+        self._last_picked: Dict[str, int] = {}
+        self._template_lock = threading.Lock()
+
         self._initialize_templates()
 
+        # (カテゴリ, プロジェクトID) ごとの最終通知時刻（UNIX秒）
+        # プロジェクトIDが None のキーはカテゴリ全体の最終通知時刻
+        self._last_notified: Dict[Tuple[str, Optional[str]], float] = {}
+        self._load_notification_index()
+
+    def _load_notification_index(self):
+        """通知履歴から (カテゴリ, プロジェクトID) ごとの最終通知時刻を読み込む（内部メソッド）"""
+        last_notified = {}
+        for row in self.db.execute("""
+            SELECT category, project_id, MAX(notified_at) as notified_at
+            FROM notification_history
+            GROUP BY category, project_id
+        """):
+            # notified_at は CURRENT_TIMESTAMP（UTC）
+            notified = datetime.fromisoformat(row['notified_at']).replace(
+                tzinfo=timezone.utc).timestamp()
+            for key in ((row['category'], row['project_id']), (row['category'], None)):
+                if notified > last_notified.get(key, 0):
+                    last_notified[key] = notified
+        self._last_notified = last_notified
+
     def _initialize_templates(self):
-        """初回起動時にメッセージテンプレートを登録"""
-        templates = [
-            # サボり検知
-            ('sabori_reminder', 'そろそろ{project_name}やったほうがよいんじゃない？'),
-            ('sabori_reminder', '{project_name}、今日はまだだよね？始めようか！'),
-            ('sabori_reminder', 'いつもの時間だよ！{project_name}、やる？'),
-            ('sabori_reminder', '{project_name}の時間だよ～！準備はいい？'),
-            ('sabori_reminder', 'あれ、{project_name}忘れてない？大丈夫？'),
-            ('sabori_reminder', '{project_name}、そろそろ始める時間だと思うんだけど...'),
-            ('sabori_reminder', '今日も{project_name}、がんばろうね！'),
-            ('sabori_reminder', '{project_name}のこと、覚えてる？そろそろだよ！'),
-
-            # 朝早い開始
-            ('early_start', 'あれ、今日は朝やるんだ！がんばって！'),
-            ('early_start', 'おはよう！今日は早いね。応援してるよ！'),
-            ('early_start', '朝活いいね！{project_name}、ファイト！'),
-            ('early_start', 'いつもより早いね！すごい、頑張ってね！'),
-            ('early_start', '早起きえらい！今日もいい一日になりそうだね！'),
-            ('early_start', 'わあ、朝から{project_name}！やる気満々だね！'),
-            ('early_start', 'おはよう！朝から{project_name}、素敵だね！'),
-
-            # 遅い時間の作業
-            ('late_work', '今日は夜やるんだね！無理しないでね！'),
-            ('late_work', '夜型になってるね。体調には気をつけて！'),
-            ('late_work', '遅い時間だけど、がんばってね！'),
-            ('late_work', 'いつもと違う時間だね。集中できてる？'),
-            ('late_work', '夜の{project_name}もいいね。無理は禁物だよ！'),
-            ('late_work', 'こんな時間に{project_name}！締め切り近いのかな？'),
-
-            # 深夜のねぎらい
-            ('deep_night_praise', 'こんな時間までお疲れさま！もう少しだね！'),
-            ('deep_night_praise', '夜遅くまでがんばったね！ゆっくり休んでね！'),
-            ('deep_night_praise', 'お疲れさま！今日も一日よくがんばったね！'),
-            ('deep_night_praise', '深夜までお疲れさま！無理しすぎないでね！'),
-            ('deep_night_praise', 'すごい集中力！でもそろそろ休もう？'),
-            ('deep_night_praise', '今日も一日お疲れさま！ゆっくり休んでね！'),
-            ('deep_night_praise', '{project_name}、こんな時間まで！本当にお疲れさま！'),
-            ('deep_night_praise', '深夜の作業、お疲れさま！明日もがんばろうね！'),
-
-            # タイマー開始時（通常時）
-            ('timer_start', 'よーし、{project_name}始めよう！'),
-            ('timer_start', '{project_name}スタート！がんばって！'),
-            ('timer_start', 'いってらっしゃい！{project_name}、ファイト！'),
-            ('timer_start', '{project_name}の時間だね！応援してるよ！'),
-            ('timer_start', 'さあ、{project_name}始めましょ！'),
-
-            # タイマー停止時（通常時）
-            ('timer_stop', 'お疲れさま！{duration}分間、よくがんばったね！'),
-            ('timer_stop', '{duration}分間、集中できた？お疲れさま！'),
-            ('timer_stop', 'おつかれー！{duration}分、すごいね！'),
-            ('timer_stop', '{project_name}終了！{duration}分間お疲れさまでした！'),
-            ('timer_stop', 'よくやった！{duration}分間がんばったね！'),
+        """同梱のテンプレートと追加のテンプレートパックを登録（内容が変わっていなければ何もしない）"""
+        self.load_template_pack(DEFAULT_TEMPLATE_FILE)
+        for path in self.template_packs:
+            # 読み込めないパックは警告して飛ばす（同梱のテンプレートだけで動かす）
+            try:
+                self.load_template_pack(path)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Failed to load message template pack {path}: {e}")
+
+    def load_template_pack(self, path: str) -> int:
+        """
+        テンプレートパック（JSON）をまとめて登録
+
+        ファイルの内容のハッシュを（絶対パスごとに）app_metadata に記録し、前回と同じなら何もしない。
+        変わっていれば INSERT OR IGNORE で未登録のテンプレートだけを追加する
+        （パックから消したテンプレートは削除しない）
+
+        形式: {"version": 1, "templates": {"カテゴリ": ["テンプレート", ...], ...}}
+
+        Args:
+            path: テンプレートパックのパス
+
+        Returns:
+            追加したテンプレート数
+
+        Raises:
+            OSError: ファイルを読み込めない場合
+            ValueError: JSON として読めない、または形式が正しくない場合
+        """
+        with open(path, 'rb') as f:
+            content = f.read()
+        pack = json.loads(content)
+        if not isinstance(pack, dict) or not isinstance(pack.get('templates', {}), dict) or any(
+                not isinstance(messages, list) for messages in pack.get('templates', {}).values()):
+            raise ValueError("expected {\"templates\": {\"<category>\": [\"<template>\", ...]}}")
+        # 別のディレクトリにある同名のパックを区別するため絶対パスで記録する
+        key = f"template_pack:{os.path.abspath(path)}"
+        stamp = f"v{pack.get('version', 0)}:{hashlib.sha256(content).hexdigest()}"
+
+        stored = self.db.execute(
+            "SELECT value FROM app_metadata WHERE key = ?", (key,)
+        ).fetchone()
+        if stored and stored['value'] == stamp:
+            return 0
+
+        rows = [
+            (category, message)
+            for category, messages in pack.get('templates', {}).items()
+            for message in messages
         ]
 
-        for category, message in templates:
-            try:
-                self.db.execute("""
-                    INSERT INTO message_templates (category, message_template)
-                    VALUES (?, ?)
-                """, (category, message))
-            except sqlite3.IntegrityError:
-                # 既に存在する場合はスキップ
-                pass
+        def save() -> int:
+            before = self.db.total_changes
+            self.db.executemany("""
+                INSERT OR IGNORE INTO message_templates (category, message_template)
+                VALUES (?, ?)
+            """, rows)
+            inserted = self.db.total_changes - before
+
+            self.db.execute("""
+                INSERT INTO app_metadata (key, value, updated_at)
+                VALUES (?, ?, datetime('now'))
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value,
+                    updated_at = excluded.updated_at
+            """, (key, stamp))
+            return inserted
+
+        added = run_write(self.db, save)
 
-        self.db.commit()
+        self._invalidate_templates()
+        if added:
+            print(f"Loaded {added} message template(s) from {path}")
+        return added
+
+    def _invalidate_templates(self):
+        """テンプレートのキャッシュを破棄（次回の取得時に読み込み直す）（内部メソッド）"""
+        with self._template_lock:
+            self._templates = None
+            self._bags = {}
+            self._last_picked = {}
 
     def get_random_message(self, category: str, context: Optional[Dict] = None) -> str:
         """
@@ -108,50 +221,97 @@ class MessageGenerator:
         if context is None:
             context = {}
 
-        # テンプレートをランダムに取得
-        result = self.db.execute("""
-            SELECT message_template FROM message_templates
-            WHERE category = ?
-            ORDER BY RANDOM()
-            LIMIT 1
-        """, (category,)).fetchone()
-
-        if not result:
+        # テンプレートをシャッフルバッグから取得（一巡するまで同じテンプレートは選ばない）
+        parsed = self._pick_template(category)
+        if parsed is None:
             # デフォルトメッセージ
             return "がんばって！"
 
-        template = result['message_template']
-
         # プレースホルダーを置換
         try:
-            message = template.format(**context)
+            message = render_template(parsed, context)
         except KeyError as e:
             # プレースホルダーが足りない場合はそのまま返す
             print(f"Warning: Missing placeholder {e} in template")
-            message = template
+            message = parsed[0]
 
         return message
 
+    def _load_templates(self) -> Dict[str, List[ParsedTemplate]]:
+        """全カテゴリのテンプレートを読み込んで解析（内部メソッド）"""
+        templates: Dict[str, List[ParsedTemplate]] = {}
+        for row in self.db.execute("""
+            SELECT category, message_template FROM message_templates ORDER BY id
+        """):
+            templates.setdefault(row['category'], []).append(
+                parse_template(row['message_template'])
+            )
+        return templates
+
+    def _pick_template(self, category: str) -> Optional[ParsedTemplate]:
+        """
+        シャッフルバッグからテンプレートを1つ取り出す（内部メソッド）
+
+        Args:
+            category: メッセージカテゴリ
+
+        Returns:
+            解析済みテンプレート、カテゴリにテンプレートがなければ None
+        """
+        with self._template_lock:
+            if self._templates is None:
+                self._templates = self._load_templates()
+                self._bags = {}
+
+            templates = self._templates.get(category)
+            if not templates:
+                return None
+
+            bag = self._bags.get(category)
+            if not bag:
+                bag = self._bags[category] = list(range(len(templates)))
+                random.shuffle(bag)
+                # 前の巡の最後と次の巡の最初が同じにならないようにする
+                if len(bag) > 1 and bag[-1] == self._last_picked.get(category):
+                    bag[0], bag[-1] = bag[-1], bag[0]
+
+            index = bag.pop()
+            self._last_picked[category] = index
+            return templates[index]
+
     def record_notification(self, category: str, project_id: Optional[str], message: str):
         """
         通知履歴を記録
 
+        重複チェック用の最終通知時刻はその場で更新し、
+        DBへの書き込みは notification_log があればバックグラウンドで行う
+
         Args:
             category: メッセージカテゴリ
             project_id: プロジェクトID（省略可）
             message: 送信したメッセージ
         """
-        self.db.execute("""
+        now = time.time()
+        self._last_notified[(category, None)] = now
+        if project_id is not None:
+            self._last_notified[(category, str(project_id))] = now
+
+        if self.notification_log:
+            self.notification_log.append(category, project_id, message)
+            return
+
+        run_write(self.db, self.db.execute, """
             INSERT INTO notification_history (category, project_id, message)
             VALUES (?, ?, ?)
         """, (category, project_id, message))
-        self.db.commit()
 
     def has_recent_notification(self, category: str, minutes: int = 60,
                                 project_id: Optional[str] = None) -> bool:
         """
         最近同じカテゴリの通知を送信したかチェック
 
+        起動時に読み込んだ最終通知時刻を参照するため、DBへの問い合わせは行わない
+
         Args:
             category: メッセージカテゴリ
             minutes: チェックする時間範囲（分）
@@ -160,20 +320,9 @@ class MessageGenerator:
         Returns:
             最近通知している場合True
         """
-        if project_id:
-            result = self.db.execute("""
-                SELECT COUNT(*) as count FROM notification_history
-                WHERE category = ? AND project_id = ?
-                    AND notified_at >= datetime('now', ? || ' minutes')
-            """, (category, project_id, -minutes)).fetchone()
-        else:
-            result = self.db.execute("""
-                SELECT COUNT(*) as count FROM notification_history
-                WHERE category = ?
-                    AND notified_at >= datetime('now', ? || ' minutes')
-            """, (category, -minutes)).fetchone()
-
-        return result['count'] > 0
+        key = (category, str(project_id) if project_id else None)
+        last_notified = self._last_notified.get(key)
+        return last_notified is not None and last_notified >= time.time() - minutes * 60
 
     def cleanup_old_notifications(self, days: int = 7):
         """
@@ -182,11 +331,13 @@ class MessageGenerator:
         Args:
             days: 保持する日数
         """
-        self.db.execute("""
+        if self.notification_log:
+            self.notification_log.flush()
+        run_write(self.db, self.db.execute, """
             DELETE FROM notification_history
             WHERE notified_at < datetime('now', ? || ' days')
         """, (-days,))
-        self.db.commit()
+        self._load_notification_index()
 
     def add_custom_message(self, category: str, message_template: str):
         """
@@ -197,11 +348,11 @@ class MessageGenerator:
             message_template: メッセージテンプレート文字列
         """
         try:
-            self.db.execute("""
+            run_write(self.db, self.db.execute, """
                 INSERT INTO message_templates (category, message_template)
                 VALUES (?, ?)
             """, (category, message_template))
-            self.db.commit()
+            self._invalidate_templates()
             print(f"Added custom message to category '{category}'")
         except sqlite3.IntegrityError:
             print(f"Message already exists in category '{category}'")
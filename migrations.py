@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Migrations - PRAGMA user_version によるスキーマのバージョン管理
+
+schema.sql はバージョン1（ベースライン）のスキーマで、コードと同じディレクトリから読み込む。
+以降の変更は MIGRATIONS に番号順に追加し、未適用のものだけを1つずつ
+トランザクション内で実行して user_version を進める。
+最新のDBでは user_version を読むだけで何もしない
+
+Usage:
+    python migrations.py [status|migrate]
+"""
+
+import os
+import sqlite3
+import sys
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from daily_rollup import rebuild_rollup
+from database import transaction
+from holiday_calendar import HolidayCalendar
+from local_time import epoch_to_local, to_epoch
+
+# コードと一緒に配布するベースラインのスキーマ
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+# バージョン管理前の既存DBに後から追加したカラム（CREATE TABLE IF NOT EXISTS では追加されない）
+LEGACY_COLUMN_UPGRADES = [
+    ('project_patterns', 'hour_histogram', 'BLOB'),
+    ('project_patterns', 'histogram_epoch', 'REAL'),
+    ('work_history', 'toggl_entry_id', 'INTEGER'),
+]
+
+
+def split_statements(script: str) -> Iterator[str]:
+    """
+    SQL スクリプトを文ごとに分割（executescript はトランザクションをコミットしてしまうため）
+
+    Args:
+        script: SQL スクリプト
+
+    Yields:
+        1文ずつの SQL
+    """
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            if statement.strip():
+                yield statement
+            statement = ''
+    if statement.strip() and not statement.lstrip().startswith('--'):
+        yield statement
+
+
+def get_columns(db, table: str) -> List[str]:
+    """
+    テーブルのカラム名一覧を取得
+
+    Args:
+        db: sqlite3.Connection または Database
+        table: テーブル名
+
+    Returns:
+        カラム名のリスト（テーブルがない場合は空）
+    """
+    return [row[1] for row in db.execute(f"PRAGMA table_info({table})")]
+
+
+def add_column(db, table: str, column: str, column_type: str) -> bool:
+    """
+    カラムがなければ追加
+
+    Args:
+        db: sqlite3.Connection または Database
+        table: テーブル名
+        column: カラム名
+        column_type: 型（DEFAULT などの制約を含めてよい）
+
+    Returns:
+        追加した場合True（テーブル自体がない場合は何もしない）
+    """
+    columns = get_columns(db, table)
+    if not columns or column in columns:
+        return False
+    db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    print(f"Added column {table}.{column}")
+    return True
+
+
+def fill_time_columns(db, calendar: Optional[HolidayCalendar] = None) -> int:
+    """
+    start_epoch が未設定の work_history 行に、UNIX秒・ローカル日付と
+    ローカル時刻での曜日・時間帯・日タイプを設定（移行前の行・古いアーカイブから戻した行）
+
+    Args:
+        db: sqlite3.Connection または Database
+        calendar: 日タイプの判定に使う HolidayCalendar（省略時は COMPANY_HOLIDAYS_FILE を読む）
+
+    Returns:
+        更新した行数
+    """
+    if calendar is None:
+        calendar = HolidayCalendar(
+            closure_file=os.getenv('COMPANY_HOLIDAYS_FILE', 'company_holidays.json')
+        )
+
+    updates = []
+    for row_id, start_time, end_time in db.execute("""
+        SELECT id, start_time, end_time FROM work_history WHERE start_epoch IS NULL
+    """).fetchall():
+        start_epoch = to_epoch(start_time)
+        local_start = epoch_to_local(start_epoch)
+        day_category = calendar.categorize_day(local_start)
+        updates.append((
+            start_epoch,
+            to_epoch(end_time) if end_time else None,
+            local_start.date().isoformat(),
+            local_start.weekday(),
+            local_start.hour,
+            1 if day_category == 'weekend' else 0,
+            1 if day_category == 'holiday' else 0,
+            row_id
+        ))
+
+    db.executemany("""
+        UPDATE work_history SET
+            start_epoch = ?, end_epoch = ?, local_date = ?,
+            day_of_week = ?, hour_of_day = ?, is_weekend = ?, is_holiday = ?
+        WHERE id = ?
+    """, updates)
+    return len(updates)
+
+
+def _baseline(db):
+    """1: ベースラインのスキーマ（バージョン管理前の既存DBには不足カラムを先に追加）"""
+    # 新しいカラムを使うインデックスより先にカラムを追加しておく
+    for table, column, column_type in LEGACY_COLUMN_UPGRADES:
+        add_column(db, table, column, column_type)
+
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+        for statement in split_statements(f.read()):
+            db.execute(statement)
+
+
+def _build_rollup(db):
+    """2: 集計テーブル追加前の履歴を work_daily_rollup に取り込む"""
+    has_rollup = db.execute("SELECT 1 FROM work_daily_rollup LIMIT 1").fetchone()
+    has_history = db.execute("SELECT 1 FROM work_history LIMIT 1").fetchone()
+    if has_history and not has_rollup:
+        count = rebuild_rollup(db)
+        print(f"Built {count} work_daily_rollup rows from work_history")
+
+
+def _time_columns(db):
+    """
+    3: work_history に UNIX秒とローカル日付のカラムを追加し、時刻の範囲検索をインデックスで行う
+
+    曜日・時間帯・日タイプもローカル時刻で計算し直し、集計テーブルをローカル日付で作り直す
+    """
+    add_column(db, 'work_history', 'start_epoch', 'INTEGER')
+    add_column(db, 'work_history', 'end_epoch', 'INTEGER')
+    add_column(db, 'work_history', 'local_date', 'TEXT')
+    filled = fill_time_columns(db)
+    if filled:
+        print(f"Filled time columns for {filled} work_history rows")
+
+    # start_time（文字列）のインデックスを UNIX秒・ローカル日付のインデックスに置き換える
+    # （日タイプのインデックスは学習が集計テーブルを参照するようになって使われていない）
+    for index in ('idx_work_history_project_time', 'idx_work_history_start_time',
+                  'idx_work_history_day_type'):
+        db.execute(f"DROP INDEX IF EXISTS {index}")
+    db.execute("""
+        CREATE INDEX idx_work_history_project_time
+            ON work_history(project_id, start_epoch)
+    """)
+    db.execute("""
+        CREATE INDEX idx_work_history_start_epoch
+            ON work_history(start_epoch)
+    """)
+    db.execute("""
+        CREATE INDEX idx_work_history_local_date
+            ON work_history(local_date)
+    """)
+    # 集計行1つ分（プロジェクト×ローカル日付×時間）の最終開始日時を求めるため
+    db.execute("""
+        CREATE INDEX idx_work_history_project_slot
+            ON work_history(project_id, local_date, hour_of_day, start_epoch)
+    """)
+
+    rebuild_rollup(db)
+
+
+def _local_date_indexes(db):
+    """
+    4: 日付・時刻の範囲検索がテーブル全体をたどらないようにインデックスを見直す
+
+    (local_date, project_id, hour_of_day, start_epoch) は集計の作り直し（日付の範囲 + グループ化）、
+    アーカイブの月単位の検索、集計行1つ分の最終開始日時の検索をまとめて受け持つ。
+    集計テーブルは学習期間の日付で、通知履歴は古い通知の削除・アーカイブの時刻で絞り込む
+    """
+    for index in ('idx_work_history_local_date', 'idx_work_history_project_slot'):
+        db.execute(f"DROP INDEX IF EXISTS {index}")
+    db.execute("""
+        CREATE INDEX idx_work_history_local_slot
+            ON work_history(local_date, project_id, hour_of_day, start_epoch)
+    """)
+    db.execute("""
+        CREATE INDEX idx_work_daily_rollup_date
+            ON work_daily_rollup(date)
+    """)
+    db.execute("""
+        CREATE INDEX idx_notification_history_notified_at
+            ON notification_history(notified_at)
+    """)
+
+
+def _archived_entries(db):
+    """
+    5: アーカイブ済みの work_history の Toggl エントリーIDを archived_entries に記録する
+
+    backfill で取り込み直さないための照合を、アーカイブファイル全体を読まずに
+    主キーで行えるようにする。既存のアーカイブファイルからは ID を読み込んで登録する
+    """
+    import gzip
+    import json
+
+    db.execute("""
+        CREATE TABLE archived_entries (
+            toggl_entry_id INTEGER PRIMARY KEY,
+            month TEXT NOT NULL       -- アーカイブファイルの月（YYYY-MM）
+        )
+    """)
+    db.execute("CREATE INDEX idx_archived_entries_month ON archived_entries(month)")
+
+    archives = db.execute("""
+        SELECT month, path FROM archive_files WHERE table_name = 'work_history'
+    """).fetchall()
+    for month, path in archives:
+        if not os.path.exists(path):
+            print(f"Warning: archive file {path} not found; its entries are not indexed")
+            continue
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            records = (json.loads(line) for line in f if line.strip())
+            db.executemany("""
+                INSERT OR IGNORE INTO archived_entries (toggl_entry_id, month) VALUES (?, ?)
+            """, ((record['toggl_entry_id'], month) for record in records
+                  if record.get('toggl_entry_id') is not None))
+
+
+# (バージョン, 説明, 適用する関数) を番号順に並べる。適用済みの項目は変更しない
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, 'baseline schema', _baseline),
+    (2, 'build work_daily_rollup from existing history', _build_rollup),
+    (3, 'epoch and local-date columns on work_history', _time_columns),
+    (4, 'date and time range indexes for history, rollup and notifications', _local_date_indexes),
+    (5, 'index of archived Toggl entry ids', _archived_entries),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(db) -> int:
+    """DBのスキーマバージョン（PRAGMA user_version）"""
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def pending_migrations(db) -> List[Tuple[int, str, Callable]]:
+    """
+    未適用のマイグレーション一覧
+
+    Args:
+        db: sqlite3.Connection または Database
+
+    Returns:
+        (バージョン, 説明, 関数) のリスト
+    """
+    version = get_version(db)
+    if version > LATEST_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this code ({LATEST_VERSION})"
+        )
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def apply_migrations(db) -> int:
+    """
+    未適用のマイグレーションを順に適用
+
+    1つのマイグレーションと user_version の更新を同じトランザクションで行うため、
+    途中で失敗してもそれまでに適用したバージョンから再開できる
+
+    Args:
+        db: sqlite3.Connection または Database
+
+    Returns:
+        適用したマイグレーション数
+    """
+    # 最新なら user_version を読むだけで終わる
+    if get_version(db) == LATEST_VERSION:
+        return 0
+
+    applied = 0
+    for version, description, migrate in pending_migrations(db):
+        with transaction(db):
+            migrate(db)
+            db.execute(f"PRAGMA user_version = {version}")
+        print(f"Applied migration {version}: {description}")
+        applied += 1
+    return applied
+
+
+def main():
+    """エントリーポイント"""
+    from dotenv import load_dotenv
+    from database import Database
+
+    load_dotenv()
+
+    db_path = os.getenv('DATABASE_PATH', 'timekeeper.db')
+    db = Database(db_path, storage_profile=os.getenv('DATABASE_STORAGE_PROFILE'))
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if command == 'migrate':
+        applied = apply_migrations(db)
+        print(f"Applied {applied} migration(s)")
+    elif command != 'status':
+        print("Usage: python migrations.py [status|migrate]")
+        sys.exit(1)
+
+    version = get_version(db)
+    print(f"{db_path}: schema version {version} (latest {LATEST_VERSION})")
+    for pending, description, _ in pending_migrations(db):
+        print(f"  pending {pending}: {description}")
+
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
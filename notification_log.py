@@ -0,0 +1,85 @@
+"""
+Notification Log - notification_history への追記を書き込み専用スレッドへ送り、完了を待たずに戻る
+"""
+
+import sqlite3
+import threading
+from concurrent.futures import Future, wait as wait_futures
+from datetime import datetime, timezone
+from typing import List, Optional, Set, Tuple
+
+from database import Database, run_write
+
+
+class NotificationLogWriter:
+    """
+    通知履歴の INSERT を Database.write() へ送り、コミットを待たずに戻るクラス
+
+    書き込み専用スレッドが動いていれば他の書き込みとまとめてグループコミットさせる
+    （接続の設定・ストレージプロファイルも Database のものを使う）。
+    動いていない場合（CLI、メモリ上のDBなど）や sqlite3.Connection の場合はその場で書き込む。
+    通知時刻は追加した時点の時刻（CURRENT_TIMESTAMP と同じ UTC 形式）で記録する
+    """
+
+    def __init__(self, db_connection: sqlite3.Connection):
+        """
+        Args:
+            db_connection: SQLite データベース接続（Database の場合は書き込み専用スレッド経由）
+        """
+        self.db = db_connection
+        self._pending: Set[Future] = set()
+        self._pending_lock = threading.Lock()
+
+    def append(self, category: str, project_id: Optional[str], message: str):
+        """
+        通知履歴を1件追加（Database の場合はコミットを待たない）
+
+        Args:
+            category: メッセージカテゴリ
+            project_id: プロジェクトID（省略可）
+            message: 送信したメッセージ
+        """
+        notified_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        rows = [(category, project_id, message, notified_at)]
+        if not isinstance(self.db, Database):
+            run_write(self.db, self._insert, rows)
+            return
+
+        future = self.db.write(self._insert, rows, wait=False)
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._on_written)
+
+    def _on_written(self, future: Future):
+        """コミット完了時の処理（内部メソッド）"""
+        with self._pending_lock:
+            self._pending.discard(future)
+        if future.exception() is not None:
+            print(f"Error writing notification history: {future.exception()}")
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        追加した通知履歴がすべてコミットされるまで待つ
+
+        Args:
+            timeout: 待つ最大秒数（省略時は完了まで待つ）
+        """
+        with self._pending_lock:
+            pending = list(self._pending)
+        wait_futures(pending, timeout)
+
+    def stop(self, timeout: float = 5.0):
+        """
+        残りのコミットを待つ（書き込み専用スレッドの停止前に呼ぶ）
+
+        Args:
+            timeout: 書き込みの完了を待つ秒数
+        """
+        self.flush(timeout)
+
+    def _insert(self, rows: List[Tuple]):
+        """まとめて INSERT（コミットは Database.write / run_write に任せる、内部メソッド）"""
+        self.db.executemany("""
+            INSERT INTO notification_history (category, project_id, message, notified_at)
+            VALUES (?, ?, ?, ?)
+        """, rows)
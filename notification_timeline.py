@@ -0,0 +1,240 @@
+"""
+Notification Timeline - 今後24時間の「スロットごとの想定プロジェクト・通知区分」の前計算
+"""
+
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pattern_learner import PatternLearner
+from slot_model import SLOT_MINUTES
+
+SLOT_DELTA = timedelta(minutes=SLOT_MINUTES)
+
+
+def classify_unusual_time(typical_hours: List[int], slot_typical: Optional[bool],
+                          now: datetime, morning_threshold_minutes: int,
+                          other_threshold_hours: int, deep_night_hour: int) -> Optional[str]:
+    """
+    作業中のプロジェクトが「いつもと違う時間」かを判定
+
+    Args:
+        typical_hours: 日タイプに応じた typical hours
+        slot_typical: 曜日×15分スロットでの判定結果（パターンがなければ None）
+        now: 判定する時刻
+        morning_threshold_minutes: 朝型プロジェクトの判定閾値（分）
+        other_threshold_hours: その他プロジェクトの判定閾値（時間）
+        deep_night_hour: 深夜判定の開始時刻
+
+    Returns:
+        'early_start', 'late_work', 'deep_night_praise' のいずれか、通常範囲内なら None
+    """
+    if not typical_hours:
+        return None
+
+    # 現在の時刻が通常パターンに含まれていれば何もしない
+    # 曜日×15分スロットのパターンがあればそちらで判定する
+    if slot_typical or (slot_typical is None and now.hour in typical_hours):
+        return None
+
+    min_typical = min(typical_hours)
+    max_typical = max(typical_hours)
+
+    # 朝型プロジェクト（通常9時以前に開始）の場合：30分単位で判定
+    if min_typical <= 9:
+        time_diff_minutes = (min_typical * 60) - (now.hour * 60 + now.minute)
+        if time_diff_minutes >= morning_threshold_minutes:
+            return 'early_start'
+
+    # その他のプロジェクト：2時間単位で判定
+    if now.hour < min_typical - other_threshold_hours:
+        return 'early_start'
+    if now.hour > max_typical + other_threshold_hours:
+        # 深夜作業
+        if now.hour >= deep_night_hour:
+            return 'deep_night_praise'
+        return 'late_work'
+    return None
+
+
+class NotificationTimeline:
+    """
+    学習結果から今後の各15分スロットについて
+    「日タイプ」「作業しているはずのプロジェクト」「プロジェクトごとの通知区分」を
+    1度だけ計算しておき、定期チェックでは配列を参照するだけにするクラス
+
+    朝型プロジェクトの判定は分単位のため、通知するかどうかは unusual_at() で
+    スロットに保存した typical hours を使って実際のチェック時刻で判定する
+    """
+
+    def __init__(self, start: datetime, slots: List[Dict], version: int,
+                 morning_threshold_minutes: int = 30, other_threshold_hours: int = 2,
+                 deep_night_hour: int = 22):
+        """
+        Args:
+            start: 最初のスロットの開始時刻
+            slots: スロットごとの計算結果
+            version: 作成時の PatternLearner.data_version
+            morning_threshold_minutes: 朝型プロジェクトの判定閾値（分）
+            other_threshold_hours: その他プロジェクトの判定閾値（時間）
+            deep_night_hour: 深夜判定の開始時刻
+        """
+        self.start = start
+        self.slots = slots
+        self.version = version
+        self.end = start + SLOT_DELTA * len(slots)
+        self.morning_threshold_minutes = morning_threshold_minutes
+        self.other_threshold_hours = other_threshold_hours
+        self.deep_night_hour = deep_night_hour
+
+    @classmethod
+    def build(cls, learner: PatternLearner, db: sqlite3.Connection, now: datetime,
+              hours: int = 24, morning_threshold_minutes: int = 30,
+              other_threshold_hours: int = 2, deep_night_hour: int = 22) -> 'NotificationTimeline':
+        """
+        現在時刻から hours 時間分のタイムラインを作成
+
+        Args:
+            learner: 学習済みの PatternLearner
+            db: SQLite データベース接続
+            now: 現在時刻（ローカル）
+            hours: 前計算する時間数
+            morning_threshold_minutes: 朝型プロジェクトの判定閾値（分）
+            other_threshold_hours: その他プロジェクトの判定閾値（時間）
+            deep_night_hour: 深夜判定の開始時刻
+
+        Returns:
+            NotificationTimeline
+        """
+        version = learner.data_version
+        start = now.replace(minute=now.minute - now.minute % SLOT_MINUTES,
+                            second=0, microsecond=0)
+
+        patterns = {}
+        for row in db.execute("""
+            SELECT project_id, project_name, weekday_typical_hours, weekend_typical_hours
+            FROM project_patterns
+        """):
+            patterns[row['project_id']] = {
+                'name': row['project_name'],
+                'weekday': json.loads(row['weekday_typical_hours'] or '[]'),
+                'weekend': json.loads(row['weekend_typical_hours'] or '[]'),
+            }
+
+        slots = []
+        slot_start = start
+        for _ in range(hours * 60 // SLOT_MINUTES):
+            day_type = learner.categorize_day(slot_start)
+            hours_key = 'weekend' if day_type in ['weekend', 'holiday'] else 'weekday'
+
+            # 判定に使う typical hours・スロットの判定結果と、スロット開始時点の通知区分
+            # （通知区分はチェック時刻の調整用。通知の判定は unusual_at() で行う）
+            typical = {}
+            unusual = {}
+            for project_id, pattern in patterns.items():
+                if not pattern[hours_key]:
+                    continue
+                slot_typical = learner.is_typical_time(project_id, slot_start)
+                typical[project_id] = (pattern[hours_key], slot_typical, pattern['name'])
+                category = classify_unusual_time(
+                    pattern[hours_key], slot_typical, slot_start, morning_threshold_minutes,
+                    other_threshold_hours, deep_night_hour
+                )
+                if category:
+                    unusual[project_id] = category
+
+            # 同じプロジェクトが続くスロットは最初のスロットの開始時刻を作業開始の想定時刻とする
+            expected = learner.get_expected_project_at_time(slot_start)
+            expected_since = slot_start
+            if slots and expected and slots[-1]['expected'] \
+                    and slots[-1]['expected']['project_id'] == expected['project_id']:
+                expected_since = slots[-1]['expected_since']
+
+            slots.append({
+                'start': slot_start,
+                'day_type': day_type,
+                'expected': expected,
+                'expected_since': expected_since,
+                'typical': typical,
+                'unusual': unusual,
+            })
+            slot_start += SLOT_DELTA
+
+        return cls(start, slots, version, morning_threshold_minutes,
+                   other_threshold_hours, deep_night_hour)
+
+    def is_current(self, now: datetime, version: int) -> bool:
+        """学習結果が変わっておらず、now がタイムラインの範囲内か"""
+        return version == self.version and self.start <= now < self.end
+
+    def slot_at(self, now: datetime) -> Dict:
+        """
+        時刻に対応するスロットを取得
+
+        Args:
+            now: 時刻（タイムラインの範囲内）
+
+        Returns:
+            {'start', 'day_type', 'expected', 'expected_since', 'typical', 'unusual'} の辞書
+        """
+        return self.slots[int((now - self.start) / SLOT_DELTA)]
+
+    def unusual_at(self, now: datetime, project_id: str) -> Optional[Tuple[str, str]]:
+        """
+        作業中のプロジェクトが now に「いつもと違う時間」か（実際の時刻で判定）
+
+        Args:
+            now: チェック時刻（タイムラインの範囲内）
+            project_id: 作業中のプロジェクトID
+
+        Returns:
+            (通知区分, プロジェクト名)、通常範囲内・パターン未学習なら None
+        """
+        typical = self.slot_at(now)['typical'].get(project_id)
+        if typical is None:
+            return None
+        hours, slot_typical, project_name = typical
+        category = classify_unusual_time(
+            hours, slot_typical, now, self.morning_threshold_minutes,
+            self.other_threshold_hours, self.deep_night_hour
+        )
+        return (category, project_name) if category else None
+
+    def next_expected_start(self, now: datetime) -> Optional[datetime]:
+        """
+        now より後で、想定プロジェクトが新しく始まる最初のスロットの開始時刻
+
+        Args:
+            now: 時刻（タイムラインの範囲内）
+
+        Returns:
+            作業開始の想定時刻、範囲内になければ None
+        """
+        index = int((now - self.start) / SLOT_DELTA)
+        for slot in self.slots[index + 1:]:
+            if slot['expected'] and slot['expected_since'] == slot['start']:
+                return slot['start']
+        return None
+
+    def next_change(self, now: datetime) -> Optional[datetime]:
+        """
+        想定プロジェクトか通知区分が now のスロットから変わる最初のスロットの開始時刻
+
+        Args:
+            now: 時刻（タイムラインの範囲内）
+
+        Returns:
+            変化するスロットの開始時刻、範囲内に変化がなければ None
+        """
+        index = int((now - self.start) / SLOT_DELTA)
+
+        def key(slot: Dict):
+            expected = slot['expected']
+            return (expected['project_id'] if expected else None, slot['unusual'])
+
+        current = key(self.slots[index])
+        for slot in self.slots[index + 1:]:
+            if key(slot) != current:
+                return slot['start']
+        return None
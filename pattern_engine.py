@@ -0,0 +1,199 @@
+"""
+Pattern Engine - NumPy によるベクトル化パターン学習エンジン
+"""
+
+import math
+import sqlite3
+from fractions import Fraction
+from typing import Dict, Iterable, List, Tuple
+
+from local_time import local_date_days_ago
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+
+HOURS_PER_DAY = 24
+DAY_TYPES = 2  # 0=平日, 1=休日/祝日
+
+# 平均作業時間の浮動小数点計算で、これより整数に近い場合は分数で計算し直す
+FLOOR_TOLERANCE = 1e-6
+
+
+def mean_hour_average(hour_totals: Iterable[Tuple[int, int]]) -> int:
+    """
+    時間帯ごとの平均作業時間（合計 / 件数）の平均を切り捨てた整数
+
+    分数で計算するため、加算の順序によらずどの学習処理でも同じ値になる
+
+    Args:
+        hour_totals: 時間帯ごとの (作業時間の合計, 件数)（件数0の時間帯は除外）
+
+    Returns:
+        平均作業時間（分）、対象の時間帯がなければ 0
+    """
+    averages = [Fraction(int(total), int(n)) for total, n in hour_totals if n > 0]
+    if not averages:
+        return 0
+    return math.floor(sum(averages) / len(averages))
+
+
+class NumpyPatternEngine:
+    """
+    work_daily_rollup を NumPy 配列に読み込み、全プロジェクトのパターンを一括計算するクラス
+
+    PatternLearner._learn_patterns_sql と同じ結果を返す
+    """
+
+    def __init__(self, pattern_threshold: float = 0.8, min_entries: int = 3):
+        """
+        Args:
+            pattern_threshold: 平均頻度に対する「typical hours」の閾値
+            min_entries: パターンとして扱う最小エントリー数
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is not installed")
+
+        self.pattern_threshold = pattern_threshold
+        self.min_entries = min_entries
+
+    def load_arrays(self, db: sqlite3.Connection, days: int) -> Tuple[List[str], List[str], dict]:
+        """
+        学習期間の work_daily_rollup を配列に読み込む
+
+        Args:
+            db: SQLite データベース接続
+            days: 学習期間（日数）
+
+        Returns:
+            (プロジェクトIDリスト, プロジェクト名リスト, 配列の辞書)
+            配列の辞書は 'project', 'day_type', 'hour', 'entries', 'minutes' を持つ
+        """
+        since = local_date_days_ago(days)
+
+        # sqlite3.Row の生成を避けるためタプルで取得
+        cursor = db.cursor()
+        cursor.row_factory = None
+
+        rows = cursor.execute("""
+            SELECT project_id, MAX(project_name), day_type, hour, SUM(entries), SUM(minutes)
+            FROM work_daily_rollup
+            WHERE date >= ?
+            GROUP BY project_id, day_type, hour
+        """, (since,)).fetchall()
+
+        if not rows:
+            return [], [], {}
+
+        index = {}
+        project_names = []
+        for pid, name, *_ in rows:
+            if pid not in index:
+                index[pid] = len(project_names)
+                project_names.append(name)
+            elif name > project_names[index[pid]]:
+                project_names[index[pid]] = name  # SQL側の MAX(project_name) に揃える
+        project_ids = list(index)
+
+        columns = np.array([row[2:] for row in rows], dtype=np.int64)
+        arrays = {
+            'project': np.array([index[row[0]] for row in rows], dtype=np.int64),
+            'day_type': columns[:, 0],
+            'hour': columns[:, 1],
+            'entries': columns[:, 2],
+            'minutes': columns[:, 3],
+        }
+        return project_ids, project_names, arrays
+
+    def compute(self, n_projects: int, arrays: dict) -> dict:
+        """
+        時間帯ヒストグラム・typical hours・平均作業時間をベクトル演算で計算
+
+        Args:
+            n_projects: プロジェクト数
+            arrays: load_arrays() が返す配列の辞書
+
+        Returns:
+            (プロジェクト, 日タイプ) 単位の計算結果配列の辞書
+        """
+        shape = (n_projects, DAY_TYPES, HOURS_PER_DAY)
+        size = n_projects * DAY_TYPES * HOURS_PER_DAY
+
+        # (プロジェクト, 日タイプ, 時間) を1次元のビン番号に変換
+        bins = (arrays['project'] * DAY_TYPES + arrays['day_type']) * HOURS_PER_DAY \
+            + arrays['hour']
+
+        counts = np.bincount(bins, weights=arrays['entries'], minlength=size).reshape(shape)
+        duration_sum = np.bincount(bins, weights=arrays['minutes'], minlength=size).reshape(shape)
+
+        total_entries = counts.sum(axis=2)
+        active_hours = (counts > 0).sum(axis=2)
+
+        # 平均頻度 × 閾値以上の時間帯を「typical hours」とする
+        avg_frequency = np.divide(total_entries, active_hours,
+                                  out=np.zeros(total_entries.shape), where=active_hours > 0)
+        threshold = avg_frequency * self.pattern_threshold
+        typical = (counts > 0) & (counts >= threshold[:, :, np.newaxis])
+
+        return {
+            'counts': counts,
+            'duration_sum': duration_sum,
+            'total_entries': total_entries,
+            'typical': typical,
+            'avg_duration': self._mean_hour_averages(counts, duration_sum, active_hours),
+        }
+
+    def _mean_hour_averages(self, counts, duration_sum, active_hours):
+        """
+        (プロジェクト, 日タイプ) ごとの mean_hour_average をベクトル演算で計算（内部メソッド）
+
+        浮動小数点で計算し、整数に近く切り捨てが丸め誤差で変わりうるセルだけ
+        mean_hour_average で分数計算し直す（結果は SQL 側と常に一致する）
+        """
+        hour_avg = np.divide(duration_sum, counts,
+                             out=np.zeros(counts.shape), where=counts > 0)
+        mean = np.divide(hour_avg.sum(axis=2), active_hours,
+                         out=np.zeros(active_hours.shape), where=active_hours > 0)
+        result = np.floor(mean).astype(np.int64)
+
+        for idx, day_type in zip(*np.nonzero(np.abs(mean - np.rint(mean)) < FLOOR_TOLERANCE)):
+            result[idx, day_type] = mean_hour_average(zip(
+                duration_sum[idx, day_type], counts[idx, day_type]
+            ))
+        return result
+
+    def learn(self, db: sqlite3.Connection, days: int) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+        """
+        平日・休日のパターンを一括学習
+
+        Args:
+            db: SQLite データベース接続
+            days: 学習期間（日数）
+
+        Returns:
+            (平日パターン辞書, 休日パターン辞書)
+            各辞書の形式は PatternLearner._learn_patterns_sql と同じ
+        """
+        project_ids, project_names, arrays = self.load_arrays(db, days)
+        if not project_ids:
+            return {}, {}
+
+        result = self.compute(len(project_ids), arrays)
+
+        day_results = []
+        for day_type in range(DAY_TYPES):
+            eligible = np.flatnonzero(result['total_entries'][:, day_type] >= self.min_entries)
+            patterns = {}
+            for idx in eligible:
+                patterns[project_ids[idx]] = {
+                    'name': project_names[idx],
+                    'typical_hours': np.flatnonzero(result['typical'][idx, day_type]).tolist(),
+                    'avg_duration': int(result['avg_duration'][idx, day_type])
+                }
+            day_results.append(patterns)
+
+        return day_results[0], day_results[1]
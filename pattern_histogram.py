@@ -0,0 +1,141 @@
+"""
+Pattern Histogram - 指数減衰する曜日×時間ヒストグラムのBLOB表現
+"""
+
+import math
+from array import array
+from typing import List, Optional
+
+DAYS_PER_WEEK = 7
+HOURS_PER_DAY = 24
+HISTOGRAM_SLOTS = DAYS_PER_WEEK * HOURS_PER_DAY  # 7×24 = 168
+HISTOGRAM_TYPECODE = 'd'
+
+
+def new_histogram() -> array:
+    """全スロットが0の空ヒストグラムを作成"""
+    return array(HISTOGRAM_TYPECODE, bytes(HISTOGRAM_SLOTS * 8))
+
+
+def pack_histogram(histogram: array) -> bytes:
+    """
+    ヒストグラムをBLOBに変換
+
+    Args:
+        histogram: 7×24 の減衰カウント
+
+    Returns:
+        DBに保存するバイト列
+    """
+    return histogram.tobytes()
+
+
+def unpack_histogram(blob: Optional[bytes]) -> Optional[memoryview]:
+    """
+    BLOBをコピーせずに float 配列として読み込む
+
+    Args:
+        blob: pack_histogram() で作成したバイト列
+
+    Returns:
+        7×24 の減衰カウント（読み取り専用）、未作成の場合は None
+    """
+    if not blob or len(blob) != HISTOGRAM_SLOTS * 8:
+        return None
+    return memoryview(blob).cast(HISTOGRAM_TYPECODE)
+
+
+def slot_index(day_of_week: int, hour: int) -> int:
+    """曜日（0=月）と時刻からスロット番号を計算"""
+    return day_of_week * HOURS_PER_DAY + hour
+
+
+def decay_weight(age_seconds: float, half_life_days: float) -> float:
+    """
+    経過時間に対する減衰係数を計算
+
+    Args:
+        age_seconds: 経過秒数
+        half_life_days: 半減期（日数）
+
+    Returns:
+        0〜1 の係数（半減期ごとに 1/2）
+    """
+    return 0.5 ** (max(age_seconds, 0.0) / (half_life_days * 86400))
+
+
+def decay_histogram(histogram: array, age_seconds: float, half_life_days: float) -> None:
+    """
+    ヒストグラム全体を経過時間ぶん減衰させる（インプレース）
+
+    Args:
+        histogram: 7×24 の減衰カウント
+        age_seconds: 前回の基準時刻からの経過秒数
+        half_life_days: 半減期（日数）
+    """
+    factor = decay_weight(age_seconds, half_life_days)
+    for i in range(HISTOGRAM_SLOTS):
+        histogram[i] *= factor
+
+
+def day_type_total(histogram, is_weekend: bool, hour: int) -> float:
+    """
+    時間帯の減衰カウントを日タイプ（月〜金 / 土日）の曜日で合計
+
+    Args:
+        histogram: 7×24 の減衰カウント
+        is_weekend: True=土日の合計, False=月〜金の合計
+        hour: 時刻（0-23）
+
+    Returns:
+        減衰カウントの合計
+    """
+    days = range(5, 7) if is_weekend else range(0, 5)
+    return sum(histogram[slot_index(day, hour)] for day in days)
+
+
+def histogram_typical_hours(histogram, is_weekend: bool, pattern_threshold: float) -> List[int]:
+    """
+    減衰カウントから「typical hours」を求める
+
+    学習期間の頻度と同じく、作業のある時間帯の平均 × 閾値以上の時間帯とする
+    （古い作業ほど小さく数えるため、期間の境目で急に外れない）
+
+    Args:
+        histogram: 7×24 の減衰カウント
+        is_weekend: True=土日, False=月〜金
+        pattern_threshold: 平均に対する閾値
+
+    Returns:
+        時刻（0-23）の昇順リスト（作業がない場合は空）
+    """
+    totals = [day_type_total(histogram, is_weekend, hour) for hour in range(HOURS_PER_DAY)]
+    active = [total for total in totals if total > 0]
+    if not active:
+        return []
+    threshold = sum(active) / len(active) * pattern_threshold
+    return [hour for hour, total in enumerate(totals) if total > 0 and total >= threshold]
+
+
+def histogram_score(histogram, is_weekend: bool, hour: int,
+                    histogram_epoch: float, half_life_days: float) -> float:
+    """
+    時間帯のスコアを計算
+
+    基準時刻の異なるプロジェクト同士でも比較できるよう、
+    log2(減衰カウント) + 基準時刻 / 半減期 で表す
+
+    Args:
+        histogram: 7×24 の減衰カウント
+        is_weekend: True=土日の合計, False=月〜金の合計
+        hour: 時刻（0-23）
+        histogram_epoch: ヒストグラムの基準時刻（UNIX秒）
+        half_life_days: 半減期（日数）
+
+    Returns:
+        大きいほど優先されるスコア
+    """
+    total = day_type_total(histogram, is_weekend, hour)
+    if total <= 0:
+        return -math.inf
+    return math.log2(total) + histogram_epoch / (half_life_days * 86400)
@@ -3,35 +3,75 @@ Pattern Learner - 作業パターンの学習モジュール
 """
 
 import json
+import math
 import sqlite3
+import time
+from array import array
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-try:
-    import jpholiday
-except ImportError:
-    print("Warning: jpholiday not installed. Holiday detection will be limited.")
-    jpholiday = None
+from activity_watermark import ActivityWatermark
+from database import run_write
+from daily_rollup import add_to_rollup, rebuild_rollup, remove_from_rollup
+from holiday_calendar import HolidayCalendar
+from local_time import epoch_to_local, local_date_days_ago, local_now, to_epoch
+from pattern_histogram import (
+    decay_histogram, decay_weight, histogram_score, histogram_typical_hours, new_histogram,
+    pack_histogram, slot_index, unpack_histogram
+)
+from slot_model import SlotPatternModel, pack_bits, unpack_bits
+from pattern_engine import NumpyPatternEngine, NUMPY_AVAILABLE, mean_hour_average
 
 
 class PatternLearner:
     """作業パターンを学習するクラス"""
 
-    def __init__(self, db_connection: sqlite3.Connection, toggl_client=None):
+    def __init__(self, db_connection: sqlite3.Connection, toggl_client=None,
+                 engine: str = 'sql', holiday_calendar: Optional[HolidayCalendar] = None,
+                 half_life_days: float = 14.0):
         """
         Args:
             db_connection: SQLite データベース接続
             toggl_client: Toggl API クライアント
+            engine: パターン学習エンジン ('sql' または 'numpy')
+            holiday_calendar: 休日カレンダー（省略時は会社独自の休業日なし）
+            half_life_days: 曜日×時間ヒストグラムの半減期（日数）
         """
         self.db = db_connection
         self.db.row_factory = sqlite3.Row
         self.toggl = toggl_client
+        self.calendar = holiday_calendar or HolidayCalendar()
         self.learning_period_days = 14
         self.pattern_threshold = 0.8  # 80%以上の頻度で「通常パターン」
+        self.half_life_days = half_life_days
+
+        if engine == 'numpy' and not NUMPY_AVAILABLE:
+            print("Warning: numpy not installed. Falling back to SQL pattern engine.")
+            engine = 'sql'
+        self.engine = engine
+
+        # 時刻 → プロジェクトの検索インデックス（学習時に再構築）
+        self._hour_index = None
+
+        # (プロジェクトID, 休日フラグ) ごとの時間帯別集計値（タイマー停止時にオンライン更新）
+        self._stats: Dict[tuple, Dict] = {}
+        # _stats を読み込んだ学習期間の開始日（日付が変わったら読み直す）
+        self._stats_since: Optional[str] = None
+
+        # 曜日×15分スロットのパターン（曜日ごとの違いを見るため長めの期間で学習）
+        self.slot_learning_weeks = 8
+        self.slot_model = SlotPatternModel()
+        self._slot_model_loaded = False
+
+        # 履歴・パターンを更新するたびに増える番号（スケジューラーの前計算の再作成に使う）
+        self.data_version = 0
+
+        # 最終作業日時（取り込みのたびに進め、休暇判定に使う）
+        self.activity = ActivityWatermark(self.db)
 
     def is_holiday(self, date: datetime) -> bool:
         """
-        日本の祝日、お盆、正月を判定
+        日本の祝日、お盆、正月、会社独自の休業日を判定
 
         Args:
             date: 判定する日付
@@ -39,20 +79,7 @@ class PatternLearner:
         Returns:
             祝日・休日の場合True
         """
-        # jpholiday ライブラリで祝日判定
-        if jpholiday and jpholiday.is_holiday(date):
-            return True
-
-        # お盆: 8月13-16日
-        if date.month == 8 and 13 <= date.day <= 16:
-            return True
-
-        # 正月: 12月29日-1月3日
-        if (date.month == 12 and date.day >= 29) or \
-           (date.month == 1 and date.day <= 3):
-            return True
-
-        return False
+        return self.calendar.is_holiday(date)
 
     def categorize_day(self, date: datetime) -> str:
         """
@@ -64,11 +91,7 @@ class PatternLearner:
         Returns:
             'weekday', 'weekend', 'holiday' のいずれか
         """
-        if date.weekday() >= 5:  # 土日
-            return 'weekend'
-        if self.is_holiday(date):
-            return 'holiday'
-        return 'weekday'
+        return self.calendar.categorize_day(date)
 
     def fetch_and_store_history(self) -> int:
         """
@@ -96,51 +119,400 @@ class PatternLearner:
             print(f"Error fetching from Toggl API: {e}")
             return 0
 
-        # 既存データをクリア（再学習）
-        self.db.execute("""
-            DELETE FROM work_history
-            WHERE start_time >= datetime(?, '-14 days')
-        """, (end_date.isoformat(),))
-
-        count = 0
-        for entry in entries:
-            if not entry.get('start'):
-                continue
+        start_epoch = int(start_date.timestamp())
 
-            start = datetime.fromisoformat(entry['start'].replace('Z', '+00:00'))
-            end = None
-            if entry.get('stop'):
-                end = datetime.fromisoformat(entry['stop'].replace('Z', '+00:00'))
+        def store() -> int:
+            # 既存データをクリア（再学習）
+            self.db.execute("DELETE FROM work_history WHERE start_epoch >= ?", (start_epoch,))
+            # 残った履歴から同じ期間の集計を作り直し、取得したエントリーを加算していく
+            rebuild_rollup(self.db, since_date=epoch_to_local(start_epoch).date().isoformat())
+            return sum(1 for entry in entries if self.store_entry(entry))
 
-            day_category = self.categorize_day(start)
-            duration = entry.get('duration', 0)
-            if duration > 0:
-                duration_minutes = duration // 60
-            else:
-                duration_minutes = 0
-
-            self.db.execute("""
-                INSERT INTO work_history
-                (project_id, project_name, start_time, end_time,
-                 duration_minutes, day_of_week, is_weekend, is_holiday, hour_of_day)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                str(entry.get('project_id', 'unknown')),
-                entry.get('project_name', entry.get('description', 'Untitled')),
-                start.isoformat(),
-                end.isoformat() if end else None,
-                duration_minutes,
-                start.weekday(),
-                1 if day_category == 'weekend' else 0,
-                1 if day_category == 'holiday' else 0,
-                start.hour
-            ))
-            count += 1
+        count = run_write(self.db, store)
 
-        self.db.commit()
+        self._stats = {}  # 全件を取り直したのでオンライン集計も読み直す
+        self.data_version += 1
         print(f"Stored {count} work history entries")
         return count
 
+    def store_entry(self, entry: dict, project_name: Optional[str] = None) -> Optional[Dict]:
+        """
+        Togglの時間エントリーを work_history と集計テーブルに保存（コミットは呼び出し側）
+
+        パターンは更新しない（まとめて取り込んだ後に learn_project_patterns で学習し直す）
+
+        Args:
+            entry: Toggl API の時間エントリー
+            project_name: プロジェクト名（省略時はエントリーから取得）
+
+        Returns:
+            保存した行の情報、開始時刻がない場合・計測中の場合・取り込み済みの場合は None
+        """
+        if not entry.get('start'):
+            return None
+        # 計測中のエントリー（duration が負）は保存しない
+        # （保存すると停止時の record_time_entry が取り込み済みとして無視されるため）
+        if (entry.get('duration') or 0) < 0:
+            return None
+
+        start = datetime.fromisoformat(entry['start'].replace('Z', '+00:00'))
+        end = None
+        if entry.get('stop'):
+            end = datetime.fromisoformat(entry['stop'].replace('Z', '+00:00'))
+
+        # 範囲検索用の UNIX秒と、曜日・時間帯・日タイプの判定に使うローカル時刻
+        start_epoch = to_epoch(start)
+        local_start = epoch_to_local(start_epoch)
+        day_category = self.categorize_day(local_start)
+        duration = entry.get('duration', 0)
+        if duration > 0:
+            duration_minutes = duration // 60
+        else:
+            duration_minutes = 0
+
+        row = {
+            'project_id': str(entry.get('project_id', 'unknown')),
+            'project_name': project_name or entry.get('project_name',
+                                                      entry.get('description', 'Untitled')),
+            'start_time': start.isoformat(),
+            'start_epoch': start_epoch,
+            'local_date': local_start.date().isoformat(),
+            'duration_minutes': duration_minutes,
+            'is_weekend': 1 if day_category in ['weekend', 'holiday'] else 0,
+            'day_of_week': local_start.weekday(),
+            'hour_of_day': local_start.hour
+        }
+
+        # 同じ Toggl エントリーIDの行があれば保存しない
+        cursor = self.db.execute("""
+            INSERT OR IGNORE INTO work_history
+            (project_id, project_name, start_time, end_time,
+             duration_minutes, day_of_week, is_weekend, is_holiday, hour_of_day,
+             toggl_entry_id, start_epoch, end_epoch, local_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            row['project_id'],
+            row['project_name'],
+            row['start_time'],
+            end.isoformat() if end else None,
+            duration_minutes,
+            row['day_of_week'],
+            1 if day_category == 'weekend' else 0,
+            1 if day_category == 'holiday' else 0,
+            row['hour_of_day'],
+            entry.get('id'),
+            start_epoch,
+            to_epoch(end) if end else None,
+            row['local_date']
+        ))
+        if cursor.rowcount == 0:
+            return None
+
+        add_to_rollup(self.db, row['project_id'], row['project_name'], local_start,
+                      row['is_weekend'], duration_minutes, start_epoch)
+        self.activity.touch(end or start)
+        return row
+
+    def record_time_entry(self, entry: dict, project_name: Optional[str] = None) -> Optional[Dict]:
+        """
+        停止したタイマーを履歴に追加し、そのプロジェクトのパターンを即時更新
+
+        全件の再学習は行わず、プロジェクトごとの時間帯カウンターと
+        作業時間の集計値だけを更新する
+
+        Args:
+            entry: 停止した Toggl の時間エントリー
+            project_name: プロジェクト名（省略時はエントリーから取得）
+
+        Returns:
+            更新後のプロジェクトのパターン、保存できなかった場合は None
+        """
+        return run_write(self.db, self._record_time_entry, entry, project_name)
+
+    def _record_time_entry(self, entry: dict, project_name: Optional[str]) -> Optional[Dict]:
+        """record_time_entry の本体（書き込み専用スレッドで実行、内部メソッド）"""
+        project_id = str(entry.get('project_id', 'unknown'))
+
+        # 追加前の集計値を読み込んでおく（二重カウントを避けるため）
+        since = self._hour_stats_since()
+        weekday_stats = self._get_hour_stats(project_id, is_weekend=False)
+        weekend_stats = self._get_hour_stats(project_id, is_weekend=True)
+
+        row = self.store_entry(entry, project_name)
+        if row is None:
+            return None
+
+        # 時間帯カウンターと作業時間の集計値を更新（学習期間より前のエントリーは数えない）
+        stats = weekend_stats if row['is_weekend'] else weekday_stats
+        stats['name'] = row['project_name']
+        if row['local_date'] >= since:
+            hour = row['hour_of_day']
+            stats['hours'][hour] = stats['hours'].get(hour, 0) + 1
+            stats['duration_sum'][hour] = stats['duration_sum'].get(hour, 0) + row['duration_minutes']
+            stats['duration_n'][hour] = stats['duration_n'].get(hour, 0) + 1
+
+        # 曜日×時間ヒストグラムを減衰させてから今回のエントリーを加算
+        histogram, histogram_epoch = self._update_histogram(project_id, row)
+
+        return self._save_single_project(project_id, weekday_stats, weekend_stats,
+                                         histogram, histogram_epoch)
+
+    def remove_time_entry(self, toggl_entry_id: int) -> Optional[Dict]:
+        """
+        削除・編集された Toggl エントリーを履歴から取り除き、そのプロジェクトのパターンを更新
+
+        Args:
+            toggl_entry_id: Toggl の時間エントリーID
+
+        Returns:
+            更新後のプロジェクトのパターン、該当する行がなかった場合は None
+        """
+        return run_write(self.db, self._remove_time_entry, toggl_entry_id)
+
+    def _remove_time_entry(self, toggl_entry_id: int) -> Optional[Dict]:
+        """remove_time_entry の本体（書き込み専用スレッドで実行、内部メソッド）"""
+        row = self.db.execute("""
+            SELECT id, project_id, local_date, duration_minutes, hour_of_day
+            FROM work_history WHERE toggl_entry_id = ?
+        """, (toggl_entry_id,)).fetchone()
+        if row is None:
+            return None
+
+        project_id = row['project_id']
+        self.db.execute("DELETE FROM work_history WHERE id = ?", (row['id'],))
+        remove_from_rollup(self.db, project_id, row['local_date'], row['hour_of_day'],
+                           row['duration_minutes'])
+
+        # 差し引いた後の集計値を読み直す（ヒストグラムは減衰済みのため作り直す）
+        self._stats.pop((project_id, 0), None)
+        self._stats.pop((project_id, 1), None)
+        weekday_stats = self._get_hour_stats(project_id, is_weekend=False)
+        weekend_stats = self._get_hour_stats(project_id, is_weekend=True)
+        histograms, histogram_epoch = self._compute_histograms(project_id)
+
+        return self._save_single_project(project_id, weekday_stats, weekend_stats,
+                                         histograms.get(project_id, new_histogram()),
+                                         histogram_epoch)
+
+    def _save_single_project(self, project_id: str, weekday_stats: Dict, weekend_stats: Dict,
+                             histogram: array, histogram_epoch: float) -> Dict:
+        """
+        1プロジェクト分の集計値からパターンを保存し、検索インデックスを更新（内部メソッド）
+
+        Returns:
+            更新後のプロジェクトのパターン
+        """
+        weekday = self._with_histogram_hours(self._summarize_hour_stats(weekday_stats) or {},
+                                             histogram, is_weekend=False)
+        weekend = self._with_histogram_hours(self._summarize_hour_stats(weekend_stats) or {},
+                                             histogram, is_weekend=True)
+
+        last_worked = self._get_last_worked_at(project_id)
+
+        result = self._save_project_patterns([
+            (project_id, weekday, weekend, last_worked.get(project_id), histogram)
+        ], histogram_epoch)[project_id]
+        self._rebuild_hour_index(
+            {project_id},
+            {project_id: weekday} if weekday else {},
+            {project_id: weekend} if weekend else {},
+            {project_id: histogram}, histogram_epoch
+        )
+
+        self._learn_slot_patterns(project_id)
+
+        self.db.commit()
+        self._hour_index = None  # 次回検索時にメモリへ再読み込み
+        self.data_version += 1
+        return result
+
+    def _with_histogram_hours(self, pattern: Dict, histogram: Optional[array],
+                              is_weekend: bool) -> Dict:
+        """
+        パターンの typical hours を減衰ヒストグラムから求め直す（内部メソッド）
+
+        パターンとして扱うか（学習期間の件数）と平均作業時間は学習期間の集計のまま使う。
+        ヒストグラムがない・その日タイプの曜日に作業がない場合（平日の祝日だけの休日パターンなど）は
+        学習期間の typical hours を使う
+
+        Args:
+            pattern: 学習期間の集計から求めたパターン（未学習なら空の辞書）
+            histogram: 7×24 の減衰カウント
+            is_weekend: True=休日のパターン, False=平日のパターン
+
+        Returns:
+            typical hours を置き換えたパターン
+        """
+        if not pattern or histogram is None:
+            return pattern
+        hours = histogram_typical_hours(histogram, is_weekend, self.pattern_threshold)
+        if not hours:
+            return pattern
+        return dict(pattern, typical_hours=hours)
+
+    def _update_histogram(self, project_id: str, row: Dict) -> Tuple[array, float]:
+        """
+        保存済みヒストグラムに1エントリーを加算（内部メソッド）
+
+        Args:
+            project_id: プロジェクトID
+            row: store_entry() が返した行の情報
+
+        Returns:
+            (更新後のヒストグラム, 基準時刻のUNIX秒)
+        """
+        now = time.time()
+        stored = self.db.execute("""
+            SELECT hour_histogram, histogram_epoch FROM project_patterns
+            WHERE project_id = ?
+        """, (project_id,)).fetchone()
+
+        view = unpack_histogram(stored['hour_histogram']) if stored else None
+        if view is None or stored['histogram_epoch'] is None:
+            # 未作成の場合は履歴全体から作り直す（今回のエントリーも含まれる）
+            histograms, epoch = self._compute_histograms(project_id)
+            return histograms.get(project_id, new_histogram()), epoch
+
+        histogram = array(view.format, view)
+        decay_histogram(histogram, now - stored['histogram_epoch'], self.half_life_days)
+
+        histogram[slot_index(row['day_of_week'], row['hour_of_day'])] += decay_weight(
+            now - row['start_epoch'], self.half_life_days
+        )
+        return histogram, now
+
+    def _compute_histograms(self, project_id: Optional[str] = None) -> Tuple[Dict[str, array], float]:
+        """
+        履歴全体から指数減衰した曜日×時間ヒストグラムを計算（内部メソッド）
+
+        Args:
+            project_id: 対象プロジェクト（省略時は全プロジェクト）
+
+        Returns:
+            (プロジェクトIDをキーとしたヒストグラム, 基準時刻のUNIX秒)
+        """
+        now = time.time()
+
+        # 日付×時間の集計ごとに、その時間帯の中央の経過時間で重み付けする
+        # （集計の日付・時間はローカル時刻のため、現在時刻もローカル時刻で渡す）
+        local_now_text = local_now().isoformat(sep=' ')
+        query = """
+            SELECT
+                project_id,
+                (CAST(strftime('%w', date) AS INTEGER) + 6) % 7 as day_of_week,
+                hour as hour_of_day,
+                (julianday(?) - julianday(date)) * 24 - hour - 0.5 as age_hours,
+                entries as frequency
+            FROM work_daily_rollup
+            {where}
+        """
+        if project_id is None:
+            rows = self.db.execute(query.format(where=''), (local_now_text,)).fetchall()
+        else:
+            rows = self.db.execute(query.format(where='WHERE project_id = ?'),
+                                   (local_now_text, project_id)).fetchall()
+
+        histograms = {}
+        for row in rows:
+            histogram = histograms.get(row['project_id'])
+            if histogram is None:
+                histogram = histograms[row['project_id']] = new_histogram()
+            weight = decay_weight(row['age_hours'] * 3600, self.half_life_days)
+            histogram[slot_index(row['day_of_week'], row['hour_of_day'])] += \
+                row['frequency'] * weight
+
+        return histograms, now
+
+    def get_project_name(self, project_id: str) -> Optional[str]:
+        """
+        学習済みパターンに記録したプロジェクト名を取得
+
+        Args:
+            project_id: プロジェクトID
+
+        Returns:
+            プロジェクト名、未学習の場合は None
+        """
+        row = self.db.execute("""
+            SELECT project_name FROM project_patterns
+            WHERE project_id = ?
+        """, (str(project_id),)).fetchone()
+        return row['project_name'] if row else None
+
+    def get_hour_histogram(self, project_id: str) -> Optional[memoryview]:
+        """
+        プロジェクトの曜日×時間ヒストグラムを取得
+
+        Args:
+            project_id: プロジェクトID
+
+        Returns:
+            曜日（0=月）× 24時間 の減衰カウント（長さ168の読み取り専用配列）、
+            未学習の場合は None
+        """
+        row = self.db.execute("""
+            SELECT hour_histogram FROM project_patterns
+            WHERE project_id = ?
+        """, (str(project_id),)).fetchone()
+
+        return unpack_histogram(row['hour_histogram']) if row else None
+
+    def _hour_stats_since(self) -> str:
+        """
+        オンライン集計値の学習期間の開始日（ローカル日付、内部メソッド）
+
+        日付が変わって期間外になった履歴を数えたままにしないよう、
+        開始日が変わったら集計値を破棄して集計テーブルから読み直させる
+
+        Returns:
+            YYYY-MM-DD
+        """
+        since = local_date_days_ago(self.learning_period_days)
+        if since != self._stats_since:
+            self._stats = {}
+            self._stats_since = since
+        return since
+
+    def _get_hour_stats(self, project_id: str, is_weekend: bool) -> Dict:
+        """
+        プロジェクトの時間帯別集計値を取得（内部メソッド）
+
+        メモリ上になければ学習期間の履歴から1度だけ読み込む
+
+        Args:
+            project_id: プロジェクトID
+            is_weekend: True=休日/祝日, False=平日
+
+        Returns:
+            時間帯ごとの頻度・作業時間の合計・件数を持つ集計値
+        """
+        since = self._hour_stats_since()
+        key = (project_id, 1 if is_weekend else 0)
+        stats = self._stats.get(key)
+        if stats is not None:
+            return stats
+
+        rows = self.db.execute("""
+            SELECT
+                MAX(project_name) as project_name,
+                hour as hour_of_day,
+                SUM(entries) as frequency,
+                SUM(minutes) as duration_sum,
+                SUM(entries) as duration_n
+            FROM work_daily_rollup
+            WHERE project_id = ?
+                AND day_type = ?
+                AND date >= ?
+            GROUP BY hour
+        """, (project_id, key[1], since)).fetchall()
+
+        stats = self._new_hour_stats(rows[0]['project_name'] if rows else None)
+        for row in rows:
+            self._add_hour_stats_row(stats, row)
+
+        self._stats[key] = stats
+        return stats
+
     def learn_project_patterns(self) -> Dict[str, dict]:
         """
         プロジェクトごとのパターンを学習
@@ -150,50 +522,88 @@ class PatternLearner:
         """
         print("Learning project patterns...")
 
-        # 平日のパターンを取得
-        weekday_data = self._learn_day_type_patterns(is_weekend=False)
+        # オンライン更新用の集計値は学習結果から作り直す
+        self._stats = {}
+
+        if self.engine == 'numpy':
+            # 平日・休日のパターンをベクトル演算で一括取得
+            weekday_data, weekend_data = NumpyPatternEngine(self.pattern_threshold).learn(
+                self.db, self.learning_period_days
+            )
+        else:
+            # 平日・休日のパターンをウィンドウ関数で一括取得
+            weekday_data, weekend_data = self._learn_patterns_sql()
+
+        # 最終作業日時と曜日×時間ヒストグラムを全プロジェクト分まとめて取得
+        last_worked = self._get_last_worked_at()
+        histograms, histogram_epoch = self._compute_histograms()
+
+        # typical hours は学習期間で区切らず、減衰ヒストグラムから求める
+        weekday_data = {pid: self._with_histogram_hours(pattern, histograms.get(pid), False)
+                        for pid, pattern in weekday_data.items()}
+        weekend_data = {pid: self._with_histogram_hours(pattern, histograms.get(pid), True)
+                        for pid, pattern in weekend_data.items()}
+
+        # 結果をマージしてDBに一括保存（読み込みは終わっているので書き込みだけをまとめる）
+        all_projects = set(weekday_data.keys()) | set(weekend_data.keys())
 
-        # 休日のパターンを取得
-        weekend_data = self._learn_day_type_patterns(is_weekend=True)
+        def save() -> Dict[str, dict]:
+            results = self._save_project_patterns([
+                (
+                    project_id,
+                    weekday_data.get(project_id, {}),
+                    weekend_data.get(project_id, {}),
+                    last_worked.get(project_id),
+                    histograms.get(project_id)
+                )
+                for project_id in all_projects
+            ], histogram_epoch)
+
+            # 時刻 → プロジェクトの検索インデックスを再構築
+            self._rebuild_hour_index(all_projects, weekday_data, weekend_data,
+                                     histograms, histogram_epoch)
+
+            # 曜日×15分スロットのパターンを学習
+            self._learn_slot_patterns()
+            return results
+
+        results = run_write(self.db, save)
+        self._hour_index = None  # 次回検索時にメモリへ再読み込み
+        self.data_version += 1
+        print(f"Learned patterns for {len(results)} projects")
+        return results
 
-        # 結果をマージしてDBに保存
-        all_projects = set(weekday_data.keys()) | set(weekend_data.keys())
-        results = {}
+    def _save_project_patterns(self, patterns: List[Tuple], histogram_epoch: float) -> Dict[str, dict]:
+        """
+        プロジェクトのパターンを project_patterns に一括保存（内部メソッド）
 
-        for project_id in all_projects:
-            weekday = weekday_data.get(project_id, {})
-            weekend = weekend_data.get(project_id, {})
+        Args:
+            patterns: (プロジェクトID, 平日のパターン, 休日のパターン, 最終作業日時,
+                       曜日×時間ヒストグラム) のリスト。未学習のパターンは空の辞書
+            histogram_epoch: ヒストグラムの基準時刻（UNIX秒）
 
+        Returns:
+            プロジェクトIDをキーとした保存済み学習結果の辞書
+        """
+        results = {}
+        rows = []
+        for project_id, weekday, weekend, last_worked_at, histogram in patterns:
             project_name = weekday.get('name') or weekend.get('name', 'Unknown')
             weekday_hours = weekday.get('typical_hours', [])
             weekend_hours = weekend.get('typical_hours', [])
             weekday_avg = weekday.get('avg_duration', 0)
             weekend_avg = weekend.get('avg_duration', 0)
 
-            # 最終作業日時を取得
-            last_worked = self.db.execute("""
-                SELECT MAX(start_time) as last_time
-                FROM work_history
-                WHERE project_id = ?
-            """, (project_id,)).fetchone()
-
-            last_worked_at = last_worked['last_time'] if last_worked else None
-
-            # DBに保存
-            self.db.execute("""
-                INSERT OR REPLACE INTO project_patterns
-                (project_id, project_name, weekday_typical_hours, weekend_typical_hours,
-                 weekday_avg_duration_minutes, weekend_avg_duration_minutes,
-                 last_worked_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
-            """, (
+            rows.append((
                 project_id,
                 project_name,
                 json.dumps(sorted(weekday_hours)),
                 json.dumps(sorted(weekend_hours)),
                 weekday_avg,
                 weekend_avg,
-                last_worked_at
+                last_worked_at,
+                pack_histogram(histogram) if histogram is not None else None,
+                histogram_epoch if histogram is not None else None
             ))
 
             results[project_id] = {
@@ -204,76 +614,358 @@ class PatternLearner:
                 'weekend_avg': weekend_avg
             }
 
-        self.db.commit()
-        print(f"Learned patterns for {len(results)} projects")
+        # DBに保存
+        self.db.executemany("""
+            INSERT OR REPLACE INTO project_patterns
+            (project_id, project_name, weekday_typical_hours, weekend_typical_hours,
+             weekday_avg_duration_minutes, weekend_avg_duration_minutes,
+             last_worked_at, hour_histogram, histogram_epoch, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        """, rows)
+
         return results
 
-    def _learn_day_type_patterns(self, is_weekend: bool) -> Dict[str, dict]:
+    def _get_last_worked_at(self, project_id: Optional[str] = None) -> Dict[str, str]:
         """
-        平日または休日のパターンを学習（内部メソッド）
+        プロジェクトごとの最終作業日時を取得（内部メソッド）
 
         Args:
-            is_weekend: True=休日/祝日, False=平日
+            project_id: 対象プロジェクト（省略時は全プロジェクト）
+
+        Returns:
+            プロジェクトIDをキーとした最終作業日時の辞書
+        """
+        if project_id is None:
+            rows = self.db.execute("""
+                SELECT project_id, MAX(last_start) as last_time
+                FROM work_daily_rollup
+                GROUP BY project_id
+            """).fetchall()
+        else:
+            rows = self.db.execute("""
+                SELECT project_id, MAX(last_start) as last_time
+                FROM work_daily_rollup
+                WHERE project_id = ?
+            """, (project_id,)).fetchall()
+
+        return {row['project_id']: row['last_time'] for row in rows if row['project_id']}
+
+    def _rebuild_hour_index(self, project_ids, weekday_data: Dict[str, dict],
+                            weekend_data: Dict[str, dict], histograms: Dict[str, array],
+                            histogram_epoch: float):
+        """
+        project_pattern_hours テーブルを再構築（内部メソッド）
+
+        Args:
+            project_ids: 再学習したプロジェクトIDの集合
+            weekday_data: 平日のパターン辞書
+            weekend_data: 休日のパターン辞書
+            histograms: プロジェクトごとの曜日×時間ヒストグラム
+            histogram_epoch: ヒストグラムの基準時刻（UNIX秒）
+        """
+        # 再学習したプロジェクトの行だけを入れ替える（未学習の古いパターンは残す）
+        self.db.execute("""
+            DELETE FROM project_pattern_hours
+            WHERE project_id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(list(project_ids)),))
+
+        rows = []
+        for day_type, data in (('weekday', weekday_data), ('weekend', weekend_data)):
+            for pid, pattern in data.items():
+                histogram = histograms.get(pid)
+                for hour in pattern['typical_hours']:
+                    # 減衰カウントが大きい（最近よく作業している）ほど優先
+                    if histogram is None:
+                        score = -math.inf
+                    else:
+                        score = histogram_score(histogram, day_type == 'weekend', hour,
+                                                histogram_epoch, self.half_life_days)
+                    rows.append((day_type, hour, pid, score))
+
+        self.db.executemany("""
+            INSERT INTO project_pattern_hours (day_type, hour, project_id, score)
+            VALUES (?, ?, ?, ?)
+        """, rows)
+
+    def _load_hour_index(self) -> List[List[List[Dict]]]:
+        """
+        時刻 → プロジェクトの検索インデックスをメモリに読み込む（内部メソッド）
 
         Returns:
-            プロジェクトごとのパターン辞書
+            [平日, 休日] × 24時間 の、スコア順に並んだプロジェクト情報リスト
         """
-        # 時間帯ごとの作業頻度を取得
+        index = [[[] for _ in range(24)] for _ in range(2)]
+
         rows = self.db.execute("""
             SELECT
-                project_id,
-                project_name,
-                hour_of_day,
-                COUNT(*) as frequency,
-                AVG(duration_minutes) as avg_duration
-            FROM work_history
-            WHERE (is_weekend = 1 OR is_holiday = 1) = ?
-                AND start_time >= datetime('now', '-14 days')
-            GROUP BY project_id, hour_of_day
-        """, (1 if is_weekend else 0,)).fetchall()
+                h.day_type,
+                h.hour,
+                p.project_id,
+                p.project_name,
+                p.weekday_typical_hours,
+                p.weekend_typical_hours
+            FROM project_pattern_hours h
+            JOIN project_patterns p ON p.project_id = h.project_id
+            ORDER BY h.score DESC, p.last_worked_at DESC
+        """).fetchall()
+
+        if not rows:
+            rows = self._hour_index_rows_from_patterns()
+
+        # typical hours の JSON は読み込み時に1度だけパースする
+        hours_cache = {}
+        for row in rows:
+            is_weekend = 1 if row['day_type'] == 'weekend' else 0
+            key = (row['project_id'], is_weekend)
+            if key not in hours_cache:
+                field = 'weekend_typical_hours' if is_weekend else 'weekday_typical_hours'
+                hours_cache[key] = json.loads(row[field] or '[]')
+
+            index[is_weekend][row['hour']].append({
+                'project_id': row['project_id'],
+                'project_name': row['project_name'],
+                'typical_hours': hours_cache[key]
+            })
+
+        return index
 
-        # プロジェクトごとに集計
-        project_data = {}
+    def _hour_index_rows_from_patterns(self) -> List[Dict]:
+        """
+        インデックス未作成のDB向けに project_patterns から行を生成（内部メソッド）
+
+        Returns:
+            _load_hour_index の検索結果と同じ形式の行リスト（最終作業日時の新しい順）
+        """
+        patterns = self.db.execute("""
+            SELECT project_id, project_name, weekday_typical_hours, weekend_typical_hours
+            FROM project_patterns
+            ORDER BY last_worked_at DESC
+        """).fetchall()
+
+        rows = []
+        for day_type, field in (('weekday', 'weekday_typical_hours'),
+                                ('weekend', 'weekend_typical_hours')):
+            for pattern in patterns:
+                for hour in json.loads(pattern[field] or '[]'):
+                    row = dict(pattern)
+                    row.update({'day_type': day_type, 'hour': hour})
+                    rows.append(row)
+        return rows
+
+    def _learn_slot_patterns(self, project_id: Optional[str] = None):
+        """
+        曜日×15分スロットのパターンを学習してDBに保存（内部メソッド）
+
+        Args:
+            project_id: 対象プロジェクト（省略時は全プロジェクトを作り直す）
+        """
+        # 開始〜終了の15分単位の重なりが必要なため、この学習だけは
+        # 時間単位の集計ではなく生の履歴（直近 slot_learning_weeks 週間）を参照する
+        since = int(time.time()) - self.slot_learning_weeks * 7 * 86400
+        query = """
+            SELECT project_id, project_name, start_epoch, end_epoch, duration_minutes
+            FROM work_history
+            WHERE start_epoch >= ?
+        """
+        if project_id is None:
+            rows = self.db.execute(query, (since,)).fetchall()
+        else:
+            rows = self.db.execute(query + " AND project_id = ?", (since, project_id)).fetchall()
+
+        # 観測できた週数（履歴の短い新規環境では学習期間より短くなる）
+        oldest = self.db.execute("""
+            SELECT MIN(start_epoch) as oldest FROM work_history
+            WHERE start_epoch >= ?
+        """, (since,)).fetchone()['oldest']
+        if oldest:
+            span_days = (local_now() - epoch_to_local(oldest)).days + 1
+            weeks = min(self.slot_learning_weeks, max(1, -(-span_days // 7)))
+        else:
+            weeks = 1
+
+        entries = []
         for row in rows:
-            pid = row['project_id']
-            if pid not in project_data:
-                project_data[pid] = {
+            start = epoch_to_local(row['start_epoch'])
+            if row['end_epoch'] is not None:
+                end = epoch_to_local(row['end_epoch'])
+            else:
+                end = start + timedelta(minutes=row['duration_minutes'] or 0)
+            entries.append((row['project_id'], row['project_name'], start, end))
+
+        patterns = self.slot_model.learn(entries, weeks)
+
+        if project_id is None:
+            self.db.execute("DELETE FROM project_slot_patterns")
+        else:
+            self.db.execute("DELETE FROM project_slot_patterns WHERE project_id = ?",
+                            (project_id,))
+
+        self.db.executemany("""
+            INSERT INTO project_slot_patterns
+            (project_id, project_name, slot_bits, slot_counts, updated_at)
+            VALUES (?, ?, ?, ?, datetime('now'))
+        """, [
+            (pid, p['name'], pack_bits(p['bits']), p['counts'])
+            for pid, p in patterns.items()
+        ])
+
+        if project_id is None:
+            self.slot_model.load(patterns)
+            self._slot_model_loaded = True
+        elif self._slot_model_loaded:
+            self.slot_model.update_project(project_id, patterns.get(project_id))
+
+    def _ensure_slot_model(self) -> SlotPatternModel:
+        """スロットパターンを必要ならDBから読み込む（内部メソッド）"""
+        if not self._slot_model_loaded:
+            rows = self.db.execute("""
+                SELECT project_id, project_name, slot_bits, slot_counts
+                FROM project_slot_patterns
+            """).fetchall()
+            self.slot_model.load({
+                row['project_id']: {
                     'name': row['project_name'],
-                    'hours': {},
-                    'total_entries': 0,
-                    'durations': []
+                    'bits': unpack_bits(row['slot_bits']),
+                    'counts': row['slot_counts']
                 }
+                for row in rows
+            })
+            self._slot_model_loaded = True
+        return self.slot_model
 
-            project_data[pid]['hours'][row['hour_of_day']] = row['frequency']
-            project_data[pid]['total_entries'] += row['frequency']
-            project_data[pid]['durations'].append(row['avg_duration'])
+    def is_typical_time(self, project_id: str, check_time: datetime) -> Optional[bool]:
+        """
+        指定時刻がプロジェクトの通常の作業時間（15分単位）か判定
 
-        # 各プロジェクトで頻度の高い時間帯を抽出
-        results = {}
-        for pid, data in project_data.items():
-            # データが少なすぎる場合はスキップ（3回未満）
-            if data['total_entries'] < 3:
-                continue
+        祝日は曜日ごとのパターンが当てはまらないため判定しない
 
-            # 平均以上の頻度の時間帯を「typical hours」とする
-            avg_frequency = data['total_entries'] / len(data['hours'])
-            threshold = avg_frequency * self.pattern_threshold
+        Args:
+            project_id: プロジェクトID
+            check_time: チェックする時刻（ローカル時刻）
 
-            typical_hours = [
-                hour for hour, freq in data['hours'].items()
-                if freq >= threshold
-            ]
+        Returns:
+            通常の時間なら True、そうでなければ False、判定できない場合は None
+        """
+        if self.categorize_day(check_time) == 'holiday':
+            return None
+        return self._ensure_slot_model().is_typical(str(project_id), check_time)
 
-            # 平均作業時間を計算
-            avg_duration = int(sum(data['durations']) / len(data['durations']))
+    def _learn_patterns_sql(self) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+        """
+        平日・休日のパターンを1回のクエリで学習（内部メソッド）
+
+        時間帯ごとの集計・プロジェクトごとの合計・typical hours の判定・
+        平均作業時間の計算をすべて SQL（CTE + ウィンドウ関数）で行う
 
-            results[pid] = {
-                'name': data['name'],
-                'typical_hours': typical_hours,
-                'avg_duration': avg_duration
+        Returns:
+            (平日パターン辞書, 休日パターン辞書)
+        """
+        rows = self.db.execute("""
+            WITH hourly AS (
+                -- 時間帯ごとの作業頻度と平均作業時間
+                SELECT
+                    project_id,
+                    day_type,
+                    hour as hour_of_day,
+                    MAX(project_name) as project_name,
+                    SUM(entries) as frequency,
+                    SUM(minutes) as duration_sum
+                FROM work_daily_rollup
+                WHERE date >= ?
+                GROUP BY project_id, day_type, hour
+            ),
+            totals AS (
+                -- プロジェクト・日タイプごとの合計と作業した時間帯の数
+                SELECT
+                    *,
+                    SUM(frequency) OVER w as total_entries,
+                    COUNT(*) OVER w as active_hours
+                FROM hourly
+                WINDOW w AS (PARTITION BY project_id, day_type)
+            )
+            SELECT
+                project_id,
+                day_type,
+                MAX(project_name) as project_name,
+                -- 平均頻度 × 閾値以上の時間帯を「typical hours」とする
+                json_group_array(hour_of_day) FILTER (
+                    WHERE frequency >= CAST(total_entries AS REAL) / active_hours * ?
+                ) as typical_hours,
+                -- 平均作業時間は時間帯ごとの (合計, 件数) から Python 側で正確に計算する
+                json_group_array(json_array(duration_sum, frequency)) as hour_totals
+            FROM totals
+            WHERE total_entries >= 3  -- データが少なすぎる場合はスキップ（3回未満）
+            GROUP BY project_id, day_type
+        """, (
+            local_date_days_ago(self.learning_period_days),
+            self.pattern_threshold
+        )).fetchall()
+
+        weekday_data = {}
+        weekend_data = {}
+        for row in rows:
+            data = weekend_data if row['day_type'] else weekday_data
+            data[row['project_id']] = {
+                'name': row['project_name'],
+                'typical_hours': sorted(json.loads(row['typical_hours'])),
+                'avg_duration': mean_hour_average(json.loads(row['hour_totals']))
             }
 
-        return results
+        return weekday_data, weekend_data
+
+    @staticmethod
+    def _new_hour_stats(project_name: Optional[str]) -> Dict:
+        """空の時間帯別集計値を作成（内部メソッド）"""
+        return {
+            'name': project_name,
+            'hours': {},
+            'duration_sum': {},
+            'duration_n': {}
+        }
+
+    @staticmethod
+    def _add_hour_stats_row(stats: Dict, row) -> None:
+        """GROUP BY hour_of_day の1行を集計値に加算（内部メソッド）"""
+        hour = row['hour_of_day']
+        stats['hours'][hour] = stats['hours'].get(hour, 0) + row['frequency']
+        stats['duration_sum'][hour] = stats['duration_sum'].get(hour, 0) + (row['duration_sum'] or 0)
+        stats['duration_n'][hour] = stats['duration_n'].get(hour, 0) + row['duration_n']
+
+    def _summarize_hour_stats(self, stats: Dict) -> Optional[Dict]:
+        """
+        時間帯別集計値から typical hours と平均作業時間を計算（内部メソッド）
+
+        Args:
+            stats: 時間帯ごとの頻度・作業時間の合計・件数
+
+        Returns:
+            パターン辞書、データが少なすぎる場合は None
+        """
+        total_entries = sum(stats['hours'].values())
+
+        # データが少なすぎる場合はスキップ（3回未満）
+        if total_entries < 3:
+            return None
+
+        # 平均以上の頻度の時間帯を「typical hours」とする
+        avg_frequency = total_entries / len(stats['hours'])
+        threshold = avg_frequency * self.pattern_threshold
+
+        typical_hours = sorted(
+            hour for hour, freq in stats['hours'].items()
+            if freq >= threshold
+        )
+
+        # 平均作業時間を計算（時間帯ごとの平均の平均）
+        avg_duration = mean_hour_average(
+            (stats['duration_sum'][hour], n) for hour, n in stats['duration_n'].items()
+        )
+
+        return {
+            'name': stats['name'],
+            'typical_hours': typical_hours,
+            'avg_duration': avg_duration
+        }
 
     def get_expected_project_at_time(self, check_time: datetime) -> Optional[Dict]:
         """
@@ -284,30 +976,33 @@ class PatternLearner:
 
         Returns:
             プロジェクト情報の辞書、または None
+            曜日×15分スロットのパターンを優先し、該当がなければ平日/休日の時間帯で検索
+            複数ある場合はその時間帯の作業頻度が高く、最近作業したものを優先
         """
         day_type = self.categorize_day(check_time)
         is_weekend = 1 if day_type in ['weekend', 'holiday'] else 0
 
-        # 該当時刻が典型的な作業時間に含まれるプロジェクトを検索
-        hour_field = 'weekend_typical_hours' if is_weekend else 'weekday_typical_hours'
-
-        projects = self.db.execute(f"""
-            SELECT project_id, project_name, {hour_field} as typical_hours
-            FROM project_patterns
-            WHERE {hour_field} LIKE ?
-        """, (f'%{check_time.hour}%',)).fetchall()
-
-        if not projects:
-            return None
-
-        # 複数ある場合は最も最近作業したものを選択
-        for project in projects:
-            hours = json.loads(project['typical_hours'])
-            if check_time.hour in hours:
+        # 曜日×15分スロットのパターンを優先（祝日は曜日のパターンを使わない）
+        slot_model = None
+        if day_type != 'holiday':
+            slot_model = self._ensure_slot_model()
+            candidates = slot_model.expected_projects(check_time)
+            if candidates:
+                project_id = candidates[0]
                 return {
-                    'project_id': project['project_id'],
-                    'project_name': project['project_name'],
-                    'typical_hours': hours
+                    'project_id': project_id,
+                    'project_name': slot_model.project_name(project_id),
+                    'typical_hours': slot_model.typical_hours(project_id, check_time.weekday())
                 }
 
+        if self._hour_index is None:
+            self._hour_index = self._load_hour_index()
+
+        # 該当時刻が典型的な作業時間に含まれるプロジェクトをスコア順に保持している
+        # スロットパターンのあるプロジェクトは上で「この時間ではない」と判定済み
+        for candidate in self._hour_index[is_weekend][check_time.hour]:
+            if slot_model and slot_model.has_project(candidate['project_id']):
+                continue
+            return dict(candidate)
+
         return None
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Toggl webhook の代わりに、記録したイベントを署名付きで POST する動作確認用スクリプト
+
+Usage:
+    # 一時DBでローカルの受信サーバーを起動し、サンプル（またはファイル）のイベントを送る
+    python replay_toggl_webhooks.py [events.jsonl]
+
+    # 起動中のアプリに送る（TOGGL_WEBHOOK_SECRET はアプリと同じ値にする）
+    python replay_toggl_webhooks.py [events.jsonl] --url http://localhost:8765/toggl/webhook
+
+events.jsonl は Toggl から受け取った webhook のリクエストボディを1行1イベントで並べたもの
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import requests
+from dotenv import load_dotenv
+
+from toggl_webhook import SIGNATURE_HEADER, sign_payload
+
+
+def sample_events() -> List[dict]:
+    """開始 → 停止 → 編集 → 削除 の一連のイベント（再送を含む）"""
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+    stop = start + timedelta(minutes=50)
+
+    def event(event_id: int, action: str, **entry) -> dict:
+        payload = {'id': 4242, 'workspace_id': 1, 'project_id': 100,
+                   'description': 'replay', 'start': start.isoformat().replace('+00:00', 'Z')}
+        payload.update(entry)
+        return {
+            'event_id': event_id,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'metadata': {'action': action, 'model': 'time_entry', 'time_entry_id': '4242'},
+            'payload': payload,
+        }
+
+    stopped = dict(stop=stop.isoformat().replace('+00:00', 'Z'), duration=50 * 60)
+    edited = dict(stop=(stop + timedelta(minutes=10)).isoformat().replace('+00:00', 'Z'),
+                  duration=60 * 60)
+    return [
+        {'payload': 'ping', 'validation_code': 'replay-validation'},
+        event(1, 'created', stop=None, duration=-1),
+        event(2, 'updated', **stopped),
+        event(2, 'updated', **stopped),  # 再送
+        event(3, 'updated', **edited),
+        event(4, 'deleted'),
+    ]
+
+
+def load_events(path: str) -> List[dict]:
+    """記録したイベントを読み込む"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def post_events(url: str, secret: str, events: List[dict], on_event=None):
+    """
+    イベントを順に署名付きで送信
+
+    Args:
+        url: webhook の URL
+        secret: 署名に使うシークレット
+        events: 送信するイベント
+        on_event: 各イベントの送信後に呼ぶ関数（省略可）
+    """
+    for event in events:
+        body = json.dumps(event).encode('utf-8')
+        response = requests.post(url, data=body, timeout=10, headers={
+            'Content-Type': 'application/json',
+            SIGNATURE_HEADER: sign_payload(secret, body),
+        })
+        action = (event.get('metadata') or {}).get('action', event.get('payload'))
+        print(f"  {action:8} -> {response.status_code} {response.text}")
+        if on_event:
+            on_event()
+
+    # 署名が一致しないリクエストは拒否される
+    body = json.dumps(events[-1]).encode('utf-8')
+    response = requests.post(url, data=body, timeout=10,
+                             headers={SIGNATURE_HEADER: sign_payload(secret + 'x', body)})
+    print(f"  bad signature -> {response.status_code} {response.text}")
+
+
+def run_local(events: List[dict], secret: str):
+    """一時DBでローカルの受信サーバーを起動してイベントを送る"""
+    from main import init_database
+    from pattern_learner import PatternLearner
+    from toggl_webhook import TimerState, TogglWebhookServer, WebhookProcessor
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = init_database(os.path.join(tmp, 'replay.db'))
+        db.start_writer()  # main.py と同じく書き込みは専用スレッドで行う
+        learner = PatternLearner(db)
+        state = TimerState()
+        server = TogglWebhookServer(WebhookProcessor(secret, state, learner),
+                                    host='127.0.0.1', port=0)
+        server.start()
+        host, port = server.address
+
+        def show_state():
+            rows = db.execute("""
+                SELECT toggl_entry_id, duration_minutes FROM work_history
+            """).fetchall()
+            running = state.current.get('id') if state.current else None
+            print(f"           timer={running} work_history={[tuple(row) for row in rows]}")
+
+        try:
+            post_events(f"http://{host}:{port}{server.path}", secret, events, show_state)
+        finally:
+            server.stop()
+            db.close()
+
+
+def main():
+    """エントリーポイント"""
+    load_dotenv()
+
+    args = sys.argv[1:]
+    url = None
+    if '--url' in args:
+        index = args.index('--url')
+        url = args[index + 1]
+        del args[index:index + 2]
+
+    events = load_events(args[0]) if args else sample_events()
+    secret = os.getenv('TOGGL_WEBHOOK_SECRET') or 'replay-secret'
+
+    print(f"Replaying {len(events)} event(s)...")
+    if url:
+        post_events(url, secret, events)
+    else:
+        run_local(events, secret)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Retention - 古い履歴を月単位の圧縮アーカイブ（gzip JSONL）へ移動するモジュール
+
+Usage:
+    python retention.py [run|list|restore <テーブル> <YYYY-MM>|export <テーブル> [開始日] [終了日]]
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from database import run_standalone, run_write
+from migrations import fill_time_columns
+
+# アーカイブ対象のテーブルと、月の判定に使う日時カラム
+ARCHIVE_TABLES = {
+    'work_history': 'local_date',
+    'notification_history': 'notified_at',
+}
+
+# 時刻カラムを追加する前に作ったアーカイブで、月の判定に使っていたカラム
+LEGACY_ARCHIVE_TIME_COLUMNS = {
+    'work_history': 'start_time',
+}
+
+# work_history は15分スロットの学習（8週間）に生データが必要なため、これより短くしない
+MIN_WORK_HISTORY_DAYS = 8 * 7
+
+# 空きページがこの割合を超えたら VACUUM で作り直す（それ以外は incremental_vacuum）
+VACUUM_FREE_RATIO = 0.25
+
+
+def month_start(month: str) -> str:
+    """'YYYY-MM' の月初日（YYYY-MM-DD）"""
+    return f"{month}-01"
+
+
+def next_month_start(month: str) -> str:
+    """'YYYY-MM' の翌月の月初日（YYYY-MM-DD）"""
+    year, mon = (int(part) for part in month.split('-'))
+    year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return f"{year:04d}-{mon:02d}-01"
+
+
+class HistoryArchive:
+    """
+    保持期間を過ぎた行を、テーブル・月ごとの gzip JSONL ファイルに移動するクラス
+
+    アーカイブは月単位で行い、ファイルの一覧は archive_files テーブルに記録する。
+    ファイルを書き終えてから行を削除するため、途中で止まっても行は失われない
+    """
+
+    def __init__(self, db_connection: sqlite3.Connection, archive_dir: str = 'archive',
+                 work_history_days: int = 180, notification_days: int = 30):
+        """
+        Args:
+            db_connection: SQLite データベース接続
+            archive_dir: アーカイブファイルを置くディレクトリ
+            work_history_days: work_history を SQLite に残す日数
+            notification_days: notification_history を SQLite に残す日数
+        """
+        self.db = db_connection
+        self.db.row_factory = sqlite3.Row
+        self.archive_dir = archive_dir
+        self.retention_days = {
+            'work_history': max(work_history_days, MIN_WORK_HISTORY_DAYS),
+            'notification_history': notification_days,
+        }
+
+    def _archive_path(self, table: str, month: str) -> str:
+        """アーカイブファイルのパス（内部メソッド）"""
+        return os.path.join(self.archive_dir, table, f"{month}.jsonl.gz")
+
+    def _cutoff_month(self, table: str, now: Optional[datetime] = None) -> str:
+        """
+        この月より前をアーカイブする、という境界の月を計算（内部メソッド）
+
+        保持期間の境界を含む月は丸ごと SQLite に残す
+        """
+        boundary = (now or datetime.now()) - timedelta(days=self.retention_days[table])
+        return boundary.strftime('%Y-%m')
+
+    def archive_table(self, table: str, now: Optional[datetime] = None) -> int:
+        """
+        保持期間を過ぎた月の行をアーカイブに移動
+
+        Args:
+            table: テーブル名（ARCHIVE_TABLES のキー）
+            now: 基準日時（省略時は現在時刻）
+
+        Returns:
+            移動した行数
+        """
+        time_column = ARCHIVE_TABLES[table]
+        cutoff = month_start(self._cutoff_month(table, now))
+
+        months = [row['month'] for row in self.db.execute(f"""
+            SELECT DISTINCT substr({time_column}, 1, 7) as month
+            FROM {table}
+            WHERE {time_column} < ?
+            ORDER BY month
+        """, (cutoff,))]
+
+        moved = 0
+        for month in months:
+            moved += self._archive_month(table, month)
+        return moved
+
+    def _archive_month(self, table: str, month: str) -> int:
+        """
+        1か月分の行をアーカイブファイルに追記してから削除（内部メソッド）
+
+        Returns:
+            移動した行数
+        """
+        time_column = ARCHIVE_TABLES[table]
+        path = self._archive_path(table, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+
+        where = f"{time_column} >= ? AND {time_column} < ?"
+        params = (month_start(month), next_month_start(month))
+
+        # 既存ファイルの内容 + 新しい行を一時ファイルに書き、置き換える
+        # （前回の削除前に止まった場合でも、同じ id の行は重複して書かない）
+        archived_ids = set()
+        written_ids = []  # ファイルに入っている SQLite の行（この id だけを削除する）
+        count = 0
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as out:
+            for record in self._read_file(path):
+                archived_ids.add(record.get('id'))
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+
+            cursor = self.db.execute(f"SELECT * FROM {table} WHERE {where} ORDER BY id", params)
+            columns = [col[0] for col in cursor.description]
+            for row in cursor:
+                record = dict(zip(columns, row))
+                written_ids.append(record['id'])
+                if record['id'] in archived_ids:
+                    continue
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+
+        # ファイルを書き終えてから、書いた行だけを削除して一覧を更新する
+        # （読み込み後に同じ月へ追加された行は次回のアーカイブまで SQLite に残す）
+        ids = json.dumps(written_ids)
+
+        def delete_archived() -> int:
+            if table == 'work_history':
+                # 削除後も backfill で取り込み直さないよう Toggl エントリーIDを残す
+                self.db.execute("""
+                    INSERT OR IGNORE INTO archived_entries (toggl_entry_id, month)
+                    SELECT toggl_entry_id, ? FROM work_history
+                    WHERE id IN (SELECT value FROM json_each(?)) AND toggl_entry_id IS NOT NULL
+                """, (month, ids))
+            deleted = self.db.execute(f"""
+                DELETE FROM {table} WHERE id IN (SELECT value FROM json_each(?))
+            """, (ids,)).rowcount
+            self.db.execute("""
+                INSERT INTO archive_files (table_name, month, path, row_count, bytes, archived_at)
+                VALUES (?, ?, ?, ?, ?, datetime('now'))
+                ON CONFLICT(table_name, month) DO UPDATE SET
+                    path = excluded.path,
+                    row_count = excluded.row_count,
+                    bytes = excluded.bytes,
+                    archived_at = excluded.archived_at
+            """, (table, month, path, count, os.path.getsize(path)))
+            return deleted
+
+        deleted = run_write(self.db, delete_archived)
+
+        if deleted:
+            print(f"Archived {deleted} {table} row(s) for {month}")
+        return deleted
+
+    @staticmethod
+    def _read_file(path: str) -> Iterator[dict]:
+        """アーカイブファイルを1行ずつ読み込む（内部メソッド）"""
+        if not os.path.exists(path):
+            return
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def list_archives(self, table: Optional[str] = None) -> List[Dict]:
+        """
+        アーカイブ済みの月の一覧を取得
+
+        Args:
+            table: テーブル名（省略時はすべて）
+
+        Returns:
+            archive_files の行の辞書のリスト
+        """
+        if table:
+            rows = self.db.execute("""
+                SELECT * FROM archive_files WHERE table_name = ? ORDER BY month
+            """, (table,))
+        else:
+            rows = self.db.execute("SELECT * FROM archive_files ORDER BY table_name, month")
+        return [dict(row) for row in rows]
+
+    def iter_rows(self, table: str, since: Optional[str] = None,
+                  until: Optional[str] = None) -> Iterator[dict]:
+        """
+        アーカイブと SQLite の行を区別せずに古い順に読み込む
+
+        Args:
+            table: テーブル名（ARCHIVE_TABLES のキー）
+            since: この日時（ISO 8601、work_history はローカル日付）以降の行だけを返す
+            until: この日時（ISO 8601、work_history はローカル日付）より前の行だけを返す
+
+        Yields:
+            行の辞書
+        """
+        time_column = ARCHIVE_TABLES[table]
+
+        for archive in self.list_archives(table):
+            month = archive['month']
+            if since and next_month_start(month) <= since:
+                continue
+            if until and month_start(month) >= until:
+                continue
+            for record in self._read_file(archive['path']):
+                value = record.get(time_column) or record.get(
+                    LEGACY_ARCHIVE_TIME_COLUMNS.get(table), '')
+                if (since and value < since) or (until and value >= until):
+                    continue
+                yield record
+
+        conditions = []
+        params = []
+        if since:
+            conditions.append(f"{time_column} >= ?")
+            params.append(since)
+        if until:
+            conditions.append(f"{time_column} < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        for row in self.db.execute(f"""
+            SELECT * FROM {table} {where} ORDER BY {time_column}
+        """, params):
+            yield dict(row)
+
+    def archived_entry_ids(self, entry_ids: Iterable[int]) -> Set[int]:
+        """
+        指定した Toggl エントリーIDのうち、アーカイブ済みの月に含まれるもの
+
+        SQLite から削除済みの行は一意インデックスで重複を検出できないため、
+        backfill で同じエントリーを取り込み直さないように archived_entries と照合する
+
+        Args:
+            entry_ids: 照合する Toggl エントリーID（backfill の1バッチ分など）
+
+        Returns:
+            アーカイブ済みの Toggl エントリーIDの集合
+        """
+        ids = [entry_id for entry_id in entry_ids if entry_id is not None]
+        if not ids:
+            return set()
+        return {row[0] for row in self.db.execute("""
+            SELECT toggl_entry_id FROM archived_entries
+            WHERE toggl_entry_id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(ids),))}
+
+    def restore_month(self, table: str, month: str) -> int:
+        """
+        アーカイブした月を SQLite に戻す
+
+        work_history の集計（work_daily_rollup）はアーカイブ後も残っているため、
+        戻した行を集計に再加算することはしない
+
+        Args:
+            table: テーブル名（ARCHIVE_TABLES のキー）
+            month: 'YYYY-MM'
+
+        Returns:
+            戻した行数
+        """
+        path = self._archive_path(table, month)
+
+        def restore() -> int:
+            restored = 0
+            for record in self._read_file(path):
+                columns = list(record)
+                cursor = self.db.execute(f"""
+                    INSERT OR IGNORE INTO {table} ({', '.join(columns)})
+                    VALUES ({', '.join('?' for _ in columns)})
+                """, [record[col] for col in columns])
+                restored += cursor.rowcount
+            if table == 'work_history':
+                # 時刻カラムを追加する前のアーカイブは UNIX秒・ローカル日付を計算し直す
+                fill_time_columns(self.db)
+                self.db.execute("DELETE FROM archived_entries WHERE month = ?", (month,))
+
+            self.db.execute("""
+                DELETE FROM archive_files WHERE table_name = ? AND month = ?
+            """, (table, month))
+            return restored
+
+        restored = run_write(self.db, restore)
+
+        if os.path.exists(path):
+            os.remove(path)
+        print(f"Restored {restored} {table} row(s) for {month}")
+        return restored
+
+    def vacuum(self) -> str:
+        """
+        削除で空いたページをファイルから解放
+
+        初回は auto_vacuum を INCREMENTAL に切り替えるため VACUUM を行う。
+        以降は空きページが多い場合だけ VACUUM し、それ以外は incremental_vacuum で済ませる。
+        VACUUM はトランザクション内で実行できないため、書き込み専用スレッドで
+        他の書き込みの間に単独で実行する
+
+        Returns:
+            実行した処理（'vacuum', 'incremental', 'none'）
+        """
+        return run_standalone(self.db, self._vacuum)
+
+    def _vacuum(self) -> str:
+        """vacuum の本体（書き込み専用スレッドで実行、内部メソッド）"""
+        if self.db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.db.execute("VACUUM")
+            return 'vacuum'
+
+        page_count = self.db.execute("PRAGMA page_count").fetchone()[0]
+        free_count = self.db.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free_count:
+            return 'none'
+
+        if page_count and free_count / page_count > VACUUM_FREE_RATIO:
+            self.db.execute("VACUUM")
+            return 'vacuum'
+
+        self.db.execute("PRAGMA incremental_vacuum")
+        return 'incremental'
+
+    def run_maintenance(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        全テーブルのアーカイブと空きページの解放を行う
+
+        Args:
+            now: 基準日時（省略時は現在時刻）
+
+        Returns:
+            テーブル名をキーとした移動行数の辞書
+        """
+        moved = {table: self.archive_table(table, now) for table in ARCHIVE_TABLES}
+        if any(moved.values()):
+            result = self.vacuum()
+            print(f"Database vacuum: {result}")
+        return moved
+
+
+def main():
+    """エントリーポイント"""
+    from dotenv import load_dotenv
+    from main import init_database
+
+    load_dotenv()
+
+    db = init_database(os.getenv('DATABASE_PATH', 'timekeeper.db'))
+    archive = HistoryArchive(
+        db,
+        archive_dir=os.getenv('ARCHIVE_DIR', 'archive'),
+        work_history_days=int(os.getenv('WORK_HISTORY_RETENTION_DAYS', '180')),
+        notification_days=int(os.getenv('NOTIFICATION_RETENTION_DAYS', '30'))
+    )
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'run'
+    if command == 'run':
+        moved = archive.run_maintenance()
+        print(f"[OK] Archived: {moved}")
+    elif command == 'list':
+        for item in archive.list_archives():
+            print(f"{item['table_name']:22} {item['month']}  "
+                  f"{item['row_count']:8,} rows  {item['bytes']:10,} bytes  {item['path']}")
+    elif command == 'restore' and len(sys.argv) == 4:
+        archive.restore_month(sys.argv[2], sys.argv[3])
+    elif command == 'export' and 3 <= len(sys.argv) <= 5 and sys.argv[2] in ARCHIVE_TABLES:
+        # アーカイブと SQLite の行をまとめて JSON Lines で出力（レポート用）
+        since = sys.argv[3] if len(sys.argv) > 3 else None
+        until = sys.argv[4] if len(sys.argv) > 4 else None
+        for row in archive.iter_rows(sys.argv[2], since=since, until=until):
+            print(json.dumps(row, ensure_ascii=False))
+    else:
+        print("Usage: python retention.py [run|list|restore <table> <YYYY-MM>|"
+              "export <table> [since] [until]]")
+        sys.exit(1)
+
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 -- Timekeeper Emo-chan Database Schema
+-- バージョン1（ベースライン）のスキーマ。以降の変更は migrations.py の MIGRATIONS に追加する
 
 -- 作業履歴の記録（Toggl APIから取得したデータをキャッシュ）
 CREATE TABLE IF NOT EXISTS work_history (
@@ -12,7 +13,24 @@ CREATE TABLE IF NOT EXISTS work_history (
     is_weekend BOOLEAN DEFAULT 0,
     is_holiday BOOLEAN DEFAULT 0,
     hour_of_day INTEGER,  -- 0-23
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    toggl_entry_id INTEGER  -- Toggl の時間エントリーID（重複取り込みの検出用）
+);
+
+-- 作業履歴の「プロジェクト×日付×時間」集計（保存時に加算、学習・判定はこちらを参照）
+CREATE TABLE IF NOT EXISTS work_daily_rollup (
+    project_id TEXT NOT NULL,
+    date TEXT NOT NULL,      -- YYYY-MM-DD（start_time と同じタイムゾーン）
+    hour INTEGER NOT NULL,   -- 0-23
+    day_type INTEGER NOT NULL,  -- 0=平日, 1=休日/祝日
+    project_name TEXT NOT NULL,
+    -- 作業時間の合計（分）
+    minutes INTEGER NOT NULL DEFAULT 0,
+    -- エントリー数
+    entries INTEGER NOT NULL DEFAULT 0,
+    -- この時間帯で最後に開始したエントリーの開始日時
+    last_start DATETIME,
+    PRIMARY KEY (project_id, date, hour)
 );
 
 -- プロジェクトごとの学習パターン
@@ -29,10 +47,61 @@ CREATE TABLE IF NOT EXISTS project_patterns (
     weekend_avg_duration_minutes INTEGER,
     -- 最終作業日時
     last_worked_at DATETIME,
+    -- 曜日×時間 (7×24) の指数減衰カウント（float64配列のBLOB）
+    hour_histogram BLOB,
+    -- ヒストグラムの基準時刻（UNIX秒）
+    histogram_epoch REAL,
     -- 更新日時
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 時刻 → プロジェクトの検索インデックス（学習時に再構築）
+CREATE TABLE IF NOT EXISTS project_pattern_hours (
+    day_type TEXT NOT NULL,  -- 'weekday' または 'weekend'（祝日を含む）
+    hour INTEGER NOT NULL,   -- 0-23
+    project_id TEXT NOT NULL,
+    -- log2(減衰カウント) + 基準時刻 / 半減期（大きいほど優先）
+    score REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day_type, hour, project_id)
+);
+
+-- 曜日×15分スロットのパターン（開始〜終了の重なりから学習）
+CREATE TABLE IF NOT EXISTS project_slot_patterns (
+    project_id TEXT PRIMARY KEY,
+    project_name TEXT NOT NULL,
+    -- 曜日 (0=月) × 96スロットの通常作業ビットセット（672ビット = 84バイト）
+    slot_bits BLOB NOT NULL,
+    -- スロットごとの作業日数（uint8 × 672）
+    slot_counts BLOB NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 過去履歴の一括取り込みの進捗（中断後の再開用）
+CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+    source TEXT PRIMARY KEY,  -- 'csv:<パス>', 'json:<パス>', 'api:<開始日>'
+    position TEXT NOT NULL,   -- ファイルは処理済みレコード数、API は次の取得開始日時
+    entries INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 月単位でアーカイブした行のファイル一覧（retention.py）
+CREATE TABLE IF NOT EXISTS archive_files (
+    table_name TEXT NOT NULL,
+    month TEXT NOT NULL,      -- YYYY-MM
+    path TEXT NOT NULL,       -- gzip JSONL ファイルのパス
+    row_count INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, month)
+);
+
+-- アプリの状態（最終作業日時・休暇の手動設定など、キーと値の組）
+CREATE TABLE IF NOT EXISTS app_metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
 -- メッセージテンプレート
 CREATE TABLE IF NOT EXISTS message_templates (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -56,8 +125,17 @@ CREATE TABLE IF NOT EXISTS notification_history (
 CREATE INDEX IF NOT EXISTS idx_work_history_project_time
     ON work_history(project_id, start_time);
 
+CREATE INDEX IF NOT EXISTS idx_work_history_start_time
+    ON work_history(start_time);
+
 CREATE INDEX IF NOT EXISTS idx_work_history_day_type
     ON work_history(is_weekend, is_holiday, hour_of_day);
 
+CREATE UNIQUE INDEX IF NOT EXISTS idx_work_history_toggl_entry
+    ON work_history(toggl_entry_id) WHERE toggl_entry_id IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_project_pattern_hours_project
+    ON project_pattern_hours(project_id);
+
 CREATE INDEX IF NOT EXISTS idx_notification_history_category
     ON notification_history(category, notified_at);
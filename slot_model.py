@@ -0,0 +1,207 @@
+"""
+Slot Model - 曜日×15分スロットの作業パターンモデル（ビットセット）
+"""
+
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES  # 96
+WEEK_SLOTS = 7 * SLOTS_PER_DAY  # 672
+BITSET_BYTES = WEEK_SLOTS // 8  # 84
+
+# 1エントリーとして扱う最大の長さ（止め忘れタイマー対策）
+MAX_ENTRY_DURATION = timedelta(hours=24)
+
+
+def slot_of(dt: datetime) -> int:
+    """
+    日時から週内のスロット番号を計算
+
+    Args:
+        dt: ローカル時刻
+
+    Returns:
+        0〜671 のスロット番号（月曜0:00 = 0）
+    """
+    return dt.weekday() * SLOTS_PER_DAY + (dt.hour * 60 + dt.minute) // SLOT_MINUTES
+
+
+def pack_bits(bits: int) -> bytes:
+    """ビットセットをBLOBに変換"""
+    return bits.to_bytes(BITSET_BYTES, 'little')
+
+
+def unpack_bits(blob: Optional[bytes]) -> int:
+    """BLOBをビットセットに変換"""
+    return int.from_bytes(blob, 'little') if blob else 0
+
+
+class SlotPatternModel:
+    """
+    プロジェクトごとに「曜日×15分」の672スロットのうち、
+    通常作業しているスロットをビットセットで保持するクラス
+
+    エントリーの開始時刻だけでなく、開始〜終了の重なりからスロットを求める
+    """
+
+    def __init__(self, slot_threshold: float = 0.5, min_days: int = 2):
+        """
+        Args:
+            slot_threshold: 観測した週のうち、この割合以上で作業していれば通常スロット
+            min_days: 通常スロットとみなす最小の作業日数
+        """
+        self.slot_threshold = slot_threshold
+        self.min_days = min_days
+
+        self._bits: Dict[str, int] = {}
+        self._counts: Dict[str, bytes] = {}
+        self._names: Dict[str, str] = {}
+        self._by_slot: List[List[str]] = [[] for _ in range(WEEK_SLOTS)]
+
+    def learn(self, entries: Iterable[Tuple[str, str, datetime, datetime]],
+              weeks: int) -> Dict[str, dict]:
+        """
+        作業履歴からスロットパターンを計算
+
+        Args:
+            entries: (プロジェクトID, プロジェクト名, 開始, 終了) のローカル時刻のエントリー
+            weeks: 学習期間（週数）。各曜日を観測した回数として使う
+
+        Returns:
+            プロジェクトIDをキーとした {'name', 'bits', 'counts'} の辞書
+            （通常スロットのあるプロジェクトのみ）
+        """
+        names = {}
+        # (プロジェクト, 日付, スロット) の重複を除いて「作業した日数」を数える
+        worked = set()
+        for pid, name, start, end in entries:
+            names.setdefault(pid, name)
+            end = min(end, start + MAX_ENTRY_DURATION)
+            t = start.replace(minute=start.minute - start.minute % SLOT_MINUTES,
+                              second=0, microsecond=0)
+            while t < end:
+                worked.add((pid, t.date(), slot_of(t)))
+                t += timedelta(minutes=SLOT_MINUTES)
+
+        day_counts = Counter((pid, slot) for pid, _date, slot in worked)
+
+        min_count = max(self.min_days, self.slot_threshold * weeks)
+        patterns = {}
+        for pid, name in names.items():
+            counts = array('B', bytes(WEEK_SLOTS))
+            patterns[pid] = {'name': name, 'bits': 0, 'counts': counts}
+
+        for (pid, slot), count in day_counts.items():
+            pattern = patterns[pid]
+            pattern['counts'][slot] = min(count, 255)
+            if count >= min_count:
+                pattern['bits'] |= 1 << slot
+
+        # 通常スロットが1つもないプロジェクトはパターンなしとして扱う
+        return {
+            pid: {'name': p['name'], 'bits': p['bits'], 'counts': p['counts'].tobytes()}
+            for pid, p in patterns.items() if p['bits']
+        }
+
+    def load(self, patterns: Dict[str, dict]):
+        """
+        スロットパターンをメモリに読み込み、スロット → プロジェクトの索引を作成
+
+        Args:
+            patterns: learn() の戻り値と同じ形式の辞書
+        """
+        bits = {}
+        counts = {}
+        names = {}
+        by_slot = [[] for _ in range(WEEK_SLOTS)]
+
+        for pid, pattern in patterns.items():
+            bits[pid] = pattern['bits']
+            counts[pid] = pattern['counts']
+            names[pid] = pattern['name']
+
+            value = pattern['bits']
+            while value:
+                low = value & -value
+                by_slot[low.bit_length() - 1].append(pid)
+                value ^= low
+
+        # 各スロットは作業日数の多い順
+        for slot, pids in enumerate(by_slot):
+            pids.sort(key=lambda pid: counts[pid][slot], reverse=True)
+
+        self._bits, self._counts, self._names, self._by_slot = bits, counts, names, by_slot
+
+    def update_project(self, project_id: str, pattern: Optional[dict]):
+        """
+        1プロジェクト分のパターンだけを差し替える
+
+        Args:
+            project_id: プロジェクトID
+            pattern: {'name', 'bits', 'counts'}（None の場合は削除）
+        """
+        patterns = {
+            pid: {'name': self._names[pid], 'bits': bits, 'counts': self._counts[pid]}
+            for pid, bits in self._bits.items() if pid != project_id
+        }
+        if pattern:
+            patterns[project_id] = pattern
+        self.load(patterns)
+
+    def has_project(self, project_id: str) -> bool:
+        """プロジェクトのスロットパターンがあるか"""
+        return project_id in self._bits
+
+    def is_typical(self, project_id: str, dt: datetime) -> Optional[bool]:
+        """
+        指定時刻がプロジェクトの通常スロットか判定
+
+        Args:
+            project_id: プロジェクトID
+            dt: ローカル時刻
+
+        Returns:
+            通常スロットなら True、そうでなければ False、パターンがなければ None
+        """
+        bits = self._bits.get(project_id)
+        if bits is None:
+            return None
+        return bool(bits >> slot_of(dt) & 1)
+
+    def expected_projects(self, dt: datetime) -> List[str]:
+        """
+        指定時刻が通常スロットのプロジェクトを取得
+
+        Args:
+            dt: ローカル時刻
+
+        Returns:
+            作業日数の多い順のプロジェクトIDリスト
+        """
+        return self._by_slot[slot_of(dt)]
+
+    def project_name(self, project_id: str) -> Optional[str]:
+        """プロジェクト名を取得"""
+        return self._names.get(project_id)
+
+    def typical_hours(self, project_id: str, weekday: int) -> List[int]:
+        """
+        指定曜日に通常スロットを含む時間（0-23）のリストを取得
+
+        Args:
+            project_id: プロジェクトID
+            weekday: 曜日（0=月）
+
+        Returns:
+            時間のリスト
+        """
+        day_bits = self._bits.get(project_id, 0) >> (weekday * SLOTS_PER_DAY)
+        slots_per_hour = 60 // SLOT_MINUTES
+        mask = (1 << slots_per_hour) - 1
+        return [
+            hour for hour in range(24)
+            if day_bits >> (hour * slots_per_hour) & mask
+        ]
@@ -39,10 +39,10 @@ except ImportError:
 print("\n[2/6] Testing database initialization...")
 try:
     import sqlite3
+    from migrations import LATEST_VERSION, apply_migrations
     db = sqlite3.connect('test_timekeeper.db')
-    with open('schema.sql', 'r', encoding='utf-8') as f:
-        db.executescript(f.read())
-    print("  [OK] Database initialized")
+    apply_migrations(db)
+    print(f"  [OK] Database initialized (schema version {LATEST_VERSION})")
     db.close()
     os.remove('test_timekeeper.db')
 except Exception as e:
@@ -65,14 +65,44 @@ try:
 except Exception as e:
     print(f"  [ERROR] {e}")
 
+try:
+    # 計測中に履歴を取得 → タイマー停止 の順でも停止したエントリーが記録されるか
+    from datetime import timedelta, timezone
+
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+    running = {'id': 7, 'project_id': 100, 'description': 'Test Project',
+               'start': start.isoformat(), 'stop': None, 'duration': -1}
+
+    class RunningTimerToggl:
+        def get_time_entries(self, start_date, end_date):
+            return [running]
+
+    db = sqlite3.connect(':memory:')
+    db.row_factory = sqlite3.Row
+    apply_migrations(db)
+    learner = PatternLearner(db, RunningTimerToggl())
+    learner.fetch_and_store_history()
+    stopped = dict(running, stop=(start + timedelta(minutes=50)).isoformat(), duration=50 * 60)
+    pattern = learner.record_time_entry(stopped)
+    row = db.execute(
+        "SELECT duration_minutes FROM work_history WHERE toggl_entry_id = 7"
+    ).fetchone()
+    if pattern is None or row is None or row['duration_minutes'] != 50:
+        print("  [ERROR] Stop after fetching a running entry was not recorded")
+    else:
+        print("  [OK] Stop after fetching a running entry is recorded (50 min)")
+
+    db.close()
+except Exception as e:
+    print(f"  [ERROR] {e}")
+
 # 4. MessageGenerator テスト
 print("\n[4/6] Testing MessageGenerator...")
 try:
     from message_generator import MessageGenerator
     db = sqlite3.connect(':memory:')
     db.row_factory = sqlite3.Row
-    with open('schema.sql', 'r', encoding='utf-8') as f:
-        db.executescript(f.read())
+    apply_migrations(db)
 
     msg_gen = MessageGenerator(db)
     message = msg_gen.get_random_message('timer_start', {'project_name': 'Test Project'})
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Query Plan Regression Test
+大きな合成DBでアプリの各処理（学習・取り込み・通知・タイムライン・アーカイブなど）を実行し、
+発行された SQL をすべて記録して EXPLAIN QUERY PLAN で確認します。
+大きいテーブルをインデックスなしで全件走査する文があれば失敗にし、
+SELECT の実行時間をベースライン（--save-baseline で保存）と比較します
+
+Usage:
+    python test_query_plans.py [--entries N] [--days N] [--projects N]
+                               [--baseline FILE] [--save-baseline] [--tolerance X]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from activity_watermark import ActivityWatermark
+from daily_rollup import rebuild_rollup
+from local_time import epoch_to_local
+from message_generator import MessageGenerator
+from migrations import apply_migrations
+from notification_timeline import NotificationTimeline
+from pattern_learner import PatternLearner
+from retention import HistoryArchive
+
+# 行数が増え続けるため、インデックスなしの全件走査を許さないテーブル
+LARGE_TABLES = {'work_history', 'work_daily_rollup', 'notification_history'}
+
+# 大きいテーブルの全件走査を許す文（正規化した SQL の正規表現, 理由）
+ALLOWED_SCANS = [
+    (r'^INSERT INTO work_daily_rollup .* FROM work_history GROUP BY',
+     'rebuild_rollup without since_date rebuilds every row (migrations / manual rebuild only)'),
+    (r'^DELETE FROM work_daily_rollup$',
+     'rebuild_rollup without since_date clears the table'),
+    (r'^SELECT project_id, MAX\(last_start\) as last_time FROM work_daily_rollup GROUP BY project_id',
+     'full relearn needs the last start of every project'),
+    (r'^SELECT MAX\(last_start\) FROM work_daily_rollup$',
+     'one-off seed of the activity watermark'),
+    (r'^SELECT project_id, \(CAST\(strftime.* FROM work_daily_rollup$',
+     'full relearn decays every rollup row into the histograms'),
+    (r'^SELECT category, project_id, MAX\(notified_at\) as notified_at FROM notification_history GROUP BY',
+     'startup load of the last notification per category/project (table bounded by cleanup)'),
+]
+
+# 実行計画を調べない文（トランザクション制御・DDL など）
+SKIP_PREFIXES = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA',
+                 'CREATE', 'DROP', 'ALTER', 'ANALYZE', 'VACUUM')
+
+DEFAULT_BASELINE = 'query_plan_baseline.json'
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    SQL のリテラルを ? に置き換え、空白をまとめる（同じ文を1つにまとめるためのキー）
+
+    Args:
+        sql: パラメーターが展開された SQL
+
+    Returns:
+        正規化した SQL
+    """
+    sql = re.sub(r"[xX]'[0-9a-fA-F]*'", '?', sql)
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'(?<![\w.])-?\d+(?:\.\d+)?(?:e-?\d+)?\b', '?', sql)
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    sql = re.sub(r'\( ', '(', sql)
+    return re.sub(r' \)', ')', sql)
+
+
+def full_scans(plan: List[Tuple]) -> List[str]:
+    """
+    実行計画からインデックスを使わない大きいテーブルの走査を抜き出す
+
+    Args:
+        plan: EXPLAIN QUERY PLAN の結果
+
+    Returns:
+        該当する実行計画の行（detail）のリスト
+    """
+    scans = []
+    for row in plan:
+        detail = row[3]
+        match = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+        if not match or match.group(1) not in LARGE_TABLES:
+            continue
+        # 'SCAN ... USING INDEX' もインデックス順に全件をたどるため全件走査とみなす
+        scans.append(detail)
+    return scans
+
+
+def allowed_reason(normalized: str) -> Optional[str]:
+    """全件走査を許す文であれば理由を返す"""
+    for pattern, reason in ALLOWED_SCANS:
+        if re.search(pattern, normalized):
+            return reason
+    return None
+
+
+def toggl_entry(entry_id: int, project: int, start: datetime, minutes: int) -> dict:
+    """Toggl API 形式の停止済み時間エントリー"""
+    return {
+        'id': entry_id,
+        'project_id': 100000 + project,
+        'description': f"Project {project}",
+        'start': start.isoformat().replace('+00:00', 'Z'),
+        'stop': (start + timedelta(minutes=minutes)).isoformat().replace('+00:00', 'Z'),
+        'duration': minutes * 60,
+    }
+
+
+class ReplayToggl:
+    """fetch_and_store_history 用に、決まったエントリーを返す Toggl クライアントの代わり"""
+
+    def __init__(self, entries: List[dict]):
+        self.entries = entries
+
+    def get_time_entries(self, start_date: datetime, end_date: datetime) -> List[dict]:
+        return self.entries
+
+
+def create_database(path: str, n_entries: int, days: int, n_projects: int,
+                    n_notifications: int) -> sqlite3.Connection:
+    """
+    合成データを入れたファイルDBを作成
+
+    Args:
+        path: DBファイルのパス
+        n_entries: work_history の行数
+        days: 履歴の期間（日数）
+        n_projects: プロジェクト数
+        n_notifications: notification_history の行数（60日分）
+
+    Returns:
+        sqlite3.Connection
+    """
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode = WAL")
+    apply_migrations(db)
+
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+
+    def rows():
+        for entry_id in range(1, n_entries + 1):
+            # よく使うプロジェクトほど多くなるよう偏らせる
+            project = min(int(rng.expovariate(4 / n_projects)), n_projects - 1)
+            start = now - timedelta(minutes=rng.randrange(60, days * 24 * 60))
+            minutes = rng.randrange(5, 180)
+            end = start + timedelta(minutes=minutes)
+            local_start = epoch_to_local(start.timestamp())
+            weekend = local_start.weekday() >= 5
+            yield (
+                str(100000 + project), f"Project {project}",
+                start.isoformat(), end.isoformat(), minutes,
+                local_start.weekday(), 1 if weekend else 0, 0, local_start.hour,
+                entry_id, int(start.timestamp()), int(end.timestamp()),
+                local_start.date().isoformat()
+            )
+
+    db.executemany("""
+        INSERT INTO work_history
+        (project_id, project_name, start_time, end_time, duration_minutes,
+         day_of_week, is_weekend, is_holiday, hour_of_day,
+         toggl_entry_id, start_epoch, end_epoch, local_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows())
+    rebuild_rollup(db)
+
+    categories = ['sabori_reminder', 'timer_start', 'timer_stop', 'late_work', 'early_start']
+    db.executemany("""
+        INSERT INTO notification_history (category, project_id, message, notified_at)
+        VALUES (?, ?, ?, ?)
+    """, (
+        (
+            rng.choice(categories),
+            str(100000 + rng.randrange(n_projects)),
+            'message',
+            (now - timedelta(minutes=rng.randrange(0, 60 * 24 * 60))).strftime('%Y-%m-%d %H:%M:%S')
+        )
+        for _ in range(n_notifications)
+    ))
+    db.commit()
+    return db
+
+
+def capture_statements(db: sqlite3.Connection, steps: List[Tuple[str, Callable]]) -> Dict[str, Dict]:
+    """
+    各処理を実行し、発行された SQL を正規化した文ごとに記録
+
+    Args:
+        db: SQLite データベース接続
+        steps: (処理名, 実行する関数) のリスト
+
+    Returns:
+        正規化した SQL をキーとした {'sql': 展開済みの SQL, 'step': 処理名} の辞書
+    """
+    statements: Dict[str, Dict] = {}
+    current = {'step': None}
+
+    def trace(sql: str):
+        if sql.lstrip().upper().startswith(SKIP_PREFIXES):
+            return
+        # 展開済みの SQL では無限大が Inf になり、そのままでは解釈できない
+        sql = re.sub(r'\bInf\b', '1e999', sql)
+        key = normalize_sql(sql)
+        if key not in statements:
+            statements[key] = {'sql': sql, 'step': current['step']}
+
+    db.set_trace_callback(trace)
+    try:
+        for name, step in steps:
+            current['step'] = name
+            started = time.perf_counter()
+            step()
+            print(f"  [OK] {name} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    finally:
+        db.set_trace_callback(None)
+    return statements
+
+
+def time_query(db: sqlite3.Connection, sql: str, repeat: int) -> float:
+    """SELECT を repeat 回実行した中央値（ミリ秒）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        db.execute(sql).fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query plan regression test')
+    parser.add_argument('--entries', type=int, default=200_000, help='work_history rows')
+    parser.add_argument('--days', type=int, default=730, help='history span in days')
+    parser.add_argument('--projects', type=int, default=40, help='number of projects')
+    parser.add_argument('--notifications', type=int, default=20_000,
+                        help='notification_history rows')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs per query')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='timing baseline file')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='write the measured timings to the baseline file')
+    parser.add_argument('--tolerance', type=float, default=2.0,
+                        help='fail when a query is this many times slower than the baseline')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Query Plan Regression Test")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"\n[1/4] Creating {args.entries:,} entries over {args.days} days "
+              f"({args.projects} projects)...")
+        started = time.perf_counter()
+        db = create_database(os.path.join(tmp, 'plans.db'), args.entries, args.days,
+                             args.projects, args.notifications)
+        print(f"  [OK] Created in {time.perf_counter() - started:.1f}s")
+
+        # 直近14日分を Toggl から取り直す想定のエントリー
+        rng = random.Random(7)
+        now_utc = datetime.now(timezone.utc)
+        recent = [
+            toggl_entry(args.entries + i + 1, rng.randrange(args.projects),
+                        now_utc - timedelta(minutes=rng.randrange(60, 14 * 24 * 60)),
+                        rng.randrange(5, 180))
+            for i in range(args.entries * 14 // args.days)
+        ]
+        learner = PatternLearner(db, ReplayToggl(recent))
+        msg_gen = None
+
+        def init_messages():
+            nonlocal msg_gen
+            msg_gen = MessageGenerator(db)
+
+        def notify():
+            for category in ('sabori_reminder', 'timer_start', 'late_work'):
+                msg_gen.get_random_message(category, {'project_name': 'Project 1'})
+                msg_gen.has_recent_notification(category, 60, '100001')
+                msg_gen.record_notification(category, '100001', 'message')
+
+        new_entry = toggl_entry(args.entries * 2, 1, now_utc - timedelta(hours=2), 45)
+        archive = HistoryArchive(db, archive_dir=os.path.join(tmp, 'archive'))
+        steps = [
+            ('fetch_and_store_history', learner.fetch_and_store_history),
+            ('learn_project_patterns', learner.learn_project_patterns),
+            ('record_time_entry', lambda: learner.record_time_entry(new_entry)),
+            ('remove_time_entry', lambda: learner.remove_time_entry(new_entry['id'])),
+            ('expected project lookup',
+             lambda: learner.get_expected_project_at_time(datetime.now())),
+            ('NotificationTimeline.build',
+             lambda: NotificationTimeline.build(learner, db, datetime.now())),
+            ('activity watermark', lambda: ActivityWatermark(db).reload()),
+            ('MessageGenerator init', init_messages),
+            ('notifications', notify),
+            ('cleanup_old_notifications', lambda: msg_gen.cleanup_old_notifications()),
+            # main.py のプロジェクト名の取得（card_mapping.json にない場合）
+            ('project name lookup', lambda: learner.get_project_name('100001')),
+            ('retention archive', archive.run_maintenance),
+        ]
+
+        print("\n[2/4] Running application code paths...")
+        statements = capture_statements(db, steps)
+
+        print(f"\n[3/4] Checking query plans ({len(statements)} statements)...")
+        failures = 0
+        for key, info in statements.items():
+            plan = db.execute(f"EXPLAIN QUERY PLAN {info['sql']}").fetchall()
+            info['plan'] = [row[3] for row in plan]
+            scans = full_scans(plan)
+            if not scans:
+                continue
+            reason = allowed_reason(key)
+            if reason:
+                print(f"  [OK] allowed scan ({reason}): {key[:80]}")
+                continue
+            failures += 1
+            print(f"  [ERROR] full scan in {info['step']}: {key[:100]}")
+            for detail in info['plan']:
+                print(f"          {detail}")
+        if not failures:
+            print("  [OK] No unexpected full scans")
+
+        print(f"\n[4/4] Timing SELECT statements (median of {args.repeat})...")
+        baseline = {}
+        if os.path.exists(args.baseline) and not args.save_baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        timings = {}
+        regressions = 0
+        for key, info in statements.items():
+            if not key.upper().startswith(('SELECT', 'WITH')):
+                continue
+            elapsed = time_query(db, info['sql'], args.repeat)
+            timings[key] = round(elapsed, 3)
+            previous = baseline.get(key)
+            # 1ms 未満の差は計測の揺れとして無視する
+            slow = previous is not None and elapsed > previous * args.tolerance + 1.0
+            regressions += slow
+            marker = '[ERROR]' if slow else '[OK]'
+            compared = f" (baseline {previous:.2f})" if previous is not None else ''
+            print(f"  {marker} {elapsed:8.2f} ms{compared}  {key[:70]}")
+
+        db.close()
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(timings, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"\nSaved {len(timings)} timings to {args.baseline}")
+
+    print("\n" + "=" * 60)
+    print(f"Statements : {len(statements)}")
+    print(f"Full scans : {failures} unexpected")
+    print(f"Timings    : " + (f"{regressions} regression(s)" if baseline else "no baseline"))
+    print("=" * 60)
+    sys.exit(1 if failures or regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""
+Toggl Webhook - Toggl Track の webhook でタイマーの状態と作業履歴を更新するモジュール
+
+Toggl から時間エントリーの作成・更新・停止・削除イベントを受け取り、
+署名を検証してからローカルのタイマー状態と work_history を更新する。
+イベントを受け取れている間はタイマー状態の取得に Toggl API を呼ばない
+（一定時間イベントがない場合だけポーリングで確認する）
+"""
+
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+from database import run_write
+from pattern_learner import PatternLearner
+
+# 署名のヘッダー（値は 'sha256=<HMAC-SHA256 の16進数>'）
+SIGNATURE_HEADER = 'X-Webhook-Signature-256'
+
+# 再送されたイベントを二重に処理しないために覚えておくイベント数
+EVENT_ID_CACHE_SIZE = 1000
+
+# リクエストの受信を待つ秒数（超えたら接続を閉じる）
+REQUEST_TIMEOUT_SECONDS = 10
+
+# 受け付けるリクエストボディの最大バイト数（署名の検証前に読み込むため小さく抑える）
+MAX_BODY_BYTES = 64 * 1024
+
+
+def sign_payload(secret: str, body: bytes) -> str:
+    """
+    リクエストボディの署名ヘッダーの値を計算
+
+    Args:
+        secret: webhook 登録時に設定したシークレット
+        body: リクエストボディ
+
+    Returns:
+        'sha256=<16進数>' 形式の署名
+    """
+    digest = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """
+    署名ヘッダーがリクエストボディと一致するか検証
+
+    Args:
+        secret: webhook 登録時に設定したシークレット
+        body: リクエストボディ
+        signature: 署名ヘッダーの値
+
+    Returns:
+        一致する場合True
+    """
+    if not signature:
+        return False
+    return hmac.compare_digest(sign_payload(secret, body), signature.strip())
+
+
+def is_running(entry: Dict) -> bool:
+    """時間エントリーが計測中か（duration が負、または stop がない）"""
+    duration = entry.get('duration')
+    if duration is not None:
+        return duration < 0
+    return not entry.get('stop')
+
+
+class TimerState:
+    """
+    webhook とタップ操作で更新するローカルのタイマー状態
+
+    最後に状態を確認してから max_age 秒以内であれば current をそのまま使い、
+    それを過ぎたらポーリングで確認し直す
+    """
+
+    def __init__(self, max_age: float = 6 * 3600):
+        """
+        Args:
+            max_age: 状態を確認せずに使い続ける秒数
+        """
+        self.max_age = max_age
+        self.current: Optional[Dict] = None
+        self.confirmed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def set(self, entry: Optional[Dict]):
+        """
+        タイマー状態を更新
+
+        Args:
+            entry: 計測中の時間エントリー（停止中なら None）
+        """
+        with self._lock:
+            self.current = entry
+            self.confirmed_at = time.time()
+
+    def clear(self, entry_id: Optional[int] = None):
+        """
+        タイマーを停止状態にする
+
+        Args:
+            entry_id: 停止・削除されたエントリーID（別のエントリーが計測中なら何もしない）
+        """
+        with self._lock:
+            if entry_id is None or self.current is None or self.current.get('id') == entry_id:
+                self.current = None
+            self.confirmed_at = time.time()
+
+    def is_fresh(self) -> bool:
+        """ポーリングせずに current を使ってよいか"""
+        confirmed_at = self.confirmed_at
+        return confirmed_at is not None and time.time() - confirmed_at < self.max_age
+
+    def get_current_timer(self, fetch: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """
+        現在のタイマーを取得（古い場合だけ fetch でポーリングする）
+
+        fetch が例外を送出した場合は状態を更新せずにそのまま送出する
+        （取得の失敗を「タイマー停止中」として max_age 秒キャッシュしない）
+
+        Args:
+            fetch: Toggl API から現在のタイマーを取得する関数（失敗時は例外を送出）
+
+        Returns:
+            現在のタイマー情報（dict）、またはNone
+        """
+        if self.is_fresh():
+            return self.current
+        entry = fetch()
+        self.set(entry)
+        return entry
+
+
+class WebhookProcessor:
+    """受け取った webhook イベントを検証し、タイマー状態と作業履歴に反映するクラス"""
+
+    def __init__(self, secret: str, timer_state: TimerState, learner: PatternLearner,
+                 project_name_resolver: Optional[Callable[[str], str]] = None):
+        """
+        Args:
+            secret: webhook 登録時に設定したシークレット
+            timer_state: 更新する TimerState
+            learner: 停止・削除されたエントリーを反映する PatternLearner
+            project_name_resolver: プロジェクトIDからプロジェクト名を求める関数（省略可）
+        """
+        self.secret = secret
+        self.timer_state = timer_state
+        self.learner = learner
+        self.project_name_resolver = project_name_resolver
+        self._seen_events = deque(maxlen=EVENT_ID_CACHE_SIZE)
+        # HTTP サーバーのスレッドと他のスレッドで同時に履歴を更新しない
+        self._lock = threading.Lock()
+
+    def handle(self, body: bytes, signature: Optional[str]) -> Tuple[int, Dict]:
+        """
+        webhook リクエストを処理
+
+        Args:
+            body: リクエストボディ
+            signature: 署名ヘッダーの値
+
+        Returns:
+            (HTTP ステータスコード, レスポンスの辞書)
+        """
+        if not verify_signature(self.secret, body, signature):
+            return 401, {'error': 'invalid signature'}
+
+        try:
+            event = json.loads(body)
+        except ValueError:
+            return 400, {'error': 'invalid json'}
+        if not isinstance(event, dict):
+            return 400, {'error': 'invalid event'}
+
+        # 登録時の確認イベントには validation_code をそのまま返す
+        if event.get('payload') == 'ping' or 'validation_code' in event:
+            return 200, {'validation_code': event.get('validation_code')}
+
+        metadata = event.get('metadata') or {}
+        if metadata.get('model') != 'time_entry':
+            return 200, {'status': 'ignored'}
+
+        event_id = event.get('event_id')
+        with self._lock:
+            if event_id is not None and event_id in self._seen_events:
+                return 200, {'status': 'duplicate'}
+
+            try:
+                status = self._apply(metadata.get('action'), event.get('payload') or {}, metadata)
+            except Exception as e:
+                print(f"[Webhook] Error applying event: {e}")
+                return 500, {'error': 'failed to apply event'}
+
+            if event_id is not None:
+                self._seen_events.append(event_id)
+        return 200, {'status': status}
+
+    def _apply(self, action: Optional[str], entry: Dict, metadata: Dict) -> str:
+        """
+        時間エントリーのイベントを反映（内部メソッド）
+
+        Returns:
+            処理結果（レスポンスの status）
+        """
+        entry_id = entry.get('id') or metadata.get('time_entry_id')
+        # ID のないイベントはどのエントリーか分からないので反映しない
+        if entry_id is None:
+            return 'ignored'
+        entry_id = int(entry_id)
+
+        if action == 'deleted':
+            self.timer_state.clear(entry_id)
+            self.learner.remove_time_entry(entry_id)
+            return 'deleted'
+
+        if action not in ('created', 'updated'):
+            return 'ignored'
+
+        if is_running(entry):
+            self.timer_state.set(entry)
+            if entry.get('start'):
+                run_write(self.learner.db, self.learner.activity.touch, entry['start'])
+            return 'running'
+
+        # 停止したエントリー（編集された場合は保存済みの行を置き換える）
+        self.timer_state.clear(entry_id)
+        project_name = None
+        if self.project_name_resolver and entry.get('project_id'):
+            project_name = self.project_name_resolver(str(entry['project_id']))
+        run_write(self.learner.db, self._replace_entry, entry_id, entry, project_name)
+        return 'stopped'
+
+    def _replace_entry(self, entry_id: int, entry: Dict, project_name: Optional[str]):
+        """保存済みの行を取り除いてから記録し直す（1回の書き込みで行う、内部メソッド）"""
+        self.learner.remove_time_entry(entry_id)
+        self.learner.record_time_entry(entry, project_name)
+
+
+class TogglWebhookServer:
+    """WebhookProcessor を HTTP で公開する軽量サーバー（バックグラウンドスレッドで実行）"""
+
+    def __init__(self, processor: WebhookProcessor, host: str = '0.0.0.0',
+                 port: int = 8765, path: str = '/toggl/webhook'):
+        """
+        Args:
+            processor: リクエストを処理する WebhookProcessor
+            host: 待ち受けるアドレス
+            port: 待ち受けるポート
+            path: webhook を受け付けるパス
+        """
+        self.processor = processor
+        self.path = path
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # 1スレッドのサーバーなので、ボディが届かない接続で待ち続けない
+            timeout = REQUEST_TIMEOUT_SECONDS
+
+            def do_POST(self):
+                if self.path != server.path:
+                    self._respond(404, {'error': 'not found'})
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    self._respond(400, {'error': 'invalid content length'})
+                    return
+                if length > MAX_BODY_BYTES:
+                    self._respond(413, {'error': 'request body too large'})
+                    return
+                body = self.rfile.read(length)
+                if len(body) < length:
+                    self._respond(400, {'error': 'incomplete body'})
+                    return
+                status, response = server.processor.handle(
+                    body, self.headers.get(SIGNATURE_HEADER)
+                )
+                self._respond(status, response)
+
+            def _respond(self, status: int, response: Dict):
+                data = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # アクセスログは出さない
+
+        self.httpd = HTTPServer((host, port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """待ち受けているアドレスとポート"""
+        return self.httpd.server_address[:2]
+
+    def start(self):
+        """バックグラウンドスレッドで待ち受け開始"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        name='toggl-webhook', daemon=True)
+        self._thread.start()
+        host, port = self.address
+        print(f"Toggl webhook listening on http://{host}:{port}{self.path}")
+
+    def stop(self):
+        """待ち受けを停止"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join(timeout=2.0)